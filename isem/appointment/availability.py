@@ -0,0 +1,171 @@
+"""
+Materialized free time (DentistFreeTime).
+
+One row per dentist per date over a rolling horizon, holding the free
+intervals at each branch (from DentistAvailability minus the day's bookings
+at every branch) and the bookings themselves. The slot finder and
+get_booked_times read a dentist-day with one lookup on the (dentist, date)
+key instead of scanning the appointments and the availability windows.
+
+- Appointment and DentistAvailability writes (signals.py) delete the rows of
+  the dentist-days they touch inside their own transaction, one DELETE, so
+  the next booking under the dentist/day lock reads those days live and
+  sees them. Once the transaction commits, the rows are rebuilt: once per
+  transaction however many writes touched them, under the dentist/day
+  locks, and only those days (an availability change: the dates on the
+  weekdays it affects).
+- The same writes bump the schedule cache versions (schedule_cache.py), once
+  committed.
+- `manage.py rebuild_availability` (nightly) rebuilds the whole horizon and
+  drops rows for past dates.
+- Days outside the horizon, or not built yet, fall back to the live queries
+  (DentistDayCache).
+
+settings.AVAILABILITY_HORIZON_DAYS sets the horizon.
+"""
+from datetime import date as date_cls, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import schedule_cache
+from .utils import DentistDayCache, lock_schedule_days, on_commit_batch
+
+
+def horizon(today=None):
+    """(first, last) dates kept materialized."""
+    first = today or date_cls.today()
+    days = getattr(settings, "AVAILABILITY_HORIZON_DAYS", 60)
+    return first, first + timedelta(days=days - 1)
+
+
+def build(dentist_ids, first, last, dates=None):
+    """
+    (Re)write DentistFreeTime for every dentist in `dentist_ids` and every day
+    in [first, last] (only those in `dates` if given): one bookings query +
+    one availability query, then one upsert. Returns the number of rows
+    written.
+    """
+    from .models import DentistFreeTime
+
+    dentist_ids = list(dentist_ids)
+    if not dentist_ids or last < first:
+        return 0
+
+    cache = DentistDayCache(materialized=False)
+    cache.preload_range(dentist_ids, first, last)
+
+    built_at = timezone.now()
+    rows = []
+    for dentist_id in dentist_ids:
+        day = first
+        while day <= last:
+            if dates is None or day in dates:
+                rows.append(DentistFreeTime(
+                    dentist_id=dentist_id,
+                    date=day,
+                    built_at=built_at,
+                    **cache.get(dentist_id, day).payload(),
+                ))
+            day += timedelta(days=1)
+
+    DentistFreeTime.objects.bulk_create(
+        rows,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=["dentist", "date"],
+        update_fields=["free", "bookings", "has_availability", "built_at"],
+    )
+    return len(rows)
+
+
+def _in_horizon(keys):
+    first, last = horizon()
+    return {
+        (dentist_id, day) for dentist_id, day in keys
+        if dentist_id is not None and isinstance(day, date_cls) and first <= day <= last
+    }
+
+
+def _weekday_dates(dentist_weekdays):
+    """(dentist_id, date) for every horizon date on the given (dentist_id, weekday) pairs."""
+    first, last = horizon()
+    keys = set()
+    day = first
+    while day <= last:
+        for dentist_id, weekday in dentist_weekdays:
+            if dentist_id is not None and day.weekday() == weekday:
+                keys.add((dentist_id, day))
+        day += timedelta(days=1)
+    return keys
+
+
+def drop_days(keys):
+    """
+    Delete the DentistFreeTime rows of these (dentist_id, date) pairs (one
+    query), inside the writer's transaction: until refresh_days() runs,
+    readers fall back to the live queries for them.
+    """
+    from django.db.models import Q
+
+    from .models import DentistFreeTime
+
+    keys = _in_horizon(keys)
+    if not keys:
+        return
+    condition = Q()
+    for dentist_id, day in keys:
+        condition |= Q(dentist_id=dentist_id, date=day)
+    DentistFreeTime.objects.filter(condition).delete()
+
+
+def refresh_days(keys):
+    """
+    Rebuild the given (dentist_id, date) pairs that fall inside the horizon:
+    per dentist, one build() over just those days.
+    """
+    from .models import Dentist
+
+    by_dentist = {}
+    for dentist_id, day in _in_horizon(keys):
+        by_dentist.setdefault(dentist_id, set()).add(day)
+    # a batch may still hold days of a rolled-back transaction, whose
+    # dentist may not exist: no lock rows or free time for those
+    existing = set(Dentist.objects.filter(pk__in=by_dentist).values_list("pk", flat=True))
+    by_dentist = {dentist_id: dates for dentist_id, dates in by_dentist.items() if dentist_id in existing}
+
+    for dentist_id, dates in sorted(by_dentist.items()):
+        with transaction.atomic():
+            # hold the day locks (created if missing), so a booking can't
+            # commit between reading the day and the upsert
+            lock_schedule_days([dentist_id], dates)
+            build([dentist_id], min(dates), max(dates), dates=dates)
+
+
+def days_changed(keys):
+    """
+    Appointments on these (dentist_id, date) days were written: drop their
+    rows now and rebuild them once the transaction commits, and drop them
+    from the schedule cache once committed (bumping earlier would let a
+    reader in between cache the pre-commit state under the new version).
+    """
+    keys = set(keys)
+    drop_days(keys)
+    on_commit_batch("free_time", keys, refresh_days)
+    on_commit_batch("schedule_cache_days", keys, schedule_cache.invalidate_days)
+
+
+def weekdays_changed(dentist_weekdays):
+    """
+    The dentist's DentistAvailability for these (dentist_id, weekday) pairs
+    changed: same as days_changed() for every horizon date on them.
+    """
+    keys = _weekday_dates(dentist_weekdays)
+    drop_days(keys)
+    on_commit_batch("free_time", keys, refresh_days)
+    on_commit_batch(
+        "schedule_cache_dentists",
+        (dentist_id for dentist_id, _ in dentist_weekdays),
+        schedule_cache.invalidate_dentists,
+    )
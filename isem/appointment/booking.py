@@ -0,0 +1,200 @@
+"""
+Booking one appointment: shared by appointment_page, create_followup,
+reschedule_appointment and the waitlist.
+
+Everything runs in one transaction and a fixed number of queries (tests.py
+holds the budget):
+
+- lock the dentist/day (one query once the lock row exists);
+- read the day's free time (one DentistFreeTime lookup inside the horizon);
+- insert the appointment with its service totals already set, so save()
+  doesn't have to write end_time again;
+- insert the service links with one bulk insert (the m2m receiver would only
+  recompute totals that are already right), then the log row;
+- the post_save receiver rebuilds the day's DentistFreeTime.
+"""
+from django.db import IntegrityError, transaction
+
+from .models import Appointment, AppointmentLog
+from .utils import DentistDayCache, find_next_available_slot, lock_dentist_day
+
+
+def service_totals(services):
+    """The denormalized service fields of an appointment with `services`."""
+    return {
+        "total_duration_minutes": sum(s.duration for s in services),
+        "total_price": sum(s.price for s in services),
+        "service_names": ", ".join(s.service_name for s in services),
+    }
+
+
+def set_services(appointment, services, clear=True):
+    """Replace the appointment's service links without the m2m receiver."""
+    Through = Appointment.services.through
+    if clear:
+        Through.objects.filter(appointment_id=appointment.pk).delete()
+    Through.objects.bulk_create(
+        [Through(appointment_id=appointment.pk, service_id=s.pk) for s in services]
+    )
+
+
+def create_appointment(services, actor=None, note="", **fields):
+    """
+    Insert an appointment at an already chosen slot (caller holds the
+    dentist/day lock), with its services and "created" log.
+    """
+    appointment = Appointment.objects.create(**fields, **service_totals(services))
+    set_services(appointment, services, clear=False)
+    AppointmentLog.objects.create(
+        appointment=appointment,
+        action="created",
+        new_status=appointment.status,
+        actor=actor,
+        note=note,
+    )
+    return appointment
+
+
+def book_appointment(dentist, branch, services, email, date, preferred_time,
+                     user=None, actor=None, note="", location=None, patient=None,
+                     create_patient=False):
+    """
+    Find the slot nearest preferred_time on `date` and book it.
+    Returns the Appointment, or None when nothing fits (or the overlap guard
+    caught a clash the slot search didn't see).
+
+    With create_patient, the patient for `email` (a new guest if there is
+    none) is resolved once the slot is found, in the same transaction, so a
+    booking that fails leaves no guest record behind.
+    """
+    services = list(services)
+    total_minutes = sum(s.duration for s in services)
+
+    try:
+        with transaction.atomic():
+            lock_dentist_day(dentist, date)
+            start_time, end_time = find_next_available_slot(
+                dentist, date, total_minutes, preferred_time, branch=branch
+            )
+            if not (start_time and end_time):
+                return None
+            if create_patient and patient is None and email:
+                patient = find_or_create_patient(email)
+
+            return create_appointment(
+                services,
+                actor=actor,
+                note=note,
+                user=user,
+                dentist=dentist,
+                branch=branch,
+                dentist_name=dentist.name,
+                location=branch.name if branch else (location or ""),
+                date=date,
+                time=start_time,
+                end_time=end_time,
+                preferred_date=date,
+                preferred_time=preferred_time,
+                email=email,
+                patient=patient,
+            )
+    except IntegrityError:
+        return None
+
+
+def reschedule_appointment(appointment, dentist, branch, services, email, date, preferred_time, actor=None):
+    """
+    Move `appointment` to the slot nearest preferred_time on `date` (and to
+    `dentist`, `branch`, `services`). Returns True, or False when nothing fits.
+    """
+    services = list(services)
+    total_minutes = sum(s.duration for s in services)
+
+    try:
+        with transaction.atomic():
+            lock_dentist_day(dentist, date)
+            cache = None
+            if (appointment.dentist_id, appointment.date) == (dentist.pk, date):
+                # moving within its own day: its current time is free to reuse
+                cache = DentistDayCache(exclude=[appointment.pk])
+            start_time, end_time = find_next_available_slot(
+                dentist, date, total_minutes, preferred_time, branch=branch, cache=cache
+            )
+            if not (start_time and end_time):
+                return False
+
+            appointment.dentist = dentist
+            appointment.branch = branch
+            appointment.dentist_name = dentist.name
+            appointment.location = branch.name
+            appointment.date = date
+            appointment.time = start_time
+            appointment.end_time = end_time
+            appointment.preferred_date = date
+            appointment.preferred_time = preferred_time
+            # moved into a free slot: back under the overlap guard
+            appointment.schedule_conflict = False
+            if email != appointment.email:
+                appointment.patient = find_patient(email)
+            appointment.email = email
+            for field, value in service_totals(services).items():
+                setattr(appointment, field, value)
+            appointment.save()
+            set_services(appointment, services)
+
+            AppointmentLog.objects.create(
+                appointment=appointment,
+                action="rescheduled",
+                old_status=None,
+                new_status=appointment.status,
+                actor=actor,
+                note=f"Rescheduled to {date} {start_time} at {branch.name}",
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def find_patient(email):
+    from patient.models import Patient
+
+    return Patient.for_email(email)
+
+
+def find_or_create_patient(email):
+    """The patient record for `email`, creating a guest one if there is none."""
+    from patient.id_allocator import next_guest_id
+    from patient.models import Patient
+
+    patient = Patient.for_email(email)
+    if patient is None:
+        try:
+            with transaction.atomic():
+                patient = Patient.objects.create(
+                    name=email.split("@")[0] or "Guest Patient",
+                    email=email,
+                    address="TBD",
+                    telephone="00000000000",
+                    age=0,
+                    occupation="",
+                    is_guest=True,
+                    guest_id=next_guest_id(),
+                )
+        except IntegrityError:
+            # created meanwhile by another request (patient_email_unique)
+            patient = Patient.for_email(email)
+    return patient
+
+
+def patient_for(appointment, create=False):
+    """
+    appointment.patient; for rows booked before the FK existed (and not yet
+    backfilled), resolve it from the email once and store it.
+    """
+    if appointment.patient_id or not appointment.email:
+        return appointment.patient
+    patient = find_or_create_patient(appointment.email) if create else find_patient(appointment.email)
+    if patient:
+        Appointment.objects.filter(pk=appointment.pk).update(patient=patient)
+        appointment.patient = patient
+    return patient
@@ -0,0 +1,62 @@
+"""
+Per-branch change versions of the appointment calendar (CalendarVersion).
+
+The events feed's ETag / Last-Modified come from the version of the branch
+it shows (the sum over every branch for "all"), so a booking at one branch
+doesn't invalidate the calendars open at the others, and a poll reads a
+handful of counter rows instead of aggregating AppointmentLog.
+
+- changed(branch_ids): appointments at these branches (None: no branch)
+  were written. The counters are bumped once the transaction commits
+  (signals.py), one UPDATE per transaction: never visible before the data,
+  and no counter row stays locked while a booking holds its dentist/day.
+- current(branch_name): {"version", "changed_at"} for the feed.
+- latest_cursor(): the newest AppointmentLog id, the feed's `since` cursor.
+"""
+from django.db.models import CharField, F, Max, Sum
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .utils import on_commit_batch
+
+# CalendarVersion.scope of appointments without a branch FK
+NO_BRANCH = "-"
+
+
+def scope(branch_id):
+    return NO_BRANCH if branch_id is None else str(branch_id)
+
+
+def bump(branch_ids):
+    from .models import CalendarVersion
+
+    scopes = {scope(branch_id) for branch_id in branch_ids}
+    now = timezone.now()
+    versions = CalendarVersion.objects.filter(scope__in=scopes)
+    if versions.update(version=F("version") + 1, changed_at=now) < len(scopes):
+        # first change at a branch: create its row, then count the change
+        CalendarVersion.objects.bulk_create(
+            [CalendarVersion(scope=s, changed_at=now) for s in scopes],
+            ignore_conflicts=True,
+        )
+        versions.update(version=F("version") + 1, changed_at=now)
+
+
+def changed(branch_ids):
+    on_commit_batch("calendar_version", branch_ids, bump)
+
+
+def current(branch_name=None):
+    from .models import Branch, CalendarVersion
+
+    versions = CalendarVersion.objects.all()
+    if branch_name:
+        keys = Branch.objects.filter(name=branch_name).values(key=Cast("pk", CharField()))
+        versions = versions.filter(scope__in=keys)
+    return versions.aggregate(version=Sum("version"), changed_at=Max("changed_at"))
+
+
+def latest_cursor():
+    from .models import AppointmentLog
+
+    return AppointmentLog.objects.aggregate(cursor=Max("id"))["cursor"] or 0
@@ -0,0 +1,174 @@
+"""
+Live schedule updates for the calendar screens (Server-Sent Events).
+
+Every appointment write the calendar shows (create, status change,
+reschedule, cancel) writes an AppointmentLog row, so the log id is the
+change cursor. A broker only tells open streams "the cursor moved to N";
+each stream then reads the delta it may see, the same as the events feed's
+`?since=` (views.calendar_delta). Nothing polls: a stream sleeps until the
+broker wakes it, sending a keep-alive comment every HEARTBEAT_SECONDS.
+
+- InProcessBroker: publish() wakes the streams of this process. Enough for
+  one ASGI process (WEB_CONCURRENCY=1) and for tests.
+- PostgresBroker: publish() is a NOTIFY; one LISTEN connection per process
+  wakes that process's streams, so writes from every worker and from cron'd
+  commands reach every stream.
+
+settings.LIVE_SCHEDULE_BROKER picks one (dotted path); empty picks
+PostgresBroker on PostgreSQL, InProcessBroker elsewhere.
+
+The stream needs the ASGI server (start_server.sh, SERVER_INTERFACE=asgi).
+Under WSGI it would pin a worker per open calendar, so the view answers 204
+instead and the page keeps syncing after its own writes.
+"""
+import asyncio
+import logging
+import select
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .calendar_version import latest_cursor
+from .utils import on_commit_batch
+
+logger = logging.getLogger(__name__)
+
+# seconds between keep-alive comments on an idle stream
+HEARTBEAT_SECONDS = 15
+
+
+class InProcessBroker:
+    def __init__(self, heartbeat=HEARTBEAT_SECONDS):
+        self.heartbeat = heartbeat
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, cursor):
+        """Called from request threads, once the write committed."""
+        self.wake(cursor)
+
+    def wake(self, cursor):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, cursor)
+
+    async def listen(self, cursor):
+        """
+        Yield each cursor newer than `cursor`, or None when idle for
+        `heartbeat` seconds.
+        """
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.add(subscriber)
+        queue = subscriber[1]
+        try:
+            # anything logged before we subscribed (e.g. while reconnecting)
+            latest = await sync_to_async(latest_cursor)()
+            if latest > cursor:
+                cursor = latest
+                yield cursor
+
+            while True:
+                try:
+                    latest = await asyncio.wait_for(queue.get(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                # collapse a burst of writes into one delta
+                while not queue.empty():
+                    latest = max(latest, queue.get_nowait())
+                if latest > cursor:
+                    cursor = latest
+                    yield cursor
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+
+class PostgresBroker(InProcessBroker):
+    channel = "isem_schedule"
+
+    def __init__(self, heartbeat=HEARTBEAT_SECONDS):
+        super().__init__(heartbeat)
+        self._listener = None
+
+    def publish(self, cursor):
+        # delivered to every listening process, this one included
+        with connection.cursor() as cursor_:
+            cursor_.execute("SELECT pg_notify(%s, %s)", [self.channel, str(cursor)])
+
+    async def listen(self, cursor):
+        self.start_listener()
+        async for latest in super().listen(cursor):
+            yield latest
+
+    def start_listener(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self.run_listener, name="live-schedule", daemon=True)
+                self._listener.start()
+
+    def run_listener(self):
+        while True:
+            try:
+                self.receive()
+            except Exception:
+                logger.exception("Live schedule listener lost its connection, reconnecting")
+                time.sleep(5)
+
+    def receive(self):
+        # its own connection: LISTEN needs autocommit and a connection nobody else uses
+        conn = connection.get_new_connection(connection.get_connection_params())
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor_:
+                cursor_.execute(f"LISTEN {self.channel}")
+            while True:
+                if select.select([conn], [], [], self.heartbeat) == ([], [], []):
+                    continue
+                conn.poll()
+                latest = None
+                while conn.notifies:
+                    latest = max(latest or 0, int(conn.notifies.pop(0).payload))
+                if latest is not None:
+                    self.wake(latest)
+        finally:
+            conn.close()
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        path = getattr(settings, "LIVE_SCHEDULE_BROKER", "")
+        if not path:
+            path = "appointment.live.PostgresBroker" if connection.vendor == "postgresql" else "appointment.live.InProcessBroker"
+        _broker = import_string(path)()
+    return _broker
+
+
+def logged(log_ids):
+    """AppointmentLog rows were written: wake the streams once the transaction commits."""
+    on_commit_batch("live_schedule", log_ids, publish_logged)
+
+
+def publish_logged(log_ids):
+    # the newest committed id, not max(log_ids): a batch may still hold ids
+    # of a rolled-back transaction, and bulk_create on MySQL leaves them unset
+    get_broker().publish(latest_cursor())
+
+
+def sse_frame(data, event_id=None, event="schedule"):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
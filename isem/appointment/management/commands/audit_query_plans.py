@@ -0,0 +1,208 @@
+"""
+Run EXPLAIN on the scheduling / lookup hot-path queries and flag full
+table scans.
+
+    python manage.py audit_query_plans            # against the current data
+    python manage.py audit_query_plans --seed 20000
+
+--seed inserts a synthetic dataset first, inside a transaction that is
+rolled back at the end, so nothing is left behind.
+"""
+import random
+from datetime import date, datetime, time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from appointment.models import Appointment, Branch, Dentist, DentistAvailability, DentistFreeTime
+from appointment.utils import ACTIVE_STATUSES
+from billing.models import BillingRecord
+from inventory.models import InventoryItem
+from patient.models import Patient
+
+
+def canonical_queries():
+    """(label, queryset) for every hot path the indexes are meant to serve."""
+    today = date.today()
+    start_of_day = timezone.make_aware(datetime.combine(today, time.min))
+    dentist = Dentist.objects.order_by("pk").first()
+    dentist_id = dentist.pk if dentist else 0
+    email = "patient0@example.com"
+
+    return [
+        ("dentist-day occupancy (all branches)", Appointment.objects.filter(
+            dentist_id=dentist_id,
+            date=today,
+            status__in=ACTIVE_STATUSES,
+        ).values_list("time", "end_time", "branch_id")),
+        ("dentist availability windows", DentistAvailability.objects.filter(
+            dentist_id=dentist_id,
+        )),
+        ("materialized dentist-day", DentistFreeTime.objects.filter(
+            dentist_id=dentist_id,
+            date=today,
+        )),
+        ("calendar window", Appointment.objects.filter(
+            date__gte=today,
+            date__lt=today + timedelta(days=42),
+        )),
+        ("appointments of a patient", Appointment.objects.filter(
+            patient_id=1,
+            status__in=["done", "completed"],
+        ).order_by("-date")),
+        ("patient by email", Patient.objects.filter(email_normalized=email)),
+        ("patient by phone prefix", Patient.objects.filter(
+            phone_digits__gte="0917",
+            phone_digits__lt="0917:",
+        )),
+        ("new patients today", Patient.objects.filter(
+            created_at__gte=start_of_day,
+            created_at__lt=start_of_day + timedelta(days=1),
+        )),
+        ("billing of a patient", BillingRecord.objects.filter(
+            patient_id=1,
+        ).order_by("-date_issued")),
+        ("patient list page (keyset)", Patient.objects.filter(
+            Q(name__gt="Patient 5") | Q(name="Patient 5", id__gt=5),
+            name__gte="Patient 5",
+        ).order_by("name", "id")[:6]),
+        ("billing list page (keyset)", BillingRecord.objects.filter(
+            Q(date_issued__lt=start_of_day) | Q(date_issued=start_of_day, id__lt=5),
+            date_issued__lte=start_of_day,
+        ).order_by("-date_issued", "-id")[:6]),
+        ("inventory expiring soon", InventoryItem.objects.filter(
+            status="available",
+            expiry_date__gte=today,
+            expiry_date__lte=today + timedelta(days=7),
+        )),
+    ]
+
+
+def full_scans(plan, vendor):
+    """Plan lines that read a whole table."""
+    flagged = []
+    for line in plan.splitlines():
+        text = line.strip()
+        if vendor == "postgresql" and "Seq Scan" in text:
+            flagged.append(text)
+        elif vendor == "sqlite" and " SCAN " in f" {text} " and "USING" not in text:
+            flagged.append(text)
+        elif vendor == "mysql" and '"access_type": "ALL"' in text:
+            flagged.append(text)
+    return flagged
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot-path queries and flag sequential / full table scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Insert this many synthetic appointments (rolled back afterwards).",
+        )
+        parser.add_argument("--verbose-plans", action="store_true", help="Print every plan in full.")
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        flagged_total = 0
+
+        with transaction.atomic():
+            if options["seed"]:
+                self.seed(options["seed"])
+                if vendor == "postgresql":
+                    # fresh statistics, otherwise the planner guesses from an empty table
+                    with connection.cursor() as cursor:
+                        cursor.execute("ANALYZE")
+
+            for label, queryset in canonical_queries():
+                plan = queryset.explain(format="json") if vendor == "mysql" else queryset.explain()
+                flagged = full_scans(plan, vendor)
+                flagged_total += len(flagged)
+
+                if flagged:
+                    self.stdout.write(self.style.WARNING(f"[SCAN] {label}"))
+                    for line in flagged:
+                        self.stdout.write(f"    {line}")
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"[ OK ] {label}"))
+                if options["verbose_plans"]:
+                    self.stdout.write(plan)
+
+            # never keep the seeded rows
+            transaction.set_rollback(True)
+
+        if flagged_total:
+            self.stdout.write(self.style.WARNING(f"{flagged_total} full scan(s) found."))
+        else:
+            self.stdout.write(self.style.SUCCESS("No full scans."))
+
+    def seed(self, count):
+        rng = random.Random(7)
+        today = date.today()
+
+        branches = Branch.objects.bulk_create(
+            [Branch(name=f"Seed Branch {i}", address="-") for i in range(3)]
+        )
+        dentists = Dentist.objects.bulk_create(
+            [Dentist(name=f"Seed Dentist {i}") for i in range(10)]
+        )
+        patients = Patient.objects.bulk_create([
+            Patient(
+                name=f"Patient {i}",
+                email=f"patient{i}@example.com",
+                email_normalized=f"patient{i}@example.com",
+                address="-",
+                telephone=f"0917{i:07d}",
+                phone_digits=f"0917{i:07d}",
+                age=30,
+            )
+            for i in range(max(count // 5, 1))
+        ], batch_size=1000)
+
+        appointments = []
+        for i in range(count):
+            dentist = rng.choice(dentists)
+            branch = rng.choice(branches)
+            patient = rng.choice(patients)
+            start = 8 * 60 + 15 * rng.randrange(36)
+            appointments.append(Appointment(
+                dentist=dentist,
+                branch=branch,
+                dentist_name=dentist.name,
+                location=branch.name,
+                date=today + timedelta(days=rng.randrange(-365, 60)),
+                time=time(start // 60, start % 60),
+                end_time=time((start + 15) // 60, (start + 15) % 60),
+                email=patient.email,
+                patient=patient,
+                # finished rows only, so the overlap guard never fires on random times
+                status=rng.choice(["done", "cancelled"]),
+            ))
+        Appointment.objects.bulk_create(appointments, batch_size=1000)
+
+        BillingRecord.objects.bulk_create([
+            BillingRecord(
+                patient=rng.choice(patients),
+                patient_name="-",
+                type="Seed",
+                amount=100,
+            )
+            for _ in range(count // 2)
+        ], batch_size=1000)
+
+        InventoryItem.objects.bulk_create([
+            InventoryItem(
+                item_name=f"Item {i}",
+                category="consumable",
+                stock=rng.randrange(0, 50),
+                expiry_date=today + timedelta(days=rng.randrange(-30, 365)),
+                status=rng.choice(["available", "low_stock", "out_of_stock", "expired"]),
+            )
+            for i in range(max(count // 10, 1))
+        ], batch_size=1000)
+
+        self.stdout.write(f"Seeded {count} appointments (will be rolled back).")
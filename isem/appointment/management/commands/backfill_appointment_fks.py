@@ -0,0 +1,147 @@
+"""
+Fill Appointment.dentist / Appointment.branch on historical rows that only
+have the legacy dentist_name / location strings.
+
+    python manage.py backfill_appointment_fks
+    python manage.py backfill_appointment_fks --chunk-size 1000 --sleep 0.2
+    python manage.py backfill_appointment_fks --start-after 48000   # resume
+
+Rows are walked in primary-key order, one short transaction per chunk, so
+the table is never locked for the whole run. Re-running is safe: only rows
+still missing an FK are picked up.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from appointment import availability, calendar_version
+from appointment.models import Appointment, Branch, Dentist
+
+
+def name_key(value):
+    return (value or "").strip().casefold()
+
+
+def lookup_table(model):
+    """normalized name -> pk (oldest row wins on duplicate names)."""
+    table = {}
+    for pk, name in model.objects.order_by("pk").values_list("pk", "name"):
+        table.setdefault(name_key(name), pk)
+    return table
+
+
+class Command(BaseCommand):
+    help = "Backfill appointment dentist/branch FKs from the legacy name strings, in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--start-after", type=int, default=0, help="Skip rows with pk <= this value.")
+        parser.add_argument("--sleep", type=float, default=0, help="Seconds to pause between chunks.")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change, write nothing.")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        dry_run = options["dry_run"]
+
+        dentists = lookup_table(Dentist)
+        branches = lookup_table(Branch)
+
+        pending = (
+            Appointment.objects
+            .filter(
+                Q(dentist__isnull=True, dentist_name__isnull=False)
+                | Q(branch__isnull=True)
+            )
+            .order_by("pk")
+            .only("pk", "dentist_id", "branch_id", "dentist_name", "location")
+        )
+        total = pending.filter(pk__gt=options["start_after"]).count()
+        self.stdout.write(f"{total} appointment(s) missing a dentist or branch FK.")
+
+        last_pk = options["start_after"]
+        scanned = updated = unmatched = 0
+        flagged = []
+
+        while True:
+            chunk = list(pending.filter(pk__gt=last_pk)[:chunk_size].iterator(chunk_size=chunk_size))
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            scanned += len(chunk)
+
+            changed = []
+            for appt in chunk:
+                touched = False
+                if appt.dentist_id is None:
+                    dentist_id = dentists.get(name_key(appt.dentist_name))
+                    if dentist_id:
+                        appt.dentist_id = dentist_id
+                        touched = True
+                if appt.branch_id is None:
+                    branch_id = branches.get(name_key(appt.location))
+                    if branch_id:
+                        appt.branch_id = branch_id
+                        touched = True
+                if touched:
+                    changed.append(appt)
+                else:
+                    unmatched += 1
+
+            if changed and not dry_run:
+                written, clashed = self.write_chunk(changed)
+                updated += written
+                flagged.extend(clashed)
+                # bulk_update skips the signals that keep DentistFreeTime and
+                # the calendar versions current
+                availability.days_changed(
+                    Appointment.objects.filter(pk__in=[a.pk for a in changed]).values_list("dentist_id", "date")
+                )
+                calendar_version.changed({None} | {a.branch_id for a in changed})
+            else:
+                updated += len(changed)
+
+            self.stdout.write(
+                f"  up to pk {last_pk}: {scanned}/{total} scanned, "
+                f"{updated} updated, {unmatched} unmatched, {len(flagged)} flagged"
+            )
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        if flagged:
+            self.stdout.write(self.style.WARNING(
+                "Linked but flagged schedule_conflict (they overlap another active booking "
+                "of the same dentist; reschedule them): " + ", ".join(str(pk) for pk in flagged)
+            ))
+        verb = "Would update" if dry_run else "Updated"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {updated} appointment(s); {unmatched} had no matching dentist/branch. "
+            f"Last pk: {last_pk} (pass --start-after to resume from here)."
+        ))
+
+    def write_chunk(self, changed):
+        """
+        bulk_update one chunk. If the overlap guard rejects it (a legacy
+        active row that, once linked to its dentist, overlaps another of
+        theirs), retry row by row and link the offenders flagged
+        schedule_conflict, like migration 0014 did for rows that already had
+        a dentist. Returns (rows written, flagged pks).
+        """
+        try:
+            with transaction.atomic():
+                Appointment.objects.bulk_update(changed, ["dentist", "branch"])
+            return len(changed), []
+        except IntegrityError:
+            pass
+
+        flagged = []
+        for appt in changed:
+            fields = {"dentist_id": appt.dentist_id, "branch_id": appt.branch_id}
+            try:
+                with transaction.atomic():
+                    Appointment.objects.filter(pk=appt.pk).update(**fields)
+            except IntegrityError:
+                Appointment.objects.filter(pk=appt.pk).update(schedule_conflict=True, **fields)
+                flagged.append(appt.pk)
+        return len(changed), flagged
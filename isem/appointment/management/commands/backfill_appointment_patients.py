@@ -0,0 +1,91 @@
+"""
+Link historical appointments to their Patient (Appointment.patient) by
+matching the appointment email against Patient.email_normalized.
+
+    python manage.py backfill_appointment_patients
+    python manage.py backfill_appointment_patients --chunk-size 2000 --sleep 0.2
+    python manage.py backfill_appointment_patients --start-after 48000   # resume
+
+Same shape as backfill_appointment_fks: primary-key order, one short
+transaction per chunk, and re-running only picks up rows still unlinked.
+Each chunk costs one appointments read, one patients read (every email in
+the chunk at once) and one bulk update.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from appointment.models import Appointment
+from patient.models import Patient, normalize_email
+
+
+class Command(BaseCommand):
+    help = "Backfill Appointment.patient from the appointment email, in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--start-after", type=int, default=0, help="Skip rows with pk <= this value.")
+        parser.add_argument("--sleep", type=float, default=0, help="Seconds to pause between chunks.")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change, write nothing.")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        dry_run = options["dry_run"]
+
+        pending = (
+            Appointment.objects
+            .filter(patient__isnull=True)
+            .exclude(email="")
+            .order_by("pk")
+            .only("pk", "email", "patient_id")
+        )
+        total = pending.filter(pk__gt=options["start_after"]).count()
+        self.stdout.write(f"{total} appointment(s) not linked to a patient.")
+
+        last_pk = options["start_after"]
+        scanned = linked = unmatched = 0
+
+        while True:
+            chunk = list(pending.filter(pk__gt=last_pk)[:chunk_size].iterator(chunk_size=chunk_size))
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            scanned += len(chunk)
+
+            # oldest patient wins when several share an email
+            patients = {}
+            emails = {normalize_email(appt.email) for appt in chunk}
+            rows = (
+                Patient.objects.filter(email_normalized__in=emails)
+                .order_by("pk")
+                .values_list("email_normalized", "pk")
+            )
+            for email, pk in rows:
+                patients.setdefault(email, pk)
+
+            changed = []
+            for appt in chunk:
+                patient_id = patients.get(normalize_email(appt.email))
+                if patient_id:
+                    appt.patient_id = patient_id
+                    changed.append(appt)
+                else:
+                    unmatched += 1
+
+            if changed and not dry_run:
+                with transaction.atomic():
+                    Appointment.objects.bulk_update(changed, ["patient"])
+            linked += len(changed)
+
+            self.stdout.write(
+                f"  up to pk {last_pk}: {scanned}/{total} scanned, {linked} linked, {unmatched} unmatched"
+            )
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        verb = "Would link" if dry_run else "Linked"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {linked} appointment(s); {unmatched} had no patient with that email. "
+            f"Last pk: {last_pk} (pass --start-after to resume from here)."
+        ))
@@ -0,0 +1,41 @@
+"""
+Match queued cancellations (FreedSlot) against the waitlist, lapse offers
+older than WAITLIST_OFFER_HOURS (their slots go to the next entry) and
+expire entries whose window has passed. Run from cron, e.g. every minute:
+
+    python manage.py process_waitlist
+
+Needed with either WAITLIST_DISPATCHER: with the default ThreadDispatcher
+matching happens on commit, and this lapses offers and picks up slots a
+worker never got to.
+"""
+from django.core.management.base import BaseCommand
+
+from appointment import waitlist
+from appointment.models import FreedSlot
+
+
+class Command(BaseCommand):
+    help = "Match freed appointment slots against the waitlist."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=500, help="Slots to process in this run.")
+
+    def handle(self, *args, **options):
+        lapsed = waitlist.expire_offers()
+        pending = list(
+            FreedSlot.objects.filter(processed_at__isnull=True)
+            .order_by("created_at")
+            .values_list("pk", flat=True)[:options["limit"]]
+        )
+
+        matched = 0
+        for slot_id in pending:
+            if waitlist.process_freed_slot(slot_id):
+                matched += 1
+
+        expired = waitlist.expire_entries()
+        self.stdout.write(self.style.SUCCESS(
+            f"Lapsed {lapsed} offer(s); processed {len(pending)} freed slot(s), {matched} matched; "
+            f"expired {expired} waitlist entr(ies)."
+        ))
@@ -0,0 +1,56 @@
+"""
+Rebuild the materialized free-time table (DentistFreeTime) for the rolling
+horizon and drop rows for past dates. Meant to run nightly:
+
+    python manage.py rebuild_availability
+    python manage.py rebuild_availability --dentist 4      # one dentist
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from appointment import availability
+from appointment.models import Dentist, DentistFreeTime, ScheduleLock
+from appointment.utils import lock_schedule_days
+
+
+class Command(BaseCommand):
+    help = "Rebuild DentistFreeTime from DentistAvailability and the appointments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dentist", type=int, action="append", help="Only this dentist id (repeatable).")
+        parser.add_argument("--days", type=int, help="Horizon in days (default: settings.AVAILABILITY_HORIZON_DAYS).")
+        parser.add_argument("--batch", type=int, default=10, help="Dentists per transaction.")
+
+    def handle(self, *args, **options):
+        first, last = availability.horizon()
+        if options["days"]:
+            last = first + timedelta(days=options["days"] - 1)
+
+        dentists = Dentist.objects.filter(is_active=True)
+        if options["dentist"]:
+            dentists = Dentist.objects.filter(pk__in=options["dentist"])
+        dentist_ids = list(dentists.order_by("pk").values_list("pk", flat=True))
+
+        deleted, _ = DentistFreeTime.objects.filter(date__lt=date.today()).delete()
+        # nobody books a past day: its lock rows are done with
+        ScheduleLock.objects.filter(date__lt=date.today()).delete()
+        # inactive dentists are never offered; don't keep their rows around
+        if not options["dentist"]:
+            DentistFreeTime.objects.exclude(dentist_id__in=dentist_ids).delete()
+
+        dates = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        written = 0
+        for i in range(0, len(dentist_ids), options["batch"]):
+            batch = dentist_ids[i:i + options["batch"]]
+            with transaction.atomic():
+                # hold the dentist/day locks (created if missing), so a booking
+                # can't commit between reading the appointments and the upsert
+                lock_schedule_days(batch, dates)
+                written += availability.build(batch, first, last)
+            self.stdout.write(f"  {min(i + len(batch), len(dentist_ids))}/{len(dentist_ids)} dentists")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {written} dentist-day(s) from {first} to {last}; removed {deleted} past row(s)."
+        ))
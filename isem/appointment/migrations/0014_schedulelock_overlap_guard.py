@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from appointment import overlap_guard
+
+
+def flag_existing_overlaps(apps, schema_editor):
+    overlap_guard.flag_existing_overlaps(apps.get_model("appointment", "Appointment"))
+
+
+def add_overlap_guard(apps, schema_editor):
+    overlap_guard.install(schema_editor)
+
+
+def remove_overlap_guard(apps, schema_editor):
+    overlap_guard.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0013_branch_appointment_dentist_dentist_contact_number_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('dentist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule_locks', to='appointment.dentist')),
+            ],
+            options={
+                'unique_together': {('dentist', 'date')},
+            },
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='schedule_conflict',
+            field=models.BooleanField(default=False),
+        ),
+        # Legacy clashes are flagged (not cancelled) so the guard can be added
+        migrations.RunPython(flag_existing_overlaps, migrations.RunPython.noop),
+        # No two active appointments of the same dentist may overlap in time
+        migrations.RunPython(add_overlap_guard, remove_overlap_guard),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:47
+
+from django.db import migrations, models
+
+from appointment import overlap_guard
+
+
+def reinstall_overlap_guard(apps, schema_editor):
+    # SQLite rebuilt appointment_appointment for the new columns,
+    # which dropped its triggers
+    if schema_editor.connection.vendor == "sqlite":
+        overlap_guard.install(schema_editor)
+
+
+def backfill_service_totals(apps, schema_editor):
+    Appointment = apps.get_model("appointment", "Appointment")
+    Through = Appointment.services.through
+
+    totals = {}
+    rows = Through.objects.order_by("appointment_id", "id").values_list(
+        "appointment_id", "service__service_name", "service__duration", "service__price"
+    )
+    for pk, name, duration, price in rows.iterator(chunk_size=2000):
+        entry = totals.setdefault(pk, [0, 0, []])
+        entry[0] += duration or 0
+        entry[1] += price or 0
+        entry[2].append(name)
+
+    batch = []
+    for appt in Appointment.objects.only("id").iterator(chunk_size=1000):
+        if appt.id not in totals:
+            continue
+        duration, price, names = totals[appt.id]
+        appt.total_duration_minutes = duration
+        appt.total_price = price
+        appt.service_names = ", ".join(names)
+        batch.append(appt)
+        if len(batch) >= 1000:
+            Appointment.objects.bulk_update(batch, ["total_duration_minutes", "total_price", "service_names"])
+            batch = []
+    if batch:
+        Appointment.objects.bulk_update(batch, ["total_duration_minutes", "total_price", "service_names"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0014_schedulelock_overlap_guard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='service_names',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='total_duration_minutes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(reinstall_overlap_guard, migrations.RunPython.noop),
+        migrations.RunPython(backfill_service_totals, migrations.RunPython.noop),
+    ]
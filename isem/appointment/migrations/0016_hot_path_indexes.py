@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0015_appointment_service_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date', 'time'], name='appt_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status__in', ['not_arrived', 'arrived', 'ongoing'])), fields=['dentist', 'date', 'time'], name='appt_active_dentist_day_idx'),
+        ),
+    ]
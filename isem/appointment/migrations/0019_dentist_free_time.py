@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0016_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DentistFreeTime',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('free', models.JSONField(default=dict)),
+                ('bookings', models.JSONField(default=list)),
+                ('has_availability', models.BooleanField(default=False)),
+                ('built_at', models.DateTimeField()),
+                ('dentist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='free_time', to='appointment.dentist')),
+            ],
+            options={
+                'unique_together': {('dentist', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0019_dentist_free_time'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('frequency', models.CharField(choices=[('weekly', 'Weekly'), ('biweekly', 'Every 2 weeks'), ('monthly', 'Monthly')], default='monthly', max_length=20)),
+                ('count', models.PositiveSmallIntegerField()),
+                ('start_date', models.DateField()),
+                ('preferred_time', models.TimeField()),
+                ('shift_policy', models.CharField(choices=[('next_day', 'Move to the next day with room'), ('skip', 'Skip that visit')], default='next_day', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointment_series', to='appointment.branch')),
+                ('dentist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointment_series', to='appointment.dentist')),
+                ('services', models.ManyToManyField(related_name='appointment_series', to='appointment.service')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointment_series', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointments', to='appointment.appointmentseries'),
+        ),
+    ]
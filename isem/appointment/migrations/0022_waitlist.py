@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0021_treatment_plan'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('duration_minutes', models.PositiveIntegerField()),
+                ('earliest_date', models.DateField()),
+                ('latest_date', models.DateField()),
+                ('auto_book', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('offered', 'Offered a slot'), ('booked', 'Booked'), ('expired', 'Expired'), ('withdrawn', 'Withdrawn')], default='waiting', max_length=20)),
+                ('offered_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='appointment.branch')),
+                ('dentist', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='appointment.dentist')),
+                ('matched_appointment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='appointment.appointment')),
+                ('services', models.ManyToManyField(related_name='waitlist_entries', to='appointment.service')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FreedSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('appointment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='appointment.appointment')),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='freed_slots', to='appointment.branch')),
+                ('dentist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='freed_slots', to='appointment.dentist')),
+                ('matched_entry', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='freed_slots', to='appointment.waitlistentry')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(condition=models.Q(('status', 'waiting')), fields=['branch', 'dentist', 'earliest_date', 'latest_date', 'duration_minutes'], name='waitlist_waiting_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='freedslot',
+            index=models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['created_at'], name='freed_slot_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0022_waitlist'),
+        ('patient', '0026_patient_email_normalized'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='patient',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointments', to='patient.patient'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'status', 'date'], name='appt_patient_status_idx'),
+        ),
+    ]
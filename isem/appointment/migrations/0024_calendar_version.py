@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0023_appointment_patient'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=20, unique=True)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('changed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:10
+
+from django.db import migrations
+
+from appointment import overlap_guard
+
+
+def reinstall_overlap_guard(apps, schema_editor):
+    # visits running past midnight: the PostgreSQL range no longer ends
+    # before it starts, and the triggers see them as busy until midnight
+    overlap_guard.reinstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0024_calendar_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(reinstall_overlap_guard, reinstall_overlap_guard),
+    ]
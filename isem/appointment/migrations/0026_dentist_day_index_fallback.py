@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+# appt_active_dentist_day_idx is partial, and backends without partial
+# indexes (MySQL) skip it: they get the same columns without the status
+# filter instead. Not in the model state, like the overlap guard.
+FALLBACK = models.Index(fields=["dentist", "date", "time"], name="appt_dentist_day_idx")
+
+
+def add_fallback_index(apps, schema_editor):
+    if not schema_editor.connection.features.supports_partial_indexes:
+        schema_editor.add_index(apps.get_model("appointment", "Appointment"), FALLBACK)
+
+
+def remove_fallback_index(apps, schema_editor):
+    if not schema_editor.connection.features.supports_partial_indexes:
+        schema_editor.remove_index(apps.get_model("appointment", "Appointment"), FALLBACK)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0025_overlap_guard_midnight'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_fallback_index, remove_fallback_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0026_dentist_day_index_fallback'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointmentlog',
+            name='action',
+            field=models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('status_changed', 'Status Changed'), ('rescheduled', 'Rescheduled'), ('cancelled', 'Cancelled')], max_length=50),
+        ),
+    ]
@@ -130,28 +130,132 @@ class Appointment(models.Model):
     preferred_date = models.DateField(null=True, blank=True)
     preferred_time = models.TimeField(null=True, blank=True)
     services = models.ManyToManyField(Service, related_name="appointments")
+
+    # Denormalized from `services` (kept in sync by the m2m_changed receiver
+    # in signals.py) so read paths don't have to load the M2M
+    total_duration_minutes = models.PositiveIntegerField(default=0)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    service_names = models.TextField(blank=True, default="")
+
     reason = models.TextField(blank=True)
     email = models.EmailField(null=False, blank=False)
+    # resolved from `email` once, at booking time (booking.py)
+    patient = models.ForeignKey(
+        "patient.Patient",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="appointments",
+        db_index=False,  # appt_patient_status_idx leads with it
+    )
+
+    # set when booked as part of a recurring series
+    series = models.ForeignKey(
+        "AppointmentSeries",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="appointments",
+    )
+    # set when booked as a step of a multi-visit treatment plan
+    treatment_plan = models.ForeignKey(
+        "TreatmentPlan",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="appointments",
+    )
+    plan_step = models.PositiveSmallIntegerField(null=True, blank=True)
 
     status = models.CharField(
         max_length=20,
         choices=STATUS_CHOICES,
         default="not_arrived",
     )
+    # already overlapping another active booking of the same dentist when the
+    # overlap guard was installed (or linked to its dentist later by
+    # backfill_appointment_fks): the guard leaves it alone until it is
+    # rescheduled. Slot searches still count it as occupied.
+    schedule_conflict = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # calendar window (events feed)
+            models.Index(fields=["date", "time"], name="appt_date_time_idx"),
+            # only chair-occupying rows matter for conflicts (PostgreSQL/SQLite;
+            # MySQL gets plain appt_dentist_day_idx instead, migration 0026)
+            models.Index(
+                fields=["dentist", "date", "time"],
+                name="appt_active_dentist_day_idx",
+                condition=models.Q(status__in=["not_arrived", "arrived", "ongoing"]),
+            ),
+            # patient history (medical_history, billing)
+            models.Index(fields=["patient", "status", "date"], name="appt_patient_status_idx"),
+        ]
 
     @property
     def display_id(self):
         return f"APT-{self.id:06d}"
 
+    def compute_end_time(self):
+        """time + total_duration_minutes, or None if there is nothing to add."""
+        if self.time and self.date and self.total_duration_minutes > 0:
+            start_datetime = datetime.combine(self.date, self.time)
+            end_datetime = start_datetime + timedelta(minutes=self.total_duration_minutes)
+            return end_datetime.time()
+        return None
+
     def save(self, *args, **kwargs):
+        # end_time follows the stored duration total: one write, no M2M query
+        end_time = self.compute_end_time()
+        if end_time and end_time != self.end_time:
+            self.end_time = end_time
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None and "end_time" not in update_fields:
+                kwargs["update_fields"] = [*update_fields, "end_time"]
         super().save(*args, **kwargs)
 
-        total_duration = sum(s.duration for s in self.services.all())
-        if self.time and self.date and total_duration > 0:
-            start_datetime = datetime.combine(self.date, self.time)
-            end_datetime = start_datetime + timedelta(minutes=total_duration)
-            self.end_time = end_datetime.time()
-            super().save(update_fields=["end_time"])
+    @classmethod
+    def refresh_service_totals(cls, appointment_ids):
+        """
+        Recompute the denormalized service totals (and end_time) for the
+        given appointments: two reads, then one UPDATE each.
+        Returns {id: {field: value}} with what was written.
+        """
+        appointment_ids = set(appointment_ids)
+        if not appointment_ids:
+            return {}
+
+        totals = {
+            pk: {"total_duration_minutes": 0, "total_price": 0, "names": []}
+            for pk in appointment_ids
+        }
+        rows = (
+            cls.services.through.objects.filter(appointment_id__in=appointment_ids)
+            .order_by("id")
+            .values_list("appointment_id", "service__service_name", "service__duration", "service__price")
+        )
+        for pk, name, duration, price in rows:
+            entry = totals[pk]
+            entry["total_duration_minutes"] += duration or 0
+            entry["total_price"] += price or 0
+            entry["names"].append(name)
+
+        written = {}
+        rows = cls.objects.filter(pk__in=appointment_ids).values_list("pk", "date", "time", "end_time")
+        for pk, date, start, current_end in rows:
+            entry = totals[pk]
+            fields = {
+                "total_duration_minutes": entry["total_duration_minutes"],
+                "total_price": entry["total_price"],
+                "service_names": ", ".join(entry["names"]),
+            }
+            end_time = cls(date=date, time=start, total_duration_minutes=entry["total_duration_minutes"]).compute_end_time()
+            if end_time and end_time != current_end:
+                fields["end_time"] = end_time
+            cls.objects.filter(pk=pk).update(**fields)
+            written[pk] = fields
+        return written
 
     def __str__(self):
         # prefer real dentist FK if present
@@ -159,11 +263,198 @@ class Appointment(models.Model):
         return f"{name} - {self.date} {self.time} [{self.get_status_display()}]"
 
 
+class AppointmentSeries(models.Model):
+    """
+    A repeating booking (e.g. monthly ortho adjustments): the rule it was
+    created from. The visits themselves are ordinary Appointments pointing
+    back here via `series`.
+    """
+    FREQUENCY_CHOICES = [
+        ("weekly", "Weekly"),
+        ("biweekly", "Every 2 weeks"),
+        ("monthly", "Monthly"),
+    ]
+    SHIFT_CHOICES = [
+        ("next_day", "Move to the next day with room"),
+        ("skip", "Skip that visit"),
+    ]
+
+    dentist = models.ForeignKey(Dentist, on_delete=models.CASCADE, related_name="appointment_series")
+    branch = models.ForeignKey(Branch, null=True, blank=True, on_delete=models.SET_NULL, related_name="appointment_series")
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="appointment_series")
+    email = models.EmailField()
+    services = models.ManyToManyField(Service, related_name="appointment_series")
+
+    frequency = models.CharField(max_length=20, choices=FREQUENCY_CHOICES, default="monthly")
+    count = models.PositiveSmallIntegerField()
+    start_date = models.DateField()
+    preferred_time = models.TimeField()
+    shift_policy = models.CharField(max_length=20, choices=SHIFT_CHOICES, default="next_day")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.get_frequency_display()} x{self.count} - {self.dentist.name} from {self.start_date}"
+
+
+class TreatmentPlan(models.Model):
+    """
+    A multi-visit procedure (RPD framework, implant, ...) booked as one
+    sequence. `steps` is what it was solved from:
+    [{"services": [ids], "min_gap_days": n, "max_gap_days": m}, ...], the gaps
+    counted from the previous visit (from start_date for the first one).
+    The visits are Appointments pointing back here via `treatment_plan`.
+    """
+    name = models.CharField(max_length=120, blank=True)
+    dentist = models.ForeignKey(Dentist, on_delete=models.CASCADE, related_name="treatment_plans")
+    branch = models.ForeignKey(Branch, null=True, blank=True, on_delete=models.SET_NULL, related_name="treatment_plans")
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="treatment_plans")
+    email = models.EmailField()
+
+    steps = models.JSONField(default=list)
+    start_date = models.DateField()
+    preferred_time = models.TimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name or 'Treatment plan'} ({len(self.steps)} visits) - {self.dentist.name}"
+
+
+class WaitlistEntry(models.Model):
+    """
+    A patient who wants an earlier slot: any day in [earliest_date,
+    latest_date] with `duration_minutes` free at `branch`, with `dentist`
+    (null = any dentist). Matched against freed slots by waitlist.py.
+    """
+    STATUS_CHOICES = [
+        ("waiting", "Waiting"),
+        ("offered", "Offered a slot"),
+        ("booked", "Booked"),
+        ("expired", "Expired"),
+        ("withdrawn", "Withdrawn"),
+    ]
+
+    dentist = models.ForeignKey(Dentist, null=True, blank=True, on_delete=models.CASCADE, related_name="waitlist_entries")
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name="waitlist_entries")
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="waitlist_entries")
+    email = models.EmailField()
+    services = models.ManyToManyField(Service, related_name="waitlist_entries")
+    # sum of the services' durations, so matching is a range filter
+    duration_minutes = models.PositiveIntegerField()
+
+    earliest_date = models.DateField()
+    latest_date = models.DateField()
+    # book the freed slot straight away instead of emailing an offer
+    auto_book = models.BooleanField(default=False)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="waiting")
+    matched_appointment = models.ForeignKey(
+        Appointment, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    offered_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # freed-slot match: branch + dentist equality, then the date window
+            models.Index(
+                fields=["branch", "dentist", "earliest_date", "latest_date", "duration_minutes"],
+                condition=models.Q(status="waiting"),
+                name="waitlist_waiting_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.email} waiting {self.earliest_date} to {self.latest_date} ({self.duration_minutes} min)"
+
+
+class FreedSlot(models.Model):
+    """
+    Chair time given back by a cancellation, queued for the waitlist match
+    (waitlist.py). processed_at is set once it has been matched or dropped.
+    """
+    dentist = models.ForeignKey(Dentist, on_delete=models.CASCADE, related_name="freed_slots")
+    branch = models.ForeignKey(Branch, null=True, blank=True, on_delete=models.SET_NULL, related_name="freed_slots")
+    date = models.DateField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    appointment = models.ForeignKey(Appointment, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    matched_entry = models.ForeignKey(
+        WaitlistEntry, null=True, blank=True, on_delete=models.SET_NULL, related_name="freed_slots"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(processed_at__isnull=True),
+                name="freed_slot_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.dentist.name} {self.date} {self.start_time}-{self.end_time} (freed)"
+
+
+class ScheduleLock(models.Model):
+    """
+    One row per dentist per day. Booking paths lock it with
+    select_for_update() so slot search + insert for that day run one at a time.
+    """
+    dentist = models.ForeignKey(Dentist, on_delete=models.CASCADE, related_name="schedule_locks")
+    date = models.DateField()
+
+    class Meta:
+        unique_together = ("dentist", "date")
+
+    def __str__(self):
+        return f"{self.dentist.name} - {self.date}"
+
+
+class DentistFreeTime(models.Model):
+    """
+    Materialized occupancy of one dentist on one date (see availability.py):
+
+    - free: {"<branch id>": {"open": m, "close": m, "free": [[start, end], ...]}}
+      free intervals (minutes from midnight) per branch they work at that
+      day, plus "*" for "any branch".
+    - bookings: [[start, end, branch id], ...] active appointments, any branch.
+    """
+    dentist = models.ForeignKey(Dentist, on_delete=models.CASCADE, related_name="free_time")
+    date = models.DateField()
+    free = models.JSONField(default=dict)
+    bookings = models.JSONField(default=list)
+    # False: no DentistAvailability rows, so clinic hours at any branch
+    has_availability = models.BooleanField(default=False)
+    built_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("dentist", "date")
+
+    def __str__(self):
+        return f"{self.dentist.name} - {self.date} (free time)"
+
+
+class CalendarVersion(models.Model):
+    """
+    Change counter of one branch's calendar (calendar_version.py): `scope` is
+    the branch id, or "-" for appointments with no branch.
+    """
+    scope = models.CharField(max_length=20, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Calendar {self.scope} v{self.version}"
+
+
 class AppointmentLog(models.Model):
     ACTION_CHOICES = [
         ("created", "Created"),
         ("updated", "Updated"),
         ("status_changed", "Status Changed"),
+        ("rescheduled", "Rescheduled"),
         ("cancelled", "Cancelled"),
     ]
 
@@ -0,0 +1,160 @@
+"""
+Database-level guard: no two active appointments of the same dentist may
+overlap in time.
+
+- PostgreSQL: exclusion constraint over (dentist, date + time range).
+- SQLite / MySQL: BEFORE INSERT/UPDATE triggers doing the same check.
+
+An end_time earlier than the start time means the visit runs past midnight;
+the guard counts it as occupying the rest of its own day (the clinic isn't
+open after midnight, and the date + time range must not end before it
+starts).
+
+Rows flagged schedule_conflict (legacy overlaps found when the guard was
+installed, see flag_existing_overlaps) are outside the guard, so the
+constraint can be added to a table that already has clashes and those rows
+stay writable.
+
+Called from migrations. SQLite drops triggers when Django remakes the table,
+so migrations that remake appointment_appointment re-run install() after
+(the SQLite triggers are created IF NOT EXISTS for that reason).
+"""
+
+# Active (chair-occupying) statuses, same as appointment.utils.ACTIVE_STATUSES
+ACTIVE_STATUSES = ["not_arrived", "arrived", "ongoing"]
+ACTIVE = "(" + ", ".join(f"'{status}'" for status in ACTIVE_STATUSES) + ")"
+
+
+
+def _end(row):
+    """The row's end time for the overlap test, wrapped visits ending at midnight."""
+    return f"(CASE WHEN {row}.end_time < {row}.time THEN '24:00:00' ELSE {row}.end_time END)"
+
+
+# Same overlap test for the SQLite/MySQL triggers
+OVERLAP_EXISTS = f"""
+    EXISTS (
+        SELECT 1 FROM appointment_appointment a
+        WHERE a.dentist_id = NEW.dentist_id
+          AND a.date = NEW.date
+          AND a.id <> COALESCE(NEW.id, 0)
+          AND a.end_time IS NOT NULL
+          AND a.status IN {ACTIVE}
+          AND NOT a.schedule_conflict
+          AND a.time < {_end("NEW")}
+          AND {_end("a")} > NEW.time
+    )
+"""
+
+NEW_IS_ACTIVE = (
+    f"NEW.dentist_id IS NOT NULL AND NEW.end_time IS NOT NULL AND NEW.status IN {ACTIVE}"
+    " AND NOT NEW.schedule_conflict"
+)
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    f"""
+    ALTER TABLE appointment_appointment
+    ADD CONSTRAINT appointment_no_dentist_overlap
+    EXCLUDE USING gist (
+        dentist_id WITH =,
+        tsrange(
+            date + time,
+            CASE WHEN end_time < time THEN (date + 1) + time '00:00' ELSE date + end_time END,
+            '[)'
+        ) WITH &&
+    )
+    WHERE (dentist_id IS NOT NULL AND end_time IS NOT NULL AND status IN {ACTIVE} AND NOT schedule_conflict)
+    """,
+]
+POSTGRES_BACKWARD = [
+    "ALTER TABLE appointment_appointment DROP CONSTRAINT IF EXISTS appointment_no_dentist_overlap",
+]
+
+SQLITE_FORWARD = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS appointment_no_dentist_overlap_{event.lower()}
+    BEFORE {event} ON appointment_appointment
+    FOR EACH ROW WHEN {NEW_IS_ACTIVE} AND {OVERLAP_EXISTS}
+    BEGIN
+        SELECT RAISE(ABORT, 'appointment_no_dentist_overlap');
+    END
+    """
+    for event in ("INSERT", "UPDATE")
+]
+SQLITE_BACKWARD = [
+    f"DROP TRIGGER IF EXISTS appointment_no_dentist_overlap_{event}" for event in ("insert", "update")
+]
+
+# MYSQL_ERRNO 1062 makes the driver surface it as IntegrityError, like the other backends
+MYSQL_FORWARD = [
+    f"""
+    CREATE TRIGGER appointment_no_dentist_overlap_{event.lower()}
+    BEFORE {event} ON appointment_appointment
+    FOR EACH ROW
+    BEGIN
+        IF {NEW_IS_ACTIVE} AND {OVERLAP_EXISTS} THEN
+            SIGNAL SQLSTATE '23000'
+                SET MESSAGE_TEXT = 'appointment_no_dentist_overlap', MYSQL_ERRNO = 1062;
+        END IF;
+    END
+    """
+    for event in ("INSERT", "UPDATE")
+]
+MYSQL_BACKWARD = SQLITE_BACKWARD
+
+STATEMENTS = {
+    "postgresql": (POSTGRES_FORWARD, POSTGRES_BACKWARD),
+    "sqlite": (SQLITE_FORWARD, SQLITE_BACKWARD),
+    "mysql": (MYSQL_FORWARD, MYSQL_BACKWARD),
+}
+
+
+def flag_existing_overlaps(Appointment, chunk_size=2000):
+    """
+    Flag schedule_conflict on the active appointments that overlap an
+    earlier-starting one of the same dentist, so the rest of the table
+    satisfies the guard. Nothing is cancelled or moved. Returns the flagged
+    ids.
+    """
+    rows = (
+        Appointment.objects
+        .filter(dentist__isnull=False, end_time__isnull=False, status__in=ACTIVE_STATUSES, schedule_conflict=False)
+        .order_by("dentist_id", "date", "time", "id")
+        .values_list("id", "dentist_id", "date", "time", "end_time")
+    )
+    flagged = []
+    day = busy_until = None
+    for pk, dentist_id, date, start, end in rows.iterator(chunk_size=chunk_size):
+        if (dentist_id, date) != day:
+            day, busy_until = (dentist_id, date), None
+        if busy_until is not None and start < busy_until:
+            flagged.append(pk)
+            continue
+        busy_until = end if busy_until is None else max(busy_until, end)
+
+    for i in range(0, len(flagged), chunk_size):
+        Appointment.objects.filter(pk__in=flagged[i:i + chunk_size]).update(schedule_conflict=True)
+    return flagged
+
+
+def _run(schema_editor, forward):
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if not statements:
+        return
+    for sql in statements[0 if forward else 1]:
+        schema_editor.execute(sql)
+
+
+def install(schema_editor):
+    _run(schema_editor, forward=True)
+
+
+def reinstall(schema_editor):
+    """Replace an installed guard with the current definition."""
+    _run(schema_editor, forward=False)
+    _run(schema_editor, forward=True)
+
+
+def uninstall(schema_editor):
+    _run(schema_editor, forward=False)
@@ -0,0 +1,155 @@
+"""
+Dentist-day occupancy cache on Django's cache framework (the "schedule"
+cache alias, settings.CACHES).
+
+get_booked_times, precompute_appointment_slot and the slot searches hit the
+same dentist-days over and over while the user fiddles with the form. Each
+day is cached as the DentistFreeTime payload (free intervals per branch +
+bookings), which is keyed per dentist and date rather than per branch: a
+dentist's bookings at every branch decide what is free at any one of them.
+
+The default backend is LocMemCache (LRU, MAX_ENTRIES): a hit costs no query,
+but entries and invalidations stay in one process. With more than one
+worker, point it at memcached or Redis so a booking's invalidation reaches
+them all. The database cache would cost as many queries as the lookup it
+saves.
+
+Invalidation is by version keys, never by deleting entries:
+- schedule:v:<dentist>:<date> is bumped by every appointment write touching
+  that day (availability.days_changed, from signals.py);
+- schedule:g:<dentist> is bumped when their DentistAvailability changes.
+Both are part of the data key, so old entries simply stop matching and age
+out (TIMEOUT / MAX_ENTRIES culling). A bump writes a fresh value rather than
+incr()-ing, so an evicted version key can't come back with an old number.
+Bumps run once the writing transaction has committed.
+
+Booking paths (slot search under the dentist/day lock) skip the cache and
+read the database; the cache only serves the advisory lookups.
+
+The hit/miss counters live next to the data, in the same cache, so the
+stats view reports what the cache every worker reads actually did.
+"""
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .utils import cache_incr
+
+CACHE_ALIAS = "schedule"
+TIMEOUT = 60 * 10
+
+HITS_KEY = "schedule:stats:hits"
+MISSES_KEY = "schedule:stats:misses"
+
+
+def get_cache():
+    alias = CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else "default"
+    return caches[alias]
+
+
+def day_version_key(dentist_id, day):
+    return f"schedule:v:{dentist_id}:{day.isoformat()}"
+
+
+def dentist_generation_key(dentist_id):
+    return f"schedule:g:{dentist_id}"
+
+
+def fresh_version():
+    # never reuse a number an evicted version key may have had
+    return time.time_ns()
+
+
+def _versions(cache, keys):
+    """{version key: value} for every key needed, creating missing ones."""
+    version_keys = set()
+    for dentist_id, day in keys:
+        version_keys.add(day_version_key(dentist_id, day))
+        version_keys.add(dentist_generation_key(dentist_id))
+    versions = cache.get_many(version_keys)
+    missing = {key: fresh_version() for key in version_keys if key not in versions}
+    if missing:
+        for key, value in missing.items():
+            cache.add(key, value, timeout=None)
+        # another process may have won the add()
+        versions.update(cache.get_many(missing.keys()))
+    return versions
+
+
+def _data_key(versions, dentist_id, day):
+    return (
+        f"schedule:day:{dentist_id}:{day.isoformat()}"
+        f":{versions.get(dentist_generation_key(dentist_id))}"
+        f":{versions.get(day_version_key(dentist_id, day))}"
+    )
+
+
+def get_days(keys):
+    """
+    Cached payloads for (dentist_id, date) keys: returns (found, versions),
+    found = {key: payload}. Pass `versions` back to set_days().
+    """
+    cache = get_cache()
+    keys = list(keys)
+    versions = _versions(cache, keys)
+    data_keys = {_data_key(versions, dentist_id, day): (dentist_id, day) for dentist_id, day in keys}
+    cached = cache.get_many(data_keys.keys())
+    found = {data_keys[data_key]: payload for data_key, payload in cached.items()}
+
+    _count(HITS_KEY, len(found))
+    _count(MISSES_KEY, len(keys) - len(found))
+    return found, versions
+
+
+def set_days(payloads, versions):
+    """
+    Store {key: payload} under the versions read before the database was
+    queried, so a write that bumped a version meanwhile isn't cached over.
+    """
+    cache = get_cache()
+    cache.set_many(
+        {_data_key(versions, dentist_id, day): payload for (dentist_id, day), payload in payloads.items()},
+        timeout=TIMEOUT,
+    )
+
+
+def _bump(cache, version_keys):
+    if version_keys:
+        cache.set_many({key: fresh_version() for key in version_keys}, timeout=None)
+
+
+def invalidate_days(keys):
+    """Appointments written: drop the cached (dentist_id, date) days."""
+    _bump(get_cache(), {
+        day_version_key(dentist_id, day) for dentist_id, day in keys
+        if dentist_id is not None and isinstance(day, date)
+    })
+
+
+def invalidate_dentists(dentist_ids):
+    """Availability changed: drop every cached day of these dentists."""
+    _bump(get_cache(), {dentist_generation_key(dentist_id) for dentist_id in dentist_ids if dentist_id is not None})
+
+
+def _count(key, amount):
+    if amount:
+        cache_incr(get_cache(), key, amount)
+
+
+def stats():
+    """Hit/miss counters since the last reset."""
+    counts = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    hits = counts.get(HITS_KEY, 0)
+    misses = counts.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / lookups, 4) if lookups else None,
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
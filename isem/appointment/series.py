@@ -0,0 +1,192 @@
+"""
+Recurring appointment series (ortho adjustments, multi-visit prostho, ...).
+
+A series is a rule (weekly / every 2 weeks / monthly) plus a count. Booking
+one is a single pass:
+
+- lock every dentist-day the visits could land on (occurrence dates plus the
+  days they may shift to), in one insert + one SELECT ... FOR UPDATE;
+- load the dentist's occupancy for that whole range in one query
+  (DentistDayCache.preload_range) and pick each visit's slot against it,
+  adding every pick to the in-memory index so later visits see it;
+- when a visit's day is full, shift it to the next day with room (up to
+  MAX_SHIFT_DAYS) or skip it, per the series' shift_policy;
+- insert the visits with one bulk_create, their services with one bulk insert
+  into the through table, and the logs with one more (insert_visits, also
+  used by treatment plans).
+"""
+from calendar import monthrange
+from datetime import timedelta
+
+from django.db import transaction
+
+from . import availability, calendar_version, live
+from .booking import find_or_create_patient
+from .models import Appointment, AppointmentLog, AppointmentSeries
+from .utils import DentistDayCache, find_next_available_slot, lock_dentist_days, to_minutes
+
+MAX_OCCURRENCES = 24
+# how far a visit may move when its day has no room (next_day policy)
+MAX_SHIFT_DAYS = 6
+
+
+def add_months(day, months):
+    """Same day of month `months` later, clamped to the month's last day."""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, monthrange(year, month)[1]))
+
+
+def occurrence_dates(start_date, frequency, count):
+    if frequency == "monthly":
+        return [add_months(start_date, i) for i in range(count)]
+    step = 14 if frequency == "biweekly" else 7
+    return [start_date + timedelta(days=step * i) for i in range(count)]
+
+
+def plan_series(dentist, branch, dates, total_duration, preferred_time, shift_policy, cache):
+    """
+    Pick a slot for each occurrence date against the preloaded occupancy.
+    Returns (planned, skipped): planned = [(occurrence date, booked date,
+    start_time, end_time)], skipped = [occurrence date].
+    """
+    shifts = range(MAX_SHIFT_DAYS + 1) if shift_policy == "next_day" else range(1)
+    planned, skipped = [], []
+
+    for occurrence in dates:
+        for shift in shifts:
+            day = occurrence + timedelta(days=shift)
+            dentist_day = cache.get(dentist, day)
+            start, end = find_next_available_slot(
+                dentist,
+                day,
+                total_duration,
+                preferred_time,
+                branch=branch,
+                schedule=dentist_day.schedule(branch),
+            )
+            if start:
+                # later occurrences (or shifts) must see this visit
+                dentist_day.bookings.append((to_minutes(start), to_minutes(end), branch.pk if branch else None))
+                planned.append((occurrence, day, start, end))
+                break
+        else:
+            skipped.append(occurrence)
+
+    return planned, skipped
+
+
+def book_series(dentist, branch, services, email, start_date, preferred_time,
+                frequency, count, shift_policy="next_day", patient=None, user=None, actor=None,
+                create_patient=False):
+    """
+    Create the series and all its visits.
+    Returns (series, appointments, skipped dates); series is None (and
+    nothing is written) when no visit could be placed. The overlap guard may
+    still raise IntegrityError. create_patient: as in
+    booking.book_appointment, once a visit could be placed.
+    """
+    services = list(services)
+    total_duration = sum(s.duration for s in services)
+    dates = occurrence_dates(start_date, frequency, min(count, MAX_OCCURRENCES))
+    max_shift = MAX_SHIFT_DAYS if shift_policy == "next_day" else 0
+
+    with transaction.atomic():
+        window = [d + timedelta(days=k) for d in dates for k in range(max_shift + 1)]
+        lock_dentist_days(dentist, window)
+
+        # live occupancy: plan_series appends to these DentistDay objects
+        cache = DentistDayCache(materialized=False)
+        cache.preload_range([dentist.pk], min(window), max(window))
+        planned, skipped = plan_series(
+            dentist, branch, dates, total_duration, preferred_time, shift_policy, cache
+        )
+        if not planned:
+            return None, [], skipped
+        if create_patient and patient is None and email:
+            patient = find_or_create_patient(email)
+
+        series = AppointmentSeries.objects.create(
+            dentist=dentist,
+            branch=branch,
+            user=user,
+            email=email,
+            frequency=frequency,
+            count=len(dates),
+            start_date=start_date,
+            preferred_time=preferred_time,
+            shift_policy=shift_policy,
+        )
+        series.services.set(services)
+
+        appointments = insert_visits(
+            [
+                Appointment(
+                    user=user,
+                    dentist=dentist,
+                    branch=branch,
+                    dentist_name=dentist.name,
+                    location=branch.name if branch else "",
+                    date=day,
+                    time=start,
+                    end_time=end,
+                    preferred_date=occurrence,
+                    preferred_time=preferred_time,
+                    email=email,
+                    patient=patient,
+                    series=series,
+                )
+                for occurrence, day, start, end in planned
+            ],
+            [services] * len(planned),
+            actor=actor,
+            note=f"Visit {{n}} of series {series.pk} ({series.get_frequency_display().lower()})",
+            refetch=lambda: Appointment.objects.filter(series=series).order_by("date", "time"),
+        )
+
+    return series, appointments, skipped
+
+
+def insert_visits(appointments, services_per_visit, actor=None, note="", refetch=None):
+    """
+    Insert unsaved Appointments (already placed and locked by the caller,
+    inside its transaction) with their services and "created" logs: one
+    bulk insert each. `note` may use {n} for the 1-based visit number;
+    `refetch` returns the inserted rows in order on backends whose bulk
+    inserts don't return ids (MySQL).
+    """
+    for appt, services in zip(appointments, services_per_visit):
+        # what the m2m receiver would store (bulk inserts skip it)
+        appt.total_duration_minutes = sum(s.duration for s in services)
+        appt.total_price = sum(s.price for s in services)
+        appt.service_names = ", ".join(s.service_name for s in services)
+
+    appointments = Appointment.objects.bulk_create(appointments)
+    if appointments[0].pk is None:
+        appointments = list(refetch())
+
+    Through = Appointment.services.through
+    Through.objects.bulk_create([
+        Through(appointment_id=appt.pk, service_id=service.pk)
+        for appt, services in zip(appointments, services_per_visit)
+        for service in services
+    ])
+
+    logs = AppointmentLog.objects.bulk_create([
+        AppointmentLog(
+            appointment=appt,
+            action="created",
+            new_status=appt.status,
+            actor=actor,
+            note=note.format(n=i + 1),
+        )
+        for i, appt in enumerate(appointments)
+    ])
+
+    # bulk inserts skip the post_save receivers: refresh DentistFreeTime /
+    # the schedule cache, bump the calendar versions and wake the live
+    # calendars here instead
+    availability.days_changed((appt.dentist_id, appt.date) for appt in appointments)
+    calendar_version.changed(appt.branch_id for appt in appointments)
+    live.logged(log.pk for log in logs)
+    return appointments
@@ -0,0 +1,115 @@
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import availability, calendar_version, live, waitlist
+from .models import Appointment, AppointmentLog, DentistAvailability
+from .utils import ACTIVE_STATUSES
+
+
+@receiver(post_save, sender=AppointmentLog)
+def announce_schedule_change(sender, instance, created, **kwargs):
+    """Tell the live calendar streams the change cursor moved (once committed)."""
+    if created:
+        live.logged([instance.id])
+
+
+@receiver(m2m_changed, sender=Appointment.services.through)
+def refresh_service_totals(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep Appointment.total_duration_minutes / total_price / service_names
+    (and end_time) in step with the services M2M, from either side.
+    """
+    if reverse:
+        # instance is a Service; pk_set holds appointment ids
+        if action == "pre_clear":
+            instance._cleared_appointment_ids = list(instance.appointments.values_list("pk", flat=True))
+        elif action in ("post_add", "post_remove"):
+            written = Appointment.refresh_service_totals(pk_set)
+            refresh_free_time_for_end_times(written)
+            refresh_calendars(written)
+        elif action == "post_clear":
+            written = Appointment.refresh_service_totals(getattr(instance, "_cleared_appointment_ids", []))
+            refresh_free_time_for_end_times(written)
+            refresh_calendars(written)
+        return
+
+    if action in ("post_add", "post_remove", "post_clear"):
+        written = Appointment.refresh_service_totals([instance.pk])
+        # keep the caller's in-memory instance current
+        for field, value in written.get(instance.pk, {}).items():
+            setattr(instance, field, value)
+        refresh_free_time_for_end_times(written)
+        calendar_version.changed({instance.branch_id})
+
+
+def refresh_free_time_for_end_times(written):
+    """Rebuild DentistFreeTime for appointments whose end_time just moved."""
+    moved = [pk for pk, fields in written.items() if "end_time" in fields]
+    if moved:
+        availability.days_changed(Appointment.objects.filter(pk__in=moved).values_list("dentist_id", "date"))
+
+
+def refresh_calendars(written):
+    """Service names are on the calendar: bump the branches of these appointments."""
+    if written:
+        calendar_version.changed(
+            Appointment.objects.filter(pk__in=written).values_list("branch_id", flat=True).distinct()
+        )
+
+
+def free_time_key(instance):
+    # read from __dict__ so deferred fields (.only()) don't trigger a query
+    return instance.__dict__.get("dentist_id"), instance.__dict__.get("date")
+
+
+@receiver(post_init, sender=Appointment)
+def remember_free_time_key(sender, instance, **kwargs):
+    """Dentist/date as loaded, so a reschedule also frees the old day."""
+    instance._loaded_free_time_key = free_time_key(instance)
+    instance._loaded_status = instance.__dict__.get("status")
+    instance._loaded_branch_id = instance.__dict__.get("branch_id")
+
+
+@receiver(post_save, sender=Appointment)
+def refresh_free_time_on_save(sender, instance, **kwargs):
+    """
+    Drop the touched days' DentistFreeTime rows inside the writer's
+    transaction (the next booking under the dentist/day lock reads them
+    live), rebuilt once it commits. Also invalidates the schedule cache.
+    """
+    availability.days_changed({free_time_key(instance), instance._loaded_free_time_key})
+    instance._loaded_free_time_key = free_time_key(instance)
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+def bump_calendar_version(sender, instance, **kwargs):
+    """The calendars of its branch (and the one it moved from) changed."""
+    calendar_version.changed({instance.__dict__.get("branch_id"), instance._loaded_branch_id})
+    instance._loaded_branch_id = instance.__dict__.get("branch_id")
+
+
+@receiver(post_save, sender=Appointment)
+def offer_cancelled_time(sender, instance, created, **kwargs):
+    """An active booking was cancelled: queue its time for the waitlist."""
+    status = instance.__dict__.get("status")
+    if not created and status == "cancelled" and instance._loaded_status in ACTIVE_STATUSES:
+        waitlist.slot_freed(instance)
+    instance._loaded_status = status
+
+
+@receiver(post_delete, sender=Appointment)
+def refresh_free_time_on_delete(sender, instance, **kwargs):
+    availability.days_changed({free_time_key(instance), instance._loaded_free_time_key})
+
+
+@receiver(post_init, sender=DentistAvailability)
+def remember_availability_weekday(sender, instance, **kwargs):
+    """Dentist/weekday as loaded, so moving a window to another day also rebuilds the old one."""
+    instance._loaded_weekday_key = (instance.__dict__.get("dentist_id"), instance.__dict__.get("day_of_week"))
+
+
+@receiver([post_save, post_delete], sender=DentistAvailability)
+def refresh_free_time_on_availability(sender, instance, **kwargs):
+    key = (instance.dentist_id, instance.day_of_week)
+    availability.weekdays_changed({key, instance._loaded_weekday_key})
+    instance._loaded_weekday_key = key
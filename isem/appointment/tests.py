@@ -1,3 +1,1243 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+from contextlib import contextmanager
+from datetime import date, time, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import (
+    Client,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from patient.models import Patient
+from . import (
+    availability,
+    booking,
+    calendar_version,
+    live,
+    overlap_guard,
+    schedule_cache,
+    series,
+    treatment_plan,
+    waitlist,
+)
+from .management.commands.audit_query_plans import full_scans
+from .models import (
+    Appointment,
+    AppointmentLog,
+    Branch,
+    Dentist,
+    DentistAvailability,
+    DentistFreeTime,
+    DentistService,
+    FreedSlot,
+    ScheduleLock,
+    Service,
+    WaitlistEntry,
+)
+from .utils import (
+    DaySchedule,
+    DentistDay,
+    DentistDayCache,
+    MaterializedDay,
+    cache_incr,
+    find_next_available_slot,
+    find_open_slots,
+    lock_dentist_day,
+)
+
+
+class BookingQueryBudgetTests(TestCase):
+    """
+    booking.book_appointment / reschedule_appointment run in a fixed number
+    of queries. If one of these fails, a change added a query to the
+    booking path: make it fit the budget rather than raising the number.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dentist = Dentist.objects.create(name="Dr Budget")
+        cls.branch = Branch.objects.create(name="Main")
+        cls.services = [
+            Service.objects.create(service_name="Cleaning", duration=30, price=500),
+            Service.objects.create(service_name="Fluoride", duration=15, price=300),
+        ]
+        cls.day = date.today() + timedelta(days=7)
+
+    def setUp(self):
+        # steady state: the nightly build ran and the day's lock row exists
+        availability.build([self.dentist.pk], self.day, self.day + timedelta(days=1))
+        ScheduleLock.objects.create(dentist=self.dentist, date=self.day)
+        ScheduleLock.objects.create(dentist=self.dentist, date=self.day + timedelta(days=1))
+
+    def book(self, preferred=time(9)):
+        return booking.book_appointment(
+            self.dentist, self.branch, self.services, "budget@example.com", self.day, preferred
+        )
+
+    def test_book_appointment_query_count(self):
+        # savepoint + release, lock, free time, insert, service links, log,
+        # then the post_save drop of the day's free time row (rebuilt on commit)
+        with self.assertNumQueries(8):
+            appointment = self.book()
+
+        self.assertEqual((appointment.time, appointment.end_time), (time(9), time(9, 45)))
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.total_duration_minutes, 45)
+        self.assertEqual(appointment.service_names, "Cleaning, Fluoride")
+        self.assertEqual(appointment.services.count(), 2)
+
+    def test_book_appointment_sees_previous_booking(self):
+        self.book()
+        second = self.book()
+        self.assertEqual(second.time, time(9, 45))
+
+    def test_reschedule_query_count(self):
+        appointment = self.book()
+        appointment = Appointment.objects.get(pk=appointment.pk)
+        new_day = self.day + timedelta(days=1)
+
+        # savepoint + release, lock, free time, update, one drop of the old and
+        # new days' free time rows, clear + insert service links, log
+        with self.assertNumQueries(9):
+            moved = booking.reschedule_appointment(
+                appointment, self.dentist, self.branch, self.services[:1],
+                "budget@example.com", new_day, time(10),
+            )
+
+        self.assertTrue(moved)
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.date, appointment.time, appointment.end_time), (new_day, time(10), time(10, 30)))
+        self.assertEqual(appointment.service_names, "Cleaning")
+
+    def test_reschedule_within_its_own_day_reuses_its_time(self):
+        appointment = self.book()
+        moved = booking.reschedule_appointment(
+            appointment, self.dentist, self.branch, self.services,
+            "budget@example.com", self.day, time(9, 15),
+        )
+
+        self.assertTrue(moved)
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.time, appointment.end_time), (time(9, 15), time(10)))
+        log = appointment.logs.get(action="rescheduled")
+        self.assertEqual(log.get_action_display(), "Rescheduled")
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AppointmentFormTests(TestCase):
+    """The add-appointment form (views.appointment_page)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name="Main")
+        cls.dentist = Dentist.objects.create(name="Dr Form")
+        cls.day = date.today() + timedelta(days=7)
+
+    def setUp(self):
+        schedule_cache.get_cache().clear()
+
+    def post(self, service, **fields):
+        return self.client.post(reverse("appointment:appointment_page"), {
+            "dentist": self.dentist.pk, "location": self.branch.pk, "date": self.day.isoformat(),
+            "time": "09:00", "email": "new@example.com", "services": [service.pk], **fields,
+        })
+
+    def test_booking_creates_the_guest_patient(self):
+        cleaning = Service.objects.create(service_name="Cleaning", duration=30, price=500)
+        self.post(cleaning)
+
+        patient = Patient.objects.get()
+        self.assertTrue(patient.is_guest)
+        self.assertEqual(Appointment.objects.get().patient, patient)
+
+    def test_failed_booking_leaves_no_guest_patient(self):
+        # longer than the clinic day: no slot anywhere
+        marathon = Service.objects.create(service_name="Full mouth", duration=24 * 60, price=1)
+        self.post(marathon)
+        self.post(marathon, repeat="weekly", repeat_count=3)
+
+        self.assertFalse(Appointment.objects.exists())
+        self.assertFalse(Patient.objects.exists())
+
+
+class OverlapGuardTests(TestCase):
+    """The database refuses overlapping active bookings of one dentist (overlap_guard.py)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dentist = Dentist.objects.create(name="Dr Guard")
+        cls.branch = Branch.objects.create(name="Main")
+        cls.service = Service.objects.create(service_name="Cleaning", duration=30, price=500)
+        cls.day = date.today() + timedelta(days=7)
+
+    def book(self, start, end, **fields):
+        return Appointment.objects.create(
+            dentist=self.dentist, branch=self.branch, location="Main", email="guard@example.com",
+            date=self.day, time=start, end_time=end, **fields
+        )
+
+    @contextmanager
+    def guard_dropped(self):
+        forward, backward = overlap_guard.STATEMENTS[connection.vendor]
+        with connection.cursor() as cursor:
+            for sql in backward:
+                cursor.execute(sql)
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                for sql in forward:
+                    cursor.execute(sql)
+
+    def test_overlap_is_refused(self):
+        self.book(time(9), time(10))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.book(time(9, 30), time(10, 30))
+
+    def test_back_to_back_and_inactive_rows_are_allowed(self):
+        self.book(time(9), time(10))
+        self.book(time(10), time(11))
+        self.book(time(9), time(10), status="cancelled")
+        self.assertEqual(Appointment.objects.count(), 3)
+
+    def test_moving_onto_another_booking_is_refused(self):
+        self.book(time(9), time(10))
+        later = self.book(time(11), time(12))
+        later.time, later.end_time = time(9, 30), time(10, 30)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            later.save()
+
+    def test_visit_past_midnight_is_busy_until_midnight(self):
+        self.book(time(23, 30), time(0, 30))
+        self.book(time(8), time(9))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.book(time(23, 45), time(23, 50))
+
+    def test_booking_reports_a_clash_the_slot_search_missed(self):
+        self.book(time(9), time(9, 30))
+        # a stale slot search: the guard is what stops the second booking
+        with mock.patch.object(booking, "find_next_available_slot", return_value=(time(9), time(9, 30))):
+            appointment = booking.book_appointment(
+                self.dentist, self.branch, [self.service], "late@example.com", self.day, time(9)
+            )
+        self.assertIsNone(appointment)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_flag_existing_overlaps_leaves_one_booking_per_time(self):
+        with self.guard_dropped():
+            first = self.book(time(9), time(10))
+            clash = self.book(time(9, 30), time(10, 30))
+            inside = self.book(time(9, 15), time(9, 45))
+            after = self.book(time(10), time(11))
+            self.book(time(9), time(10), status="cancelled")
+
+            flagged = overlap_guard.flag_existing_overlaps(Appointment)
+
+        self.assertEqual(sorted(flagged), sorted([clash.pk, inside.pk]))
+        self.assertEqual(
+            set(Appointment.objects.filter(schedule_conflict=False, status="not_arrived").values_list("pk", flat=True)),
+            {first.pk, after.pk},
+        )
+        # flagged rows stay writable under the reinstalled guard
+        clash.refresh_from_db()
+        clash.reason = "legacy"
+        clash.save()
+
+    def test_lock_row_is_created_once(self):
+        with transaction.atomic():
+            lock = lock_dentist_day(self.dentist, self.day)
+        with transaction.atomic():
+            self.assertEqual(lock_dentist_day(self.dentist, self.day), lock)
+        self.assertEqual(ScheduleLock.objects.filter(dentist=self.dentist, date=self.day).count(), 1)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ScheduleLockConcurrencyTests(TransactionTestCase):
+    """Two bookings of one dentist/day run one after the other (needs row locks: PostgreSQL/MySQL)."""
+
+    def test_second_booking_waits_for_the_first(self):
+        dentist = Dentist.objects.create(name="Dr Busy")
+        branch = Branch.objects.create(name="Main")
+        service = Service.objects.create(service_name="Cleaning", duration=30, price=500)
+        day = date.today() + timedelta(days=7)
+        booked = []
+
+        def book_second():
+            try:
+                booked.append(booking.book_appointment(dentist, branch, [service], "b@example.com", day, time(9)))
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            lock_dentist_day(dentist, day)
+            second = threading.Thread(target=book_second)
+            second.start()
+            second.join(0.5)
+            self.assertTrue(second.is_alive())  # blocked on the lock row
+            Appointment.objects.create(
+                dentist=dentist, branch=branch, location="Main", email="a@example.com",
+                date=day, time=time(9), end_time=time(9, 30),
+            )
+        second.join(10)
+
+        self.assertEqual((booked[0].time, booked[0].end_time), (time(9, 30), time(10)))
+
+
+class FreeTimeRefreshTests(TestCase):
+    """Writes drop the touched DentistFreeTime rows and rebuild them once, after commit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dentist = Dentist.objects.create(name="Dr Refresh")
+        cls.branch = Branch.objects.create(name="Main")
+        cls.day = date.today() + timedelta(days=7)
+        cls.window = DentistAvailability.objects.create(
+            dentist=cls.dentist, branch=cls.branch, day_of_week=cls.day.weekday(),
+            start_time=time(8), end_time=time(17),
+        )
+
+    def setUp(self):
+        availability.build([self.dentist.pk], self.day, self.day + timedelta(days=1))
+
+    def free_time_days(self):
+        return set(DentistFreeTime.objects.filter(dentist=self.dentist).values_list("date", flat=True))
+
+    def test_bookings_rebuild_their_day_once_after_commit(self):
+        with mock.patch.object(availability, "build", wraps=availability.build) as build:
+            with self.captureOnCommitCallbacks(execute=True):
+                for hour in (9, 10, 11):
+                    Appointment.objects.create(
+                        dentist=self.dentist, branch=self.branch, location="Main", email="refresh@example.com",
+                        date=self.day, time=time(hour), end_time=time(hour, 30),
+                    )
+                # dropped inside the transaction, the other day untouched
+                self.assertEqual(self.free_time_days(), {self.day + timedelta(days=1)})
+                build.assert_not_called()
+
+        build.assert_called_once_with([self.dentist.pk], self.day, self.day, dates={self.day})
+        row = DentistFreeTime.objects.get(dentist=self.dentist, date=self.day)
+        self.assertEqual(len(row.bookings), 3)
+
+    def test_availability_change_rebuilds_only_its_weekday(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.window.end_time = time(12)
+            self.window.save()
+            self.assertEqual(self.free_time_days(), {self.day + timedelta(days=1)})
+
+        row = DentistFreeTime.objects.get(dentist=self.dentist, date=self.day)
+        self.assertEqual(row.free["*"]["free"], [[8 * 60, 12 * 60]])
+        self.assertEqual(
+            {day.weekday() for day in self.free_time_days() - {self.day + timedelta(days=1)}},
+            {self.day.weekday()},
+        )
+
+    def test_rebuild_locks_days_that_had_no_lock_row(self):
+        # the day's first booking would create its lock row: the rebuild
+        # creates it first, so that booking waits for the rebuild
+        with mock.patch.object(availability, "build", wraps=availability.build) as build:
+            build.side_effect = lambda *args, **kwargs: self.assertTrue(
+                ScheduleLock.objects.filter(dentist=self.dentist, date=self.day).exists()
+            )
+            availability.refresh_days({(self.dentist.pk, self.day)})
+        build.assert_called_once()
+        self.assertEqual(ScheduleLock.objects.filter(dentist=self.dentist).count(), 1)
+
+    def test_rebuild_skips_dentists_that_no_longer_exist(self):
+        # e.g. left in the batch by a rolled-back transaction
+        availability.refresh_days({(self.dentist.pk + 1000, self.day)})
+        self.assertFalse(ScheduleLock.objects.exists())
+
+    def test_rebuild_command_locks_the_horizon_and_drops_past_locks(self):
+        ScheduleLock.objects.create(dentist=self.dentist, date=date.today() - timedelta(days=1))
+        ScheduleLock.objects.create(dentist=self.dentist, date=date.today() + timedelta(days=1))
+
+        call_command("rebuild_availability", "--days", "3", stdout=StringIO())
+
+        self.assertEqual(
+            sorted(ScheduleLock.objects.filter(dentist=self.dentist).values_list("date", flat=True)),
+            [date.today() + timedelta(days=i) for i in range(3)],
+        )
+        self.assertEqual(
+            set(DentistFreeTime.objects.filter(dentist=self.dentist, date__lt=self.day).values_list("date", flat=True)),
+            {date.today() + timedelta(days=i) for i in range(3)},
+        )
+
+
+class DayScheduleTests(SimpleTestCase):
+    """The gap list and earliest_fit() bisect, in minutes from midnight (08:00-17:00)."""
+
+    def gaps(self, schedule):
+        return list(zip(schedule.gap_starts, schedule.gap_ends))
+
+    def test_empty_day_is_one_gap(self):
+        schedule = DaySchedule([])
+        self.assertEqual(self.gaps(schedule), [(480, 1020)])
+        self.assertEqual(schedule.earliest_fit(30), 480)
+
+    def test_slot_exactly_filling_a_gap(self):
+        schedule = DaySchedule([(480, 540), (600, 1020)])
+        self.assertEqual(self.gaps(schedule), [(540, 600)])
+        self.assertEqual(schedule.earliest_fit(60), 540)
+        self.assertIsNone(schedule.earliest_fit(61))
+
+    def test_gap_edges_at_open_and_close(self):
+        # bookings flush with opening and closing time leave no sliver gaps
+        schedule = DaySchedule([(480, 540), (960, 1020)])
+        self.assertEqual(self.gaps(schedule), [(540, 960)])
+        # the last slot ends exactly at the start of the closing booking
+        self.assertEqual(schedule.earliest_fit(30, not_before=930), 930)
+        self.assertIsNone(schedule.earliest_fit(30, not_before=945))
+
+    def test_booking_running_past_close(self):
+        schedule = DaySchedule([(990, 1080)])
+        self.assertEqual(self.gaps(schedule), [(480, 990)])
+
+    def test_back_to_back_bookings_merge(self):
+        schedule = DaySchedule([(570, 600), (540, 570)])
+        self.assertEqual(self.gaps(schedule), [(480, 540), (600, 1020)])
+        self.assertEqual(schedule.earliest_fit(30, not_before=540), 600)
+
+    def test_zero_length_booking_splits_its_gap(self):
+        schedule = DaySchedule([(600, 600)])
+        self.assertEqual(self.gaps(schedule), [(480, 600), (600, 1020)])
+        # 09:45-10:15 would straddle it
+        self.assertEqual(schedule.earliest_fit(30, not_before=585), 600)
+        self.assertEqual(schedule.earliest_fit(15, not_before=585), 585)
+
+    def test_not_before_rounds_up_to_the_grid(self):
+        schedule = DaySchedule([])
+        self.assertEqual(schedule.earliest_fit(30, not_before=481), 495)
+        self.assertEqual(schedule.earliest_fit(30, not_before=400), 480)
+
+    def test_from_appointments_missing_end_time(self):
+        schedule = DaySchedule.from_appointments([(time(9), time(9, 30)), (time(11), None)])
+        self.assertEqual(self.gaps(schedule), [(480, 540), (570, 660), (660, 1020)])
+
+    def test_lunch_break_splits_the_day(self):
+        day = DentistDay(date(2030, 1, 7), [], {1: [(480, 720), (780, 1020)]}, has_availability=True)
+        schedule = day.schedule(1)
+        self.assertEqual(self.gaps(schedule), [(480, 720), (780, 1020)])
+        # nothing straddles 12:00-13:00
+        self.assertEqual(schedule.earliest_fit(60, not_before=690), 780)
+        self.assertEqual(schedule.earliest_fit(30, not_before=690), 690)
+        # not working at another branch that day
+        self.assertEqual(self.gaps(day.schedule(2)), [])
+
+    def test_materialized_day_reads_back_the_same_gaps(self):
+        bookings = [(540, 600, 1)]
+        day = DentistDay(date(2030, 1, 7), bookings, {1: [(480, 720), (780, 1020)]}, has_availability=True)
+        stored = MaterializedDay(day.date, **day.payload())
+        self.assertEqual(self.gaps(stored.schedule(1)), self.gaps(day.schedule(1)))
+        self.assertEqual(self.gaps(stored.schedule(1)), [(480, 540), (600, 720), (780, 1020)])
+
+
+class FindOpenSlotsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name="Main")
+        cls.dentist = Dentist.objects.create(name="Dr Slots")
+        cls.other = Dentist.objects.create(name="Dr Other")
+        cls.day = date.today() + timedelta(days=7)
+
+    def book(self, dentist, day, start, end):
+        return Appointment.objects.create(
+            dentist=dentist, branch=self.branch, location="Main", email="slots@example.com",
+            date=day, time=start, end_time=end,
+        )
+
+    def test_preferred_time_falls_back_to_earliest(self):
+        self.book(self.dentist, self.day, time(15), time(17))
+        start, end = find_next_available_slot(self.dentist, self.day, 30, preferred_time=time(16))
+        self.assertEqual((start, end), (time(8), time(8, 30)))
+
+    def test_skips_a_full_day(self):
+        self.book(self.dentist, self.day, time(8), time(17))
+        slots = find_open_slots([self.dentist], self.day, 3, 30, limit=2)
+        self.assertEqual(
+            [(day, start) for day, _, start, _ in slots],
+            [(self.day + timedelta(days=1), time(8)), (self.day + timedelta(days=2), time(8))],
+        )
+
+    def test_full_day_goes_to_another_dentist(self):
+        self.book(self.dentist, self.day, time(8), time(17))
+        slots = find_open_slots([self.dentist, self.other], self.day, 1, 30)
+        self.assertEqual([(dentist, start) for _, dentist, start, _ in slots], [(self.other, time(8))])
+
+    def test_back_to_back_bookings_leave_no_gap(self):
+        self.book(self.dentist, self.day, time(8), time(8, 30))
+        self.book(self.dentist, self.day, time(8, 30), time(9))
+        slots = find_open_slots([self.dentist], self.day, 1, 30)
+        self.assertEqual([(start, end) for _, _, start, end in slots], [(time(9), time(9, 30))])
+
+    def test_cancelled_booking_frees_its_time(self):
+        appointment = self.book(self.dentist, self.day, time(8), time(9))
+        appointment.status = "cancelled"
+        appointment.save()
+        slots = find_open_slots([self.dentist], self.day, 1, 30)
+        self.assertEqual(slots[0][2], time(8))
+
+    def test_lunch_break_from_availability(self):
+        for start, end in ((time(8), time(12)), (time(13), time(17))):
+            DentistAvailability.objects.create(
+                dentist=self.dentist, branch=self.branch, day_of_week=self.day.weekday(),
+                start_time=start, end_time=end,
+            )
+        self.book(self.dentist, self.day, time(8), time(11, 30))
+        slots = find_open_slots([self.dentist], self.day, 1, 60, branch=self.branch)
+        self.assertEqual([(start, end) for _, _, start, end in slots], [(time(13), time(14))])
+
+
+class TreatmentPlanSolveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name="Main")
+        cls.dentist = Dentist.objects.create(name="Dr Plan")
+        cls.service = Service.objects.create(service_name="Impression", duration=60, price=1000)
+        cls.day = date.today() + timedelta(days=7)
+
+    def test_same_day_steps_fall_back_to_the_earliest_slot(self):
+        # at 16:00 the first visit leaves no room for the second one that day
+        steps = [treatment_plan.PlanStep([self.service]), treatment_plan.PlanStep([self.service])]
+        picks = treatment_plan.solve(self.dentist, self.branch, steps, self.day, preferred_time=time(16))
+        self.assertEqual(picks, [(self.day, time(8), time(9)), (self.day, time(16), time(17))])
+
+    def test_preferred_time_is_kept_when_it_fits(self):
+        steps = [treatment_plan.PlanStep([self.service]), treatment_plan.PlanStep([self.service], 7, 7)]
+        picks = treatment_plan.solve(self.dentist, self.branch, steps, self.day, preferred_time=time(14))
+        self.assertEqual(
+            picks,
+            [(self.day, time(14), time(15)), (self.day + timedelta(days=7), time(14), time(15))],
+        )
+
+
+@override_settings(ANONYMOUS_REQUESTS_PER_HOUR=1, ANONYMOUS_PLAN_MAX_STEPS=2, SECURE_SSL_REDIRECT=False)
+class AnonymousBookingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name="Main")
+        cls.dentist = Dentist.objects.create(name="Dr Anon")
+        cls.service = Service.objects.create(service_name="Impression", duration=60, price=1000)
+        cls.day = date.today() + timedelta(days=7)
+
+    def setUp(self):
+        schedule_cache.get_cache().clear()
+
+    def post_plan(self, steps, client=None):
+        body = {
+            "dentist": self.dentist.pk, "location": self.branch.pk, "email": "anon@example.com",
+            "start_date": self.day.isoformat(), "time": "09:00",
+            "steps": [{"services": [self.service.pk]}] * steps,
+        }
+        return (client or self.client).post(
+            reverse("appointment:treatment_plan"), json.dumps(body), content_type="application/json",
+        )
+
+    def test_plan_needs_the_csrf_token(self):
+        response = self.post_plan(1, client=Client(enforce_csrf_checks=True))
+        self.assertEqual(response.status_code, 403)
+
+    def test_anonymous_plan_is_capped(self):
+        response = self.post_plan(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_anonymous_caller_is_rate_limited(self):
+        self.assertEqual(self.post_plan(1).status_code, 200)
+        self.assertEqual(self.post_plan(1).status_code, 429)
+        response = self.client.post(reverse("appointment:join_waitlist"), {
+            "dentist": self.dentist.pk, "location": self.branch.pk, "services": [self.service.pk],
+            "email": "anon@example.com", "earliest_date": self.day.isoformat(), "latest_date": self.day.isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+
+class CacheCounterTests(SimpleTestCase):
+    """utils.cache_incr never loses a count, whoever creates the counter."""
+
+    def test_counts_up_from_nothing(self):
+        cache = schedule_cache.get_cache()
+        cache.delete("test-counter")
+        self.assertEqual([cache_incr(cache, "test-counter") for _ in range(3)], [1, 2, 3])
+
+    def test_another_worker_creates_it_first(self):
+        cache = mock.Mock()
+        # missing on incr(), then another worker's add() wins ours
+        cache.incr.side_effect = [ValueError, 2]
+        cache.add.return_value = False
+        self.assertEqual(cache_incr(cache, "test-counter", timeout=3600), 2)
+        cache.add.assert_called_once_with("test-counter", 1, timeout=3600)
+
+
+class WaitlistMatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name="Main")
+        cls.dentist = Dentist.objects.create(name="Dr Ortho")
+        cls.braces = Service.objects.create(service_name="Braces", duration=60, price=5000)
+        cls.implant = Service.objects.create(service_name="Implant", duration=90, price=9000)
+        DentistService.objects.create(dentist=cls.dentist, service=cls.braces)
+        cls.day = date.today() + timedelta(days=7)
+
+    def join(self, services, dentist=None, email="wait@example.com", auto_book=True):
+        entry = WaitlistEntry.objects.create(
+            dentist=dentist, branch=self.branch, email=email, auto_book=auto_book,
+            duration_minutes=sum(s.duration for s in services),
+            earliest_date=self.day, latest_date=self.day,
+        )
+        entry.services.set(services)
+        return entry
+
+    def free_slot(self):
+        slot = FreedSlot.objects.create(
+            dentist=self.dentist, branch=self.branch, date=self.day, start_time=time(9), end_time=time(11),
+        )
+        return waitlist.process_freed_slot(slot.pk)
+
+    def test_any_dentist_entry_skips_a_dentist_without_its_services(self):
+        # the longer visit ranks first, but this dentist doesn't do implants
+        self.join([self.implant])
+        braces = self.join([self.braces])
+        self.assertEqual(self.free_slot(), braces)
+        self.assertEqual(list(Appointment.objects.values_list("dentist", "time")), [(self.dentist.pk, time(9))])
+
+    def test_no_eligible_entry_books_nothing(self):
+        entry = self.join([self.implant])
+        self.assertIsNone(self.free_slot())
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, "waiting")
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_auto_book_cancels_the_later_booking(self):
+        later = Appointment.objects.create(
+            dentist=self.dentist, branch=self.branch, email="Wait@example.com",
+            date=self.day + timedelta(days=14), time=time(9),
+        )
+        later.services.set([self.braces])
+        other = Appointment.objects.create(
+            dentist=self.dentist, branch=self.branch, email="wait@example.com",
+            date=self.day + timedelta(days=21), time=time(9),
+        )
+        other.services.set([self.implant])
+        self.join([self.braces])
+
+        with mock.patch.object(waitlist, "_dispatcher", waitlist.CommandDispatcher()):
+            entry = self.free_slot()
+
+        later.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(entry.matched_appointment.date, self.day)
+        self.assertEqual(later.status, "cancelled")
+        self.assertEqual(later.logs.get(action="cancelled").new_status, "cancelled")
+        self.assertEqual(other.status, "not_arrived")
+        # the cancelled time is queued for the rest of the waitlist
+        self.assertTrue(FreedSlot.objects.filter(appointment=later, processed_at__isnull=True).exists())
+
+    def test_lapsed_offer_goes_to_the_next_entry(self):
+        first = self.join([self.braces], email="first@example.com", auto_book=False)
+        second = self.join([self.braces], email="second@example.com", auto_book=False)
+        self.assertEqual(self.free_slot(), first)
+
+        WaitlistEntry.objects.filter(pk=first.pk).update(offered_at=timezone.now() - timedelta(hours=5))
+        with mock.patch.object(waitlist, "_dispatcher", waitlist.CommandDispatcher()):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(waitlist.expire_offers(), 1)
+
+        requeued = FreedSlot.objects.get(processed_at__isnull=True)
+        self.assertEqual(waitlist.process_freed_slot(requeued.pk), second)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ("waiting", "offered"))
+
+        # the slot isn't offered back to the first entry once the second lapses
+        WaitlistEntry.objects.filter(pk=second.pk).update(offered_at=timezone.now() - timedelta(hours=5))
+        waitlist.expire_offers()
+        self.assertIsNone(waitlist.process_freed_slot(FreedSlot.objects.get(processed_at__isnull=True).pk))
+
+    def test_fresh_offer_is_kept_and_a_passed_window_expires(self):
+        entry = self.join([self.braces], auto_book=False)
+        self.free_slot()
+        self.assertEqual(waitlist.expire_offers(), 0)
+
+        later = timezone.now() + timedelta(days=30)
+        self.assertEqual(waitlist.expire_offers(now=later), 1)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, "expired")
+        self.assertFalse(FreedSlot.objects.filter(processed_at__isnull=True).exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class EventsFeedTests(TestCase):
+    """The calendar feed (views.events) for a staff user."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("frontdesk", password="x", is_staff=True)
+        cls.dentist = Dentist.objects.create(name="Dr Feed")
+        cls.branch = Branch.objects.create(name="Main")
+        cls.service = Service.objects.create(service_name="Cleaning", duration=30, price=500)
+        cls.day = date.today() + timedelta(days=7)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def book(self, hour, day=None):
+        return booking.book_appointment(
+            self.dentist, self.branch, [self.service], "feed@example.com", day or self.day, time(hour)
+        )
+
+    def window(self, **params):
+        return {"start": str(self.day), "end": str(self.day + timedelta(days=7)), **params}
+
+    def test_window_query_count_does_not_grow_with_events(self):
+        self.book(9)
+        # session, user, cursor, calendar version, appointments + dentist/branch, service ids
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse("appointment:events"), self.window())
+        self.assertEqual(len(response.json()), 1)
+
+        for hour in (10, 11, 13, 14):
+            self.book(hour)
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse("appointment:events"), self.window())
+        self.assertEqual(len(response.json()), 5)
+
+    def test_window_leaves_out_other_days(self):
+        self.book(9)
+        self.book(9, day=self.day + timedelta(days=14))
+        events = self.client.get(reverse("appointment:events"), self.window()).json()
+        self.assertEqual([event["start"] for event in events], [f"{self.day}T09:00:00"])
+
+    def test_unchanged_calendar_answers_304(self):
+        self.book(9)
+        url = reverse("appointment:events")
+        first = self.client.get(url, self.window())
+        etag = first["ETag"]
+
+        again = self.client.get(url, self.window(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["ETag"], etag)
+
+        # the version is bumped once the booking commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(10)
+        changed = self.client.get(url, self.window(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+        self.assertEqual(len(changed.json()), 2)
+
+    def test_since_returns_only_the_changes(self):
+        kept = self.book(9)
+        moved = self.book(10)
+        url = reverse("appointment:events")
+        cursor = self.client.get(url, self.window())["X-Calendar-Cursor"]
+
+        added = self.book(11)
+        booking.reschedule_appointment(
+            moved, self.dentist, self.branch, [self.service], "feed@example.com", self.day + timedelta(days=14), time(10)
+        )
+        delta = self.client.get(url, self.window(since=cursor)).json()
+
+        self.assertEqual([event["id"] for event in delta["events"]], [str(added.pk)])
+        self.assertEqual(delta["removed"], [str(moved.pk)])
+        self.assertNotIn(str(kept.pk), delta["removed"])
+        self.assertGreater(delta["cursor"], int(cursor))
+
+        nothing = self.client.get(url, self.window(since=delta["cursor"])).json()
+        self.assertEqual((nothing["events"], nothing["removed"]), ([], []))
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get(reverse("appointment:events"), self.window(since="abc"))
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class LiveScheduleTests(TestCase):
+    """Calendar writes reach an open live stream (views.live_schedule, live.py)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("reception", password="x", is_staff=True)
+        cls.dentist = Dentist.objects.create(name="Dr Live")
+        cls.branch = Branch.objects.create(name="Main")
+        cls.other_branch = Branch.objects.create(name="North")
+        cls.service = Service.objects.create(service_name="Cleaning", duration=30, price=500)
+        cls.day = date.today() + timedelta(days=7)
+
+    def setUp(self):
+        broker = mock.patch.object(live, "_broker", live.InProcessBroker())
+        # freed slots are matched by the cron'd command, not a thread
+        dispatcher = mock.patch.object(waitlist, "_dispatcher", waitlist.CommandDispatcher())
+        broker.start()
+        dispatcher.start()
+        self.addCleanup(broker.stop)
+        self.addCleanup(dispatcher.stop)
+        self.client.force_login(self.staff)
+
+    def book(self, hour=9):
+        return booking.book_appointment(
+            self.dentist, self.branch, [self.service], "live@example.com", self.day, time(hour)
+        )
+
+    def set_status(self, appointment, status):
+        self.client.post(
+            reverse("appointment:update_status", args=[appointment.pk]),
+            json.dumps({"status": status}), content_type="application/json",
+        )
+
+    def committed(self, write):
+        with self.captureOnCommitCallbacks(execute=True):
+            return write()
+
+    async def open_stream(self, **params):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse("appointment:live_schedule"), params)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        frames = aiter(response.streaming_content)
+        self.assertEqual(await anext(frames), b"retry: 5000\n\n")
+        return frames
+
+    async def delta_after(self, frames, write):
+        """Run `write` (committed) while the stream waits; return (frame id, delta)."""
+        frame = asyncio.ensure_future(anext(frames))
+        await asyncio.sleep(0)
+        await sync_to_async(self.committed)(write)
+        lines = dict(line.split(": ", 1) for line in (await asyncio.wait_for(frame, 5)).decode().strip().split("\n"))
+        self.assertEqual(lines["event"], "schedule")
+        return int(lines["id"]), json.loads(lines["data"])
+
+    async def test_create_status_reschedule_and_cancel_reach_the_stream(self):
+        frames = await self.open_stream(branch="Main")
+        try:
+            appointment = None
+
+            def create():
+                nonlocal appointment
+                appointment = self.book()
+
+            cursor, delta = await self.delta_after(frames, create)
+            self.assertEqual([event["id"] for event in delta["events"]], [str(appointment.pk)])
+            self.assertEqual(delta["cursor"], cursor)
+
+            _, delta = await self.delta_after(frames, lambda: self.set_status(appointment, "arrived"))
+            self.assertEqual([event["extendedProps"]["status"] for event in delta["events"]], ["arrived"])
+
+            _, delta = await self.delta_after(frames, lambda: booking.reschedule_appointment(
+                appointment, self.dentist, self.branch, [self.service], "live@example.com",
+                self.day + timedelta(days=1), time(10),
+            ))
+            self.assertEqual([event["start"] for event in delta["events"]], [f"{self.day + timedelta(days=1)}T10:00:00"])
+
+            _, delta = await self.delta_after(frames, lambda: self.set_status(appointment, "cancelled"))
+            self.assertEqual([event["extendedProps"]["status"] for event in delta["events"]], ["cancelled"])
+        finally:
+            await frames.aclose()
+
+    async def test_move_to_another_branch_is_a_removal(self):
+        appointment = await sync_to_async(self.committed)(self.book)
+        frames = await self.open_stream(branch="Main")
+        try:
+            _, delta = await self.delta_after(frames, lambda: booking.reschedule_appointment(
+                appointment, self.dentist, self.other_branch, [self.service], "live@example.com", self.day, time(10),
+            ))
+            self.assertEqual((delta["events"], delta["removed"]), ([], [str(appointment.pk)]))
+        finally:
+            await frames.aclose()
+
+    async def test_reconnect_catches_up_from_last_event_id(self):
+        await sync_to_async(self.committed)(self.book)
+        cursor = await sync_to_async(calendar_version.latest_cursor)()
+        # booked while the calendar was reconnecting
+        appointment = await sync_to_async(self.committed)(lambda: self.book(10))
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(
+            reverse("appointment:live_schedule"), headers={"last-event-id": str(cursor)}
+        )
+        frames = aiter(response.streaming_content)
+        try:
+            await anext(frames)
+            frame = (await asyncio.wait_for(anext(frames), 5)).decode()
+            self.assertIn(f'"id":"{appointment.pk}"', frame)
+        finally:
+            await frames.aclose()
+
+    def test_wsgi_request_is_told_to_stop(self):
+        self.assertEqual(self.client.get(reverse("appointment:live_schedule")).status_code, 204)
+
+    def test_series_insert_wakes_the_stream(self):
+        woken = []
+        with mock.patch.object(live.get_broker(), "publish", woken.append):
+            with self.captureOnCommitCallbacks(execute=True):
+                series.book_series(
+                    self.dentist, self.branch, [self.service], "live@example.com",
+                    self.day, time(9), "weekly", 2,
+                )
+        self.assertEqual(woken, [calendar_version.latest_cursor()])
+
+
+class ServiceTotalsTests(TestCase):
+    """Appointment's stored service totals follow the services M2M from either side."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name="Main")
+        cls.cleaning = Service.objects.create(service_name="Cleaning", duration=30, price=500)
+        cls.fluoride = Service.objects.create(service_name="Fluoride", duration=15, price=300)
+        cls.day = date.today() + timedelta(days=7)
+
+    def make(self):
+        return Appointment.objects.create(
+            branch=self.branch, location="Main", email="totals@example.com", date=self.day, time=time(9),
+        )
+
+    def stored(self, appointment):
+        appointment.refresh_from_db()
+        return (appointment.total_duration_minutes, appointment.total_price, appointment.service_names, appointment.end_time)
+
+    def test_adding_and_removing_services(self):
+        appointment = self.make()
+        appointment.services.add(self.cleaning, self.fluoride)
+        self.assertEqual(self.stored(appointment), (45, 800, "Cleaning, Fluoride", time(9, 45)))
+        # the caller's instance is kept current too
+        appointment.services.remove(self.fluoride)
+        self.assertEqual(appointment.total_duration_minutes, 30)
+        self.assertEqual(self.stored(appointment), (30, 500, "Cleaning", time(9, 30)))
+
+    def test_changes_from_the_service_side(self):
+        first, second = self.make(), self.make()
+        self.fluoride.appointments.add(first, second)
+        self.assertEqual(self.stored(second)[:3], (15, 300, "Fluoride"))
+
+        self.fluoride.appointments.clear()
+        self.assertEqual(self.stored(first)[:3], (0, 0, ""))
+        self.assertEqual(self.stored(second)[:3], (0, 0, ""))
+
+    def test_save_is_one_write_with_end_time_following(self):
+        appointment = self.make()
+        appointment.services.add(self.cleaning)
+        appointment = Appointment.objects.get(pk=appointment.pk)
+
+        appointment.time = time(14)
+        # no M2M read, end_time joins the update
+        with self.assertNumQueries(1):
+            appointment.save(update_fields=["time"])
+        self.assertEqual(self.stored(appointment)[3], time(14, 30))
+
+
+class QueryPlanAuditTests(TestCase):
+    """audit_query_plans passes on the current indexes and catches a dropped one."""
+
+    def audit(self):
+        out = StringIO()
+        call_command("audit_query_plans", "--seed", "50", stdout=out)
+        return out.getvalue()
+
+    def test_hot_paths_use_indexes(self):
+        self.assertIn("No full scans.", self.audit())
+
+    @skipUnlessDBFeature("can_rollback_ddl")
+    def test_dropped_index_is_reported(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP INDEX appt_date_time_idx")
+        output = self.audit()
+        self.assertIn("[SCAN] calendar window", output)
+        self.assertIn("full scan(s) found.", output)
+
+    def test_dentist_day_index_exists_on_every_backend(self):
+        # partial where supported, the plain fallback of migration 0026 elsewhere
+        name = "appt_active_dentist_day_idx" if connection.features.supports_partial_indexes else "appt_dentist_day_idx"
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, Appointment._meta.db_table)
+        self.assertEqual(indexes[name]["columns"], ["dentist_id", "date", "time"])
+
+
+class FullScanDetectionTests(SimpleTestCase):
+    def test_each_backend_plan_format(self):
+        self.assertEqual(full_scans("Seq Scan on appointment_appointment  (cost=0.00..1.01)", "postgresql"),
+                         ["Seq Scan on appointment_appointment  (cost=0.00..1.01)"])
+        self.assertEqual(full_scans("Index Scan using appt_date_time_idx on appointment_appointment", "postgresql"), [])
+        self.assertEqual(len(full_scans("2 0 0 SCAN appointment_appointment", "sqlite")), 1)
+        self.assertEqual(full_scans("2 0 0 SEARCH appointment_appointment USING INDEX appt_date_time_idx", "sqlite"), [])
+        self.assertEqual(full_scans('      "access_type": "ALL",', "mysql"), ['"access_type": "ALL",'])
+        self.assertEqual(full_scans('      "access_type": "range",', "mysql"), [])
+
+
+class BackfillAppointmentFksTests(TestCase):
+    """backfill_appointment_fks links legacy rows by their dentist_name / location strings."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dentist = Dentist.objects.create(name="Dr Smith")
+        cls.branch = Branch.objects.create(name="Main")
+        cls.day = date.today() + timedelta(days=7)
+
+    def legacy(self, start, end, dentist_name="dr smith ", location="MAIN", **fields):
+        return Appointment.objects.create(
+            dentist_name=dentist_name, location=location, email="legacy@example.com",
+            date=self.day, time=start, end_time=end, **fields
+        )
+
+    def backfill(self, *args):
+        out = StringIO()
+        call_command("backfill_appointment_fks", "--chunk-size", "2", *args, stdout=out)
+        return out.getvalue()
+
+    def test_links_by_normalized_name_in_chunks(self):
+        first = self.legacy(time(9), time(10))
+        second = self.legacy(time(10), time(11))
+        third = self.legacy(time(11), time(12))
+        stranger = self.legacy(time(9), time(10), dentist_name="Dr Nobody", location="Elsewhere")
+
+        output = self.backfill()
+
+        self.assertEqual(
+            set(Appointment.objects.filter(dentist=self.dentist, branch=self.branch).values_list("pk", flat=True)),
+            {first.pk, second.pk, third.pk},
+        )
+        stranger.refresh_from_db()
+        self.assertEqual((stranger.dentist_id, stranger.branch_id), (None, None))
+        self.assertIn("Updated 3 appointment(s); 1 had no matching dentist/branch.", output)
+        self.assertFalse(Appointment.objects.filter(schedule_conflict=True).exists())
+
+    def test_dry_run_and_start_after(self):
+        first = self.legacy(time(9), time(10))
+        second = self.legacy(time(10), time(11))
+
+        self.assertIn("Would update 2", self.backfill("--dry-run"))
+        self.assertFalse(Appointment.objects.filter(dentist__isnull=False).exists())
+
+        self.backfill("--start-after", str(first.pk))
+        self.assertEqual(list(Appointment.objects.filter(dentist__isnull=False).values_list("pk", flat=True)), [second.pk])
+
+    def test_overlapping_legacy_row_is_linked_and_flagged(self):
+        Appointment.objects.create(
+            dentist=self.dentist, branch=self.branch, location="Main", email="booked@example.com",
+            date=self.day, time=time(9), end_time=time(10),
+        )
+        clash = self.legacy(time(9, 30), time(10, 30))
+        fine = self.legacy(time(10, 30), time(11))
+
+        output = self.backfill()
+
+        clash.refresh_from_db()
+        fine.refresh_from_db()
+        # the chunk's bulk_update is refused, the row-by-row retry links both
+        self.assertEqual((clash.dentist_id, clash.schedule_conflict), (self.dentist.pk, True))
+        self.assertEqual((fine.dentist_id, fine.schedule_conflict), (self.dentist.pk, False))
+        self.assertIn(f"reschedule them): {clash.pk}", output)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CrossBranchConflictTests(TestCase):
+    """A dentist's booking at one branch blocks the same hours at the others."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = Branch.objects.create(name="Main")
+        cls.north = Branch.objects.create(name="North")
+        cls.dentist = Dentist.objects.create(name="Dr Travel")
+        cls.day = date.today() + timedelta(days=7)
+
+    def setUp(self):
+        # the booked-times feed reads through the shared schedule cache
+        schedule_cache.get_cache().clear()
+
+    def book(self, branch, start, end):
+        return Appointment.objects.create(
+            dentist=self.dentist, branch=branch, location=branch.name, email="travel@example.com",
+            date=self.day, time=start, end_time=end,
+        )
+
+    def works(self, branch, start, end):
+        DentistAvailability.objects.create(
+            dentist=self.dentist, branch=branch, day_of_week=self.day.weekday(), start_time=start, end_time=end,
+        )
+
+    def test_booking_at_another_branch_is_busy(self):
+        self.book(self.north, time(9), time(10))
+        start, _ = find_next_available_slot(self.dentist, self.day, 30, preferred_time=time(9), branch=self.main)
+        self.assertEqual(start, time(10))
+
+    def test_only_the_branch_windows_are_open(self):
+        self.works(self.main, time(8), time(12))
+        self.works(self.north, time(13), time(17))
+        self.book(self.main, time(8), time(11, 30))
+
+        # North opens at 13:00; Main has no 60 minutes left
+        self.assertEqual(
+            find_next_available_slot(self.dentist, self.day, 60, preferred_time=time(9), branch=self.north)[0],
+            time(13),
+        )
+        self.assertEqual(
+            find_next_available_slot(self.dentist, self.day, 60, branch=self.main), (None, None),
+        )
+
+    def test_booked_times_show_the_other_branch_and_the_hours_away(self):
+        self.works(self.main, time(8), time(12))
+        self.works(self.north, time(13), time(17))
+        self.book(self.north, time(14), time(15))
+
+        response = self.client.get(reverse("appointment:get_booked_times"), {
+            "dentist": self.dentist.pk, "date": str(self.day), "location": self.main.pk,
+        })
+
+        booked = [(entry["start"], entry["end"], entry["reason"]) for entry in response.json()["booked"]]
+        self.assertIn(("14:00", "15:00", "booked"), booked)
+        self.assertIn(("12:00", "17:00", "unavailable"), booked)
+
+
+class ScheduleCacheTests(TestCase):
+    """Shared dentist-day lookups (DentistDayCache(shared=True)) and their invalidation."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dentist = Dentist.objects.create(name="Dr Cached")
+        cls.branch = Branch.objects.create(name="Main")
+        cls.service = Service.objects.create(service_name="Cleaning", duration=30, price=500)
+        cls.day = date.today() + timedelta(days=7)
+
+    def setUp(self):
+        schedule_cache.get_cache().clear()
+        # freed slots are matched by the cron'd command, not a thread
+        dispatcher = mock.patch.object(waitlist, "_dispatcher", waitlist.CommandDispatcher())
+        dispatcher.start()
+        self.addCleanup(dispatcher.stop)
+
+    def bookings(self, day=None):
+        return DentistDayCache(shared=True).get(self.dentist, day or self.day).bookings
+
+    def committed(self, write):
+        with self.captureOnCommitCallbacks(execute=True):
+            return write()
+
+    def book(self, hour=9):
+        return self.committed(lambda: booking.book_appointment(
+            self.dentist, self.branch, [self.service], "cached@example.com", self.day, time(hour)
+        ))
+
+    def test_miss_then_hit_without_queries(self):
+        self.assertEqual(self.bookings(), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.bookings(), [])
+        self.assertEqual(schedule_cache.stats(), {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+        schedule_cache.reset_stats()
+        self.assertEqual(schedule_cache.stats()["hits"], 0)
+
+    def test_booking_invalidates_its_day(self):
+        self.bookings()
+        self.book()
+        self.assertEqual(len(self.bookings()), 1)
+        self.assertEqual(schedule_cache.stats()["misses"], 2)
+
+    def test_status_change_invalidates_its_day(self):
+        appointment = self.book()
+        self.assertEqual(len(self.bookings()), 1)
+
+        appointment.status = "cancelled"
+        self.committed(lambda: appointment.save(update_fields=["status"]))
+        self.assertEqual(self.bookings(), [])
+
+    def test_reschedule_invalidates_both_days(self):
+        appointment = self.book()
+        new_day = self.day + timedelta(days=1)
+        self.assertEqual((len(self.bookings()), self.bookings(new_day)), (1, []))
+
+        self.committed(lambda: booking.reschedule_appointment(
+            appointment, self.dentist, self.branch, [self.service], "cached@example.com", new_day, time(10),
+        ))
+        self.assertEqual(self.bookings(), [])
+        self.assertEqual(len(self.bookings(new_day)), 1)
+
+    def test_uncommitted_write_keeps_the_entry(self):
+        self.bookings()
+        # rolled back (never committed): nothing to invalidate
+        with transaction.atomic():
+            booking.book_appointment(self.dentist, self.branch, [self.service], "cached@example.com", self.day, time(9))
+            transaction.set_rollback(True)
+        with self.assertNumQueries(0):
+            self.bookings()
+
+
+class SeriesDatesTests(SimpleTestCase):
+    def test_monthly_keeps_the_day_clamped_to_month_end(self):
+        self.assertEqual(
+            series.occurrence_dates(date(2027, 1, 31), "monthly", 4),
+            [date(2027, 1, 31), date(2027, 2, 28), date(2027, 3, 31), date(2027, 4, 30)],
+        )
+        self.assertEqual(series.add_months(date(2027, 11, 30), 3), date(2028, 2, 29))
+
+    def test_weekly_and_biweekly(self):
+        start = date(2027, 3, 1)
+        self.assertEqual(series.occurrence_dates(start, "weekly", 3), [start, date(2027, 3, 8), date(2027, 3, 15)])
+        self.assertEqual(series.occurrence_dates(start, "biweekly", 2), [start, date(2027, 3, 15)])
+
+
+class BookSeriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name="Main")
+        cls.dentist = Dentist.objects.create(name="Dr Series")
+        cls.services = [
+            Service.objects.create(service_name="Adjustment", duration=30, price=1500),
+            Service.objects.create(service_name="Wire", duration=15, price=500),
+        ]
+        cls.day = date.today() + timedelta(days=7)
+
+    def book(self, count, dentist=None, **kwargs):
+        return series.book_series(
+            dentist or self.dentist, self.branch, self.services, "series@example.com",
+            self.day, time(9), "weekly", count, **kwargs
+        )
+
+    def test_visits_are_inserted_in_bulk(self):
+        # the query count doesn't grow with the number of visits
+        other = Dentist.objects.create(name="Dr Longer")
+        with CaptureQueriesContext(connection) as three:
+            self.book(3)
+        with CaptureQueriesContext(connection) as six:
+            self.book(6, dentist=other)
+        self.assertEqual(len(three), len(six))
+
+    def test_visits_carry_their_totals_and_logs(self):
+        booked, appointments, skipped = self.book(3)
+
+        self.assertEqual(skipped, [])
+        self.assertEqual([a.date for a in appointments], series.occurrence_dates(self.day, "weekly", 3))
+        for appointment in Appointment.objects.filter(series=booked):
+            self.assertEqual((appointment.time, appointment.end_time), (time(9), time(9, 45)))
+            self.assertEqual((appointment.total_duration_minutes, appointment.total_price), (45, 2000))
+            self.assertEqual(appointment.service_names, "Adjustment, Wire")
+            self.assertEqual(appointment.services.count(), 2)
+        self.assertEqual(AppointmentLog.objects.filter(appointment__series=booked, action="created").count(), 3)
+
+    def test_full_day_shifts_or_skips(self):
+        second = self.day + timedelta(days=7)
+        Appointment.objects.create(
+            dentist=self.dentist, branch=self.branch, location="Main", email="busy@example.com",
+            date=second, time=time(8), end_time=time(17),
+        )
+
+        _, appointments, _ = self.book(3)
+        self.assertEqual(
+            [(a.preferred_date, a.date) for a in appointments][1],
+            (second, second + timedelta(days=1)),
+        )
+
+        _, appointments, skipped = self.book(3, dentist=self.dentist, shift_policy="skip")
+        self.assertEqual(skipped, [second])
+        self.assertEqual(len(appointments), 2)
@@ -0,0 +1,207 @@
+"""
+Multi-visit treatment plans (RPD metal framework, implants, ...): an ordered
+list of steps, each a set of services plus the allowed gap in days since the
+previous visit, solved for the earliest feasible sequence of slots with one
+dentist at one branch.
+
+- The dentist's occupancy for the whole search window is loaded once
+  (DentistDayCache.preload_range: one bookings query, one availability query).
+- solve() sweeps forward: each step takes the earliest day in its gap window
+  with room, then the next step is tried from there; when a step has no day
+  left, the previous one moves to its next day (backtracking). Within a day a
+  step takes the slot at/after preferred_time; if the following steps fail
+  from there, it falls back to the earliest slot of the day (which leaves a
+  same-day next step the most room) before moving on to the next day. Failed
+  (step, previous visit) states are remembered so no state is searched twice.
+- book_plan() solves without holding any lock, then locks only the chosen
+  dentist-days, checks the picks against fresh occupancy and inserts all
+  visits in one transaction (series.insert_visits). If a booking slipped in
+  meanwhile it solves again, up to SOLVE_ATTEMPTS times.
+"""
+from datetime import datetime, timedelta
+
+from django.db import transaction
+
+from .models import Appointment, TreatmentPlan
+from .series import insert_visits
+from .utils import (
+    DentistDayCache,
+    lock_dentist_days,
+    minutes_not_before,
+    to_minutes,
+    to_time,
+)
+
+MAX_STEPS = 12
+# how far after start_date the first visit may land
+FIRST_VISIT_WINDOW_DAYS = 30
+MAX_PLAN_DAYS = 365
+SOLVE_ATTEMPTS = 3
+
+
+class PlanStep:
+    def __init__(self, services, min_gap_days=0, max_gap_days=0):
+        self.services = list(services)
+        self.min_gap_days = min_gap_days
+        self.max_gap_days = max_gap_days
+        self.duration = sum(s.duration for s in self.services)
+
+    def as_json(self):
+        return {
+            "services": [s.pk for s in self.services],
+            "min_gap_days": self.min_gap_days,
+            "max_gap_days": self.max_gap_days,
+        }
+
+
+def gap_bounds(steps, i):
+    """(min, max) days step i may land after the previous visit / start_date."""
+    step = steps[i]
+    if i == 0:
+        return step.min_gap_days, max(step.max_gap_days, step.min_gap_days + FIRST_VISIT_WINDOW_DAYS)
+    return step.min_gap_days, step.max_gap_days
+
+
+def plan_window(start_date, steps):
+    """(first, last) date any visit of the plan can land on."""
+    span = sum(gap_bounds(steps, i)[1] for i in range(len(steps)))
+    return start_date, start_date + timedelta(days=min(span, MAX_PLAN_DAYS))
+
+
+def day_slots(dentist_day, branch, duration, preferred_time, not_before, now):
+    """
+    Starts (minutes) to try on the day, best first: the earliest at/after
+    preferred_time, then the earliest at all; never before `not_before`
+    (minutes) or the current time.
+    """
+    day = dentist_day.date
+    if day < now.date():
+        return []
+    floor = minutes_not_before(now, day) if day == now.date() else None
+    if not_before is not None:
+        floor = not_before if floor is None else max(floor, not_before)
+
+    schedule = dentist_day.schedule(branch)
+    starts = []
+    if preferred_time:
+        lower = to_minutes(preferred_time) if floor is None else max(floor, to_minutes(preferred_time))
+        start = schedule.earliest_fit(duration, lower)
+        if start is not None:
+            starts.append(start)
+    earliest = schedule.earliest_fit(duration, floor)
+    if earliest is not None and earliest not in starts:
+        starts.append(earliest)
+    return starts
+
+
+def solve(dentist, branch, steps, start_date, preferred_time=None, cache=None, now=None):
+    """
+    Earliest feasible sequence for `steps` (PlanStep list) starting no earlier
+    than start_date. The first step may land up to FIRST_VISIT_WINDOW_DAYS
+    past its own min_gap_days (or its max_gap_days, if larger).
+    Returns [(date, start_time, end_time)] per step, or None.
+    """
+    now = now or datetime.now()
+    first, last = plan_window(start_date, steps)
+    if cache is None:
+        cache = DentistDayCache(materialized=False)
+        cache.preload_range([dentist.pk], first, last)
+
+    failed = set()
+    picks = []
+
+    def place(i, prev_date, prev_end):
+        if i == len(steps):
+            return True
+        if (i, prev_date, prev_end) in failed:
+            return False
+        step = steps[i]
+        min_gap, max_gap = gap_bounds(steps, i)
+        for offset in range(min_gap, max_gap + 1):
+            day = prev_date + timedelta(days=offset)
+            if day > last:
+                break
+            # same-day steps follow each other, so they never overlap
+            not_before = prev_end if offset == 0 and i > 0 else None
+            for start in day_slots(cache.get(dentist, day), branch, step.duration, preferred_time, not_before, now):
+                picks.append((day, start, start + step.duration))
+                if place(i + 1, day, start + step.duration):
+                    return True
+                picks.pop()
+        failed.add((i, prev_date, prev_end))
+        return False
+
+    if not place(0, start_date, None):
+        return None
+    return [(day, to_time(start), to_time(end)) for day, start, end in picks]
+
+
+def still_free(dentist, branch, picks):
+    """Re-check solved picks against fresh occupancy (caller holds the locks)."""
+    cache = DentistDayCache(materialized=False)
+    cache.preload_range([dentist.pk], picks[0][0], picks[-1][0])
+    for day, start, end in picks:
+        start, end = to_minutes(start), to_minutes(end)
+        dentist_day = cache.get(dentist, day)
+        if dentist_day.schedule(branch).earliest_fit(end - start, start) != start:
+            return False
+        # a later step on the same day must not be checked against a gap this one fills
+        dentist_day.bookings.append((start, end, branch.pk if branch else None))
+    return True
+
+
+def book_plan(dentist, branch, steps, email, start_date, preferred_time=None,
+              name="", patient=None, user=None, actor=None):
+    """
+    Solve and book the whole plan. Returns (plan, appointments); plan is None
+    (and nothing is written) when no feasible sequence exists. The overlap
+    guard may still raise IntegrityError.
+    """
+    for _ in range(SOLVE_ATTEMPTS):
+        picks = solve(dentist, branch, steps, start_date, preferred_time)
+        if picks is None:
+            return None, []
+
+        with transaction.atomic():
+            lock_dentist_days(dentist, [day for day, _, _ in picks])
+            if not still_free(dentist, branch, picks):
+                continue
+
+            plan = TreatmentPlan.objects.create(
+                name=name,
+                dentist=dentist,
+                branch=branch,
+                user=user,
+                email=email,
+                steps=[step.as_json() for step in steps],
+                start_date=start_date,
+                preferred_time=preferred_time,
+            )
+            appointments = insert_visits(
+                [
+                    Appointment(
+                        user=user,
+                        dentist=dentist,
+                        branch=branch,
+                        dentist_name=dentist.name,
+                        location=branch.name if branch else "",
+                        date=day,
+                        time=start,
+                        end_time=end,
+                        preferred_date=day,
+                        preferred_time=preferred_time or start,
+                        email=email,
+                        patient=patient,
+                        treatment_plan=plan,
+                        plan_step=i + 1,
+                    )
+                    for i, (day, start, end) in enumerate(picks)
+                ],
+                [step.services for step in steps],
+                actor=actor,
+                note=f"Step {{n}} of {len(steps)} of treatment plan {plan.pk}",
+                refetch=lambda: Appointment.objects.filter(treatment_plan=plan).order_by("plan_step"),
+            )
+            return plan, appointments
+
+    return None, []
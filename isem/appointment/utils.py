@@ -1,117 +1,659 @@
 # utils.py
-def find_next_available_slot(dentist, date, total_duration, preferred_time=None, location=None):
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+
+# Clinic hours and slot grid, in minutes from midnight
+CLINIC_OPEN = 8 * 60
+CLINIC_CLOSE = 17 * 60
+SLOT_STEP = 15
+
+ACTIVE_STATUSES = ["not_arrived", "arrived", "ongoing"]
+
+
+def to_minutes(t):
+    """time -> minutes from midnight."""
+    return t.hour * 60 + t.minute
+
+
+def to_time(minutes):
+    """minutes from midnight -> time."""
+    return time(minutes // 60, minutes % 60)
+
+
+def ceil_to_step(minutes, step=SLOT_STEP):
+    return -(-minutes // step) * step
+
+
+def minutes_not_before(dt, date):
+    """
+    First whole minute on `date` that is not earlier than `dt`
+    (a partial minute counts as the next one, like the old `current < now` check).
     """
-    Greedy slot finder with a simple scoring (points) system.
+    delta = dt - datetime.combine(date, time.min)
+    return -(-delta // timedelta(minutes=1))
 
-    Greedy idea:
-    - Generate candidate start times from clinic_start to clinic_end in 15-min steps.
-    - For each candidate, if it fits (no overlap), compute a score:
-        +10 if >= preferred_time (if provided)
-        + up to +5 the closer it is to preferred_time
-        + higher score for earlier in the day (so we fill earlier slots first)
-    - Return the feasible slot with the highest score (most 'greedy' according to our criteria).
+
+class DaySchedule:
+    """
+    Free intervals of one dentist's day, built once from the booked intervals.
+
+    - Busy intervals are merged, and the free gaps between them are kept
+      sorted as two parallel lists (gap starts / gap ends).
+    - Finding the earliest start that fits a duration is a bisect to the first
+      gap that ends after the lower bound, then a walk over the gaps from there
+      (usually the first one fits), instead of testing every 15-min candidate
+      against every appointment.
+    """
+
+    def __init__(self, busy, open_minute=CLINIC_OPEN, close_minute=CLINIC_CLOSE, step=SLOT_STEP):
+        self.open_minute = open_minute
+        self.close_minute = close_minute
+        self.step = step
+
+        self.gap_starts = []
+        self.gap_ends = []
+
+        cursor = open_minute
+        for start, end in sorted(busy):
+            # a zero-length booking still splits the gap it falls in,
+            # so no slot can straddle it
+            if start > cursor:
+                self._add_gap(cursor, min(start, close_minute))
+            cursor = max(cursor, start, end)
+            if cursor >= close_minute:
+                break
+        self._add_gap(cursor, close_minute)
+
+    def _add_gap(self, start, end):
+        if end > start:
+            self.gap_starts.append(start)
+            self.gap_ends.append(end)
+
+    @classmethod
+    def from_appointments(cls, rows, **kwargs):
+        """
+        Build from (time, end_time) pairs. A missing end_time occupies
+        only its start instant.
+        """
+        busy = []
+        for start, end in rows:
+            start_min = to_minutes(start)
+            end_min = to_minutes(end) if end else start_min
+            busy.append((start_min, end_min))
+        return cls(busy, **kwargs)
+
+    @classmethod
+    def from_gaps(cls, gaps, open_minute=CLINIC_OPEN, close_minute=CLINIC_CLOSE, step=SLOT_STEP):
+        """Rebuild from already computed free gaps (e.g. DentistFreeTime.free)."""
+        schedule = cls([(open_minute, close_minute)], open_minute, close_minute, step)
+        schedule.gap_starts = [start for start, _ in gaps]
+        schedule.gap_ends = [end for _, end in gaps]
+        return schedule
+
+    def earliest_fit(self, duration, not_before=None):
+        """
+        Earliest grid-aligned start (minutes) >= not_before whose
+        [start, start + duration) lies inside one free gap, or None.
+        """
+        lower = self.open_minute if not_before is None else max(not_before, self.open_minute)
+        lower = self.open_minute + ceil_to_step(lower - self.open_minute, self.step)
+
+        # first gap that ends after the lower bound
+        i = bisect_right(self.gap_ends, lower)
+        while i < len(self.gap_starts):
+            start = max(lower, self.gap_starts[i])
+            start = self.open_minute + ceil_to_step(start - self.open_minute, self.step)
+            if start + duration <= self.gap_ends[i]:
+                return start
+            i += 1
+        return None
+
+
+def on_commit_batch(name, items, callback):
+    """
+    callback(set of items) once the current transaction commits, with the
+    items of every on_commit_batch(name, ...) call made in that transaction,
+    so a write touching the same thing many times costs one callback (runs
+    straight away outside a transaction, like on_commit).
+
+    Every call registers a flush and the first to run takes the whole batch.
+    Items of a rolled-back transaction are flushed with the next commit's;
+    callbacks must be safe to repeat.
+    """
+    connection = transaction.get_connection()
+    if not hasattr(connection, "commit_batches"):
+        connection.commit_batches = {}
+    pending = connection.commit_batches
+    pending.setdefault(name, set()).update(items)
+
+    def flush():
+        batch = pending.pop(name, None)
+        if batch:
+            callback(batch)
+
+    transaction.on_commit(flush)
+
+
+def cache_incr(cache, key, amount=1, timeout=None):
+    """
+    Add `amount` to a counter in `cache` and return the new value, creating
+    it (with `timeout`) if missing. incr() and add() are each atomic on
+    locmem, memcached and Redis; retried, they never lose a count when two
+    workers create the counter at once or it expires in between.
     """
-    from datetime import datetime, timedelta
-    from .models import Appointment
+    while True:
+        try:
+            return cache.incr(key, amount)
+        except ValueError:
+            if cache.add(key, amount, timeout=timeout):
+                return amount
+
+
+def client_ip(request):
+    # behind the host's proxy the client is the address it appended last;
+    # anything before that came from the client and can be forged
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+    if forwarded:
+        return forwarded.split(",")[-1].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def anonymous_limit_reached(request, scope):
+    """
+    Count a request to `scope` (e.g. "treatment_plan") against its caller and
+    return True once an anonymous IP has gone past
+    settings.ANONYMOUS_REQUESTS_PER_HOUR this hour. Logged-in users aren't
+    limited. Counted in the schedule cache (shared by every worker once it is
+    memcached or Redis).
+    """
+    from django.conf import settings
+
+    from . import schedule_cache
+
+    if request.user.is_authenticated:
+        return False
+    limit = getattr(settings, "ANONYMOUS_REQUESTS_PER_HOUR", 10)
+    hour = int(datetime.now().timestamp() // 3600)
+    key = f"anon-limit:{scope}:{client_ip(request)}:{hour}"
+    return cache_incr(schedule_cache.get_cache(), key, timeout=3600) > limit
+
+
+def resolve_branch(value):
+    """
+    Branch from a form value: the branch id the forms send now, or a branch
+    name (older forms / legacy `location` strings). None when unknown.
+    """
+    from .models import Branch
+
+    if not value:
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return Branch.objects.filter(pk=int(value)).first()
+    return Branch.objects.filter(name=value).order_by("pk").first()
+
+
+def resolve_dentist(name):
+    """Dentist for a legacy `dentist_name` string, or None."""
+    from .models import Dentist
+
+    if not name:
+        return None
+    return Dentist.objects.filter(name=name.strip()).order_by("pk").first()
+
+
+def complement(windows, open_minute, close_minute):
+    """Parts of [open_minute, close_minute) not covered by `windows`."""
+    outside = []
+    cursor = open_minute
+    for start, end in sorted(windows):
+        if start > cursor:
+            outside.append((cursor, min(start, close_minute)))
+        cursor = max(cursor, end)
+        if cursor >= close_minute:
+            break
+    if cursor < close_minute:
+        outside.append((cursor, close_minute))
+    return outside
+
+
+class DentistDay:
+    """
+    One dentist's occupancy on one date, across every branch.
+
+    - bookings: (start, end, branch_id) of each active appointment, wherever
+      it is, so a booking at one branch blocks the same hour at the others.
+    - windows: {branch_id: [(start, end), ...]} from DentistAvailability for
+      that weekday, i.e. where the dentist can be and when.
+
+    A dentist with no DentistAvailability rows at all keeps the old rule
+    (any branch, clinic hours).
+    """
+
+    def __init__(self, date, bookings, windows, has_availability):
+        self.date = date
+        self.bookings = bookings
+        self.windows = windows
+        self.has_availability = has_availability
+
+    def working_windows(self, branch=None):
+        if not self.has_availability:
+            return [(CLINIC_OPEN, CLINIC_CLOSE)]
+        if branch is None:
+            return sorted(w for branch_windows in self.windows.values() for w in branch_windows)
+        branch_id = getattr(branch, "pk", branch)
+        return sorted(self.windows.get(branch_id, []))
+
+    def bounds(self, windows):
+        """Clinic hours, stretched to cover any availability window outside them."""
+        open_minute = min([CLINIC_OPEN] + [start for start, _ in windows])
+        close_minute = max([CLINIC_CLOSE] + [end for _, end in windows])
+        return open_minute, close_minute
+
+    def unavailable(self, branch=None):
+        """Intervals of the day the dentist is not scheduled at `branch`."""
+        windows = self.working_windows(branch)
+        return complement(windows, *self.bounds(windows))
+
+    def schedule(self, branch=None):
+        """DaySchedule for booking at `branch` (None: any branch they work at)."""
+        windows = self.working_windows(branch)
+        open_minute, close_minute = self.bounds(windows)
+        busy = [(start, end) for start, end, _ in self.bookings]
+        busy += complement(windows, open_minute, close_minute)
+        return DaySchedule(busy, open_minute=open_minute, close_minute=close_minute)
+
+    def payload(self):
+        """The DentistFreeTime / schedule-cache form of this day."""
+        return {
+            "free": self.free_map(),
+            "bookings": [list(booking) for booking in sorted(self.bookings)],
+            "has_availability": self.has_availability,
+        }
+
+    def free_map(self):
+        """Free gaps per branch ("*": any branch), as stored in DentistFreeTime.free."""
+        branches = [None] + (sorted(self.windows) if self.has_availability else [])
+        free = {}
+        for branch_id in branches:
+            schedule = self.schedule(branch_id)
+            free["*" if branch_id is None else str(branch_id)] = {
+                "open": schedule.open_minute,
+                "close": schedule.close_minute,
+                "free": [list(gap) for gap in zip(schedule.gap_starts, schedule.gap_ends)],
+            }
+        return free
+
+
+class MaterializedDay:
+    """
+    DentistDay read back from its DentistFreeTime row: same interface
+    (bookings / schedule() / unavailable()), nothing recomputed.
+    """
+
+    def __init__(self, date, free, bookings, has_availability):
+        self.date = date
+        self.free = free
+        self.bookings = [tuple(b) for b in bookings]
+        self.has_availability = has_availability
 
-    def round_up_to_interval(dt, minutes=15):
-        remainder = dt.minute % minutes
-        if remainder:
-            dt += timedelta(minutes=(minutes - remainder))
-        return dt.replace(second=0, microsecond=0)
+    def payload(self):
+        return {
+            "free": self.free,
+            "bookings": [list(booking) for booking in self.bookings],
+            "has_availability": self.has_availability,
+        }
 
-    clinic_start = datetime.combine(date, datetime.strptime("08:00", "%H:%M").time())
-    clinic_end = datetime.combine(date, datetime.strptime("17:00", "%H:%M").time())
+    def _entry(self, branch):
+        if branch is None:
+            return self.free.get("*")
+        key = str(getattr(branch, "pk", branch))
+        if key in self.free:
+            return self.free[key]
+        # no availability configured: any branch, clinic hours
+        return None if self.has_availability else self.free.get("*")
 
+    def schedule(self, branch=None):
+        entry = self._entry(branch)
+        if entry is None:
+            # not working at this branch today
+            return DaySchedule.from_gaps([])
+        return DaySchedule.from_gaps(entry["free"], entry["open"], entry["close"])
+
+    def unavailable(self, branch=None):
+        entry = self._entry(branch)
+        if entry is None:
+            return [(CLINIC_OPEN, CLINIC_CLOSE)]
+        # neither free nor booked = outside their hours
+        covered = [tuple(gap) for gap in entry["free"]] + [(start, end) for start, end, _ in self.bookings]
+        return complement(covered, entry["open"], entry["close"])
+
+
+class DentistDayCache:
+    """
+    Memo of DentistDay per (dentist, date) for the life of one request (or
+    one search), so the booked-times feed and the slot finder read the same
+    occupancy and nothing is loaded twice:
+
+    - one query per date (or date range) for the bookings of every
+      requested dentist (all branches, by the dentist/date index), and
+    - one query for their DentistAvailability rows (all weekdays), once per
+      dentist.
+
+    Days already materialized in DentistFreeTime are read from there instead
+    (one lookup on its (dentist, date) key); `materialized=False` forces the
+    live queries, which is what rebuilding that table uses.
+
+    `shared=True` puts the cross-request schedule cache (schedule_cache.py)
+    in front of all that; only for read-only lookups, never under the
+    booking lock.
+
+    `exclude` leaves those appointment ids out of the bookings, so moving a
+    booking within its own day can reuse its time; it reads the live
+    bookings (neither DentistFreeTime nor the shared cache know about it).
+    """
+
+    def __init__(self, materialized=True, shared=False, exclude=()):
+        self.exclude = set(exclude)
+        self.materialized = materialized and not self.exclude
+        self.shared = shared and not self.exclude
+        self._days = {}
+        self._availability = {}
+
+    def preload(self, dentist_ids, date):
+        """Load many dentists' days on `date` together (two queries at most)."""
+        self.preload_range(dentist_ids, date, date)
+
+    def preload_range(self, dentist_ids, first, last):
+        """
+        Load every day in [first, last] for many dentists: one query for all
+        their bookings over the range, one for availability not seen yet.
+        """
+        dates = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        wanted = [(d, day) for d in dentist_ids for day in dates if (d, day) not in self._days]
+        if not wanted:
+            return
+
+        if not self.shared:
+            self._load(wanted, first, last)
+            return
+
+        from . import schedule_cache
+
+        found, versions = schedule_cache.get_days(wanted)
+        for (dentist_id, day), payload in found.items():
+            self._days[(dentist_id, day)] = MaterializedDay(day, **payload)
+
+        loaded = [key for key in wanted if key not in found]
+        if loaded:
+            self._load(loaded, first, last)
+            schedule_cache.set_days({key: self._days[key].payload() for key in loaded}, versions)
+
+    def _load(self, wanted, first, last):
+        from .models import Appointment, DentistAvailability, DentistFreeTime
+
+        dentist_ids = sorted({dentist_id for dentist_id, _ in wanted})
+
+        if self.materialized:
+            rows = DentistFreeTime.objects.filter(
+                dentist_id__in=dentist_ids,
+                date__gte=first,
+                date__lte=last,
+            ).values_list("dentist_id", "date", "free", "bookings", "has_availability")
+            for dentist_id, day, free, bookings, has_availability in rows:
+                self._days.setdefault((dentist_id, day), MaterializedDay(day, free, bookings, has_availability))
+            wanted = [key for key in wanted if key not in self._days]
+            if not wanted:
+                return
+            dentist_ids = sorted({dentist_id for dentist_id, _ in wanted})
+
+        missing = [d for d in dentist_ids if d not in self._availability]
+        if missing:
+            for dentist_id in missing:
+                self._availability[dentist_id] = {}
+            rows = DentistAvailability.objects.filter(dentist_id__in=missing).values_list(
+                "dentist_id", "day_of_week", "branch_id", "start_time", "end_time"
+            )
+            for dentist_id, weekday, branch_id, start, end in rows:
+                by_weekday = self._availability[dentist_id]
+                by_weekday.setdefault(weekday, {}).setdefault(branch_id, []).append(
+                    (to_minutes(start), to_minutes(end))
+                )
+
+        bookings = {key: [] for key in wanted}
+        rows = Appointment.objects.filter(
+            dentist_id__in=dentist_ids,
+            date__gte=first,
+            date__lte=last,
+            status__in=ACTIVE_STATUSES,
+        ).exclude(pk__in=self.exclude).values_list("dentist_id", "date", "time", "end_time", "branch_id")
+        for dentist_id, day, start, end, branch_id in rows:
+            if (dentist_id, day) in bookings:
+                start_min = to_minutes(start)
+                bookings[(dentist_id, day)].append((start_min, to_minutes(end) if end else start_min, branch_id))
+
+        for (dentist_id, day), day_bookings in bookings.items():
+            availability = self._availability[dentist_id]
+            self._days[(dentist_id, day)] = DentistDay(
+                day,
+                day_bookings,
+                availability.get(day.weekday(), {}),
+                has_availability=bool(availability),
+            )
+
+    def get(self, dentist, date):
+        dentist_id = getattr(dentist, "pk", dentist)
+        self.preload([dentist_id], date)
+        return self._days[(dentist_id, date)]
+
+
+def lock_dentist_day(dentist, date):
+    """
+    Serialize bookings for one dentist/day. Must run inside transaction.atomic();
+    the lock row is held until that transaction ends, so slot search and the
+    insert that follows it can't interleave with another booking for the day.
+    """
+    from .models import ScheduleLock
+
+    # one query once the day's row exists (the usual case)
+    locked = ScheduleLock.objects.select_for_update().filter(dentist=dentist, date=date)
+    lock = locked.first()
+    if lock is None:
+        ScheduleLock.objects.bulk_create([ScheduleLock(dentist=dentist, date=date)], ignore_conflicts=True)
+        lock = locked.get()
+    return lock
+
+
+def lock_dentist_days(dentist, dates):
+    """
+    lock_dentist_day for many dates at once (recurring series): create the
+    missing lock rows in one insert, then lock them all in date order (the
+    same order every caller uses, so two series can't deadlock).
+    """
+    from .models import ScheduleLock
+
+    dates = sorted(set(dates))
+    ScheduleLock.objects.bulk_create(
+        [ScheduleLock(dentist=dentist, date=day) for day in dates],
+        ignore_conflicts=True,
+    )
+    return list(
+        ScheduleLock.objects.select_for_update()
+        .filter(dentist=dentist, date__in=dates)
+        .order_by("date")
+    )
+
+
+def lock_schedule_days(dentist_ids, dates):
+    """
+    lock_dentist_days for many dentists (availability rebuilds): create the
+    missing lock rows, then lock every (dentist, date) in that order, so a
+    booking can't commit on a day being rebuilt, not even its first one.
+    """
+    from .models import ScheduleLock
+
+    dentist_ids, dates = sorted(set(dentist_ids)), sorted(set(dates))
+    ScheduleLock.objects.bulk_create(
+        [ScheduleLock(dentist_id=dentist_id, date=day) for dentist_id in dentist_ids for day in dates],
+        ignore_conflicts=True,
+        batch_size=500,
+    )
+    list(
+        ScheduleLock.objects.select_for_update()
+        .filter(dentist_id__in=dentist_ids, date__in=dates)
+        .order_by("dentist_id", "date")
+        .values_list("pk", flat=True)
+    )
+
+
+def find_next_available_slot(dentist, date, total_duration, preferred_time=None, branch=None, schedule=None, cache=None):
+    """
+    Greedy slot finder over the dentist's free intervals for the day
+    (bookings at every branch count; only their availability windows at
+    `branch` are open).
+
+    Greedy idea:
+    - Candidate starts are 15-min steps between clinic_start and clinic_end
+      that fit fully inside a free gap (no overlap), and are not in the past.
+    - If a preferred_time is given, pick the earliest feasible slot at or
+      after it (clamped to now for today).
+    - Otherwise, or when nothing fits after it, fall back to the earliest
+      feasible slot of the day.
+
+    `schedule` lets callers pass an already built DaySchedule; `cache` a
+    DentistDayCache shared with other lookups in the same request.
+    Returns (start_time, end_time) or (None, None).
+    """
     now = datetime.now()
 
     # Hard stop: no past dates
     if date < now.date():
         return None, None
 
-    # Starting point baseline
-    baseline = clinic_start
+    if schedule is None:
+        schedule = (cache or DentistDayCache()).get(dentist, date).schedule(branch)
+
+    preferred, earliest = candidate_starts(schedule, date, total_duration, preferred_time, now)
+
+    # Fallback: no slot >= preferred; pick earliest overall
+    start = earliest if preferred is None else preferred
+    if start is None:
+        return None, None
+
+    return to_time(start), to_time(start + total_duration)
+
+
+def candidate_starts(schedule, date, total_duration, preferred_time, now):
+    """
+    (earliest start at/after preferred_time, earliest start of the day) in
+    minutes, either may be None. Nothing before `now` counts for today.
+    """
+    # Today: nothing before the current time
+    floor = minutes_not_before(now, date) if date == now.date() else None
 
-    # If a preferred_time is provided, use it as a reference for scoring
-    preferred_dt = None
+    preferred = None
     if preferred_time:
         preferred_dt = datetime.combine(date, preferred_time)
-        # if today and preferred is in the past, clamp to now
         if date == now.date() and preferred_dt < now:
             preferred_dt = now
+        preferred = schedule.earliest_fit(total_duration, minutes_not_before(preferred_dt, date))
 
-    # Fetch existing relevant appointments once (greedy interval check)
-    existing = Appointment.objects.filter(
-        dentist_name=dentist.name,
-        date=date,
-        location=location,
-        status__in=["not_arrived", "arrived", "ongoing"]
-    ).order_by("time")
-
-    duration = timedelta(minutes=total_duration)
-
-    candidates = []
-
-    # Generate all 15-min candidate starts within clinic hours
-    current = round_up_to_interval(clinic_start)
-    while current + duration <= clinic_end:
-        # Skip past times if date is today
-        if date == now.date() and current < now:
-            current += timedelta(minutes=15)
-            continue
-
-        # Check overlap with existing appointments
-        overlaps = False
-        for appt in existing:
-            appt_start = datetime.combine(date, appt.time)
-            appt_end = datetime.combine(date, appt.end_time)
-            # overlap if they intersect
-            if not (current + duration <= appt_start or current >= appt_end):
-                overlaps = True
-                break
+    return preferred, schedule.earliest_fit(total_duration, floor)
 
-        if not overlaps:
-                # Candidate is feasible – compute greedy score (points)
-            score = 0
 
-            # 1) Prefer starting at or after preferred time (if any)
-            if preferred_dt:
-                if current >= preferred_dt:
-                    score += 20  # strong preference: do not go earlier than requested
+def eligible_dentists(service_ids):
+    """
+    Active dentists who offer every one of `service_ids` (DentistService).
+    Dentists with no DentistService rows at all are treated as offering
+    everything, like the single-dentist form always has.
+    """
+    from django.db.models import Count, Q
 
-                # 2) Closeness to preferred time: closer gets more points
-                diff_minutes = abs((current - preferred_dt).total_seconds()) / 60.0
-                if diff_minutes <= 60:
-                    # 0, 5, 4, 3, 2, 1 as it moves away in 12‑minute steps
-                    score += int(5 - diff_minutes // 12)
+    from .models import Dentist
 
-            # 3) Strong preference for earlier in the day
-            # Map 08:00 -> +10, 17:00 -> 0
-            day_fraction = (current - clinic_start) / (clinic_end - clinic_start)
-            score += int(10 * (1.0 - day_fraction))
+    service_ids = {int(s) for s in service_ids}
+    return (
+        Dentist.objects.filter(is_active=True)
+        .annotate(
+            offered=Count("dentist_services", distinct=True),
+            matched=Count(
+                "dentist_services",
+                filter=Q(dentist_services__service_id__in=service_ids),
+                distinct=True,
+            ),
+        )
+        .filter(Q(matched=len(service_ids)) | Q(offered=0))
+        .order_by("pk")
+    )
 
-            candidates.append((score, current))
 
+def find_earliest_any_dentist(dentists, date, total_duration, preferred_time=None, branch=None, cache=None):
+    """
+    Best slot at `branch` over several dentists: the earliest start at/after
+    preferred_time across all of them, else the earliest of the day. Ties go
+    to the dentist with fewer bookings that day, then the lower id.
+
+    All dentist-days are loaded together (DentistDayCache.preload: one query
+    for the bookings, one for availability), then each merged free-interval
+    list is bisected once.
+
+    Returns (dentist, start_time, end_time) or (None, None, None).
+    """
+    now = datetime.now()
+    if date < now.date():
+        return None, None, None
 
-        current += timedelta(minutes=15)
+    dentists = list(dentists)
+    cache = cache or DentistDayCache()
+    cache.preload([d.pk for d in dentists], date)
 
+    # (start, bookings that day, dentist id, dentist) so min() applies the tie-breaks
+    at_preferred, anytime = [], []
+    for dentist in dentists:
+        day = cache.get(dentist, date)
+        preferred, earliest = candidate_starts(
+            day.schedule(branch), date, total_duration, preferred_time, now
+        )
+        if preferred is not None:
+            at_preferred.append((preferred, len(day.bookings), dentist.pk, dentist))
+        if earliest is not None:
+            anytime.append((earliest, len(day.bookings), dentist.pk, dentist))
+
+    candidates = at_preferred or anytime
     if not candidates:
-        return None, None
+        return None, None, None
+    start, _, _, dentist = min(candidates, key=lambda c: c[:3])
+    return dentist, to_time(start), to_time(start + total_duration)
 
-    # If we have a preferred time, first try to pick the earliest feasible slot >= preferred
-    if preferred_dt:
-        after_pref = [c for c in candidates if c[1] >= preferred_dt]
-        if after_pref:
-            after_pref.sort(key=lambda x: x[1])  # earliest time
-            best_score, best_start = after_pref[0]
-            best_end = best_start + duration
-            print(f"[GREEDY] Picked slot {best_start.time()}–{best_end.time()} (>= preferred)")
-            return best_start.time(), best_end.time()
 
-    # Fallback: no slot >= preferred; pick earliest overall
-    candidates.sort(key=lambda x: x[1])
-    best_score, best_start = candidates[0]
-    best_end = best_start + duration
-    print(f"[GREEDY] Picked slot {best_start.time()}–{best_end.time()} (fallback earliest)")
-    return best_start.time(), best_end.time()
+def find_open_slots(dentists, first_date, days, total_duration, preferred_time=None, branch=None, limit=5, cache=None):
+    """
+    First `limit` bookable slots from `first_date` over `days` days, one per
+    day, each picked with the same rule as find_next_available_slot (at or
+    after preferred_time, else the earliest of that day). With several
+    dentists, each day's slot goes to whoever find_earliest_any_dentist picks.
+
+    The whole horizon is loaded up front in one bookings query, then the days
+    are swept in order until `limit` slots are found.
+
+    Returns a list of (date, dentist, start_time, end_time).
+    """
+    dentists = list(dentists)
+    first_date = max(first_date, datetime.now().date())
+    last_date = first_date + timedelta(days=days - 1)
+
+    cache = cache or DentistDayCache()
+    cache.preload_range([d.pk for d in dentists], first_date, last_date)
 
+    slots = []
+    day = first_date
+    while day <= last_date and len(slots) < limit:
+        dentist, start, end = find_earliest_any_dentist(
+            dentists, day, total_duration, preferred_time, branch=branch, cache=cache
+        )
+        if dentist is not None:
+            slots.append((day, dentist, start, end))
+        day += timedelta(days=1)
+    return slots
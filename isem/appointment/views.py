@@ -1,47 +1,60 @@
 import json
+import logging
 from datetime import datetime, timedelta
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
+from django.core.handlers.asgi import ASGIRequest
 from django.core.mail import send_mail
-from django.db import transaction
-from django.db.models import Case, When, IntegerField
-from django.http import JsonResponse
+from django.db import IntegrityError
+from django.db.models import Case, IntegerField, Prefetch, When
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
 from billing.models import BillingRecord
-from patient.models import Patient
 
+from . import booking, calendar_version, live, schedule_cache, series, treatment_plan
 from .forms import AppointmentForm
-from .models import Dentist, Service, Appointment, AppointmentLog,Branch
-from .utils import find_next_available_slot
+from .models import Dentist, Service, Appointment, AppointmentLog, AppointmentSeries, Branch, WaitlistEntry
+from .utils import (
+    DentistDayCache,
+    anonymous_limit_reached,
+    eligible_dentists,
+    find_earliest_any_dentist,
+    find_next_available_slot,
+    find_open_slots,
+    resolve_branch,
+    resolve_dentist,
+    to_time,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# value of the dentist <select> for "whoever is free first"
+ANY_DENTIST = "any"
 
 
 @csrf_exempt
 @require_POST
 def update_status(request, appointment_id):
     try:
-        # DEBUGS
-        print("=" * 50)
-        print("UPDATE_STATUS VIEW CALLED")
-        print(f"Appointment ID: {appointment_id}")
-        print(f"Request body: {request.body}")
-        print(f"Content-Type: {request.META.get('CONTENT_TYPE')}")
-
         data = json.loads(request.body)
         status = data.get("status")
-        print(f"Parsed status: {status}")
 
-        appointment = Appointment.objects.get(id=appointment_id)
+        appointment = Appointment.objects.select_related("patient").get(id=appointment_id)
 
         old_status = appointment.status
         new_status = status
 
         appointment.status = new_status
-        print(f"Found appointment: {appointment}")
-        appointment.save()
+        appointment.save(update_fields=["status"])
 
         # create log only if status actually changed
         if old_status != new_status:
@@ -54,57 +67,30 @@ def update_status(request, appointment_id):
                 note=f"Status changed from {old_status} to {new_status}",
             )
 
-        print(f"✓ Appointment status updated to: {status}")
-
         # If status is 'done', create a billing record
         if status == "done":
             if not BillingRecord.objects.filter(appointment=appointment).exists():
-                print("No existing billing record, creating one...")
-                patient = None
-
-                if appointment.email:
-                    patient = Patient.objects.filter(email=appointment.email).first()
-                    print(f"Found patient: {patient}")
+                patient = booking.patient_for(appointment)
 
                 if patient:
-                    total_amount = sum(
-                        (service.price or 0)
-                        for service in appointment.services.all()
-                    )
-
-                    service_names = ", ".join(
-                        [s.service_name for s in appointment.services.all()]
-                    )
-                    print(
-                        f"Creating billing: amount={total_amount}, "
-                        f"type={service_names}"
-                    )
-
                     BillingRecord.objects.create(
                         patient=patient,
                         appointment=appointment,
-                        type=service_names,
-                        amount=total_amount,
+                        type=appointment.service_names,
+                        amount=appointment.total_price,
                         date_issued=timezone.now(),
                     )
-                    print("✓ Billing record created")
                 else:
-                    print("⚠ No patient found, billing not created")
-            else:
-                print("Billing record already exists.")
+                    logger.warning("No patient for appointment %s, billing not created", appointment_id)
 
-        print(">>> Returning success response")
         return JsonResponse({"success": True, "status": status})
 
     except Appointment.DoesNotExist:
-        print(f"❌ Appointment {appointment_id} not found")
         return JsonResponse(
             {"success": False, "error": "Appointment not found"}, status=404
         )
     except Exception as e:
-        print(f"❌ ERROR: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Status update failed for appointment %s", appointment_id)
         return JsonResponse({"success": False, "error": str(e)}, status=400)
 
 
@@ -188,50 +174,37 @@ def create_followup(request):
         messages.error(request, "You cannot create a follow-up in the past.")
         return redirect("appointment:appointment_page")
 
-    # Reuse original dentist/location/services/email
-    dentist_name = original.dentist_name
-    location = original.location
+    # Reuse original dentist/branch/services/email
+    dentist = original.dentist or resolve_dentist(original.dentist_name)
+    branch = original.branch or resolve_branch(original.location)
+    if dentist is None:
+        messages.error(request, "The original appointment has no dentist assigned.")
+        return redirect("appointment:appointment_page")
+
     selected_services = list(original.services.all())
-    total_minutes = sum(s.duration for s in selected_services)
 
-    # Find a valid slot using your existing util
-    with transaction.atomic():
-        start_time, end_time = find_next_available_slot(
-        Dentist.objects.get(name=dentist_name),
+    # Find a valid slot and book it while holding the dentist/day lock
+    followup = booking.book_appointment(
+        dentist,
+        branch,
+        selected_services,
+        original.email,
         date_obj,
-        total_minutes,
         time_obj,
-        location=location,
+        user=request.user if request.user.is_authenticated else original.user,
+        actor=request.user if request.user.is_authenticated else None,
+        note=f"Follow-up created from appointment {original.id}",
+        location=original.location,
+        patient=booking.patient_for(original),
     )
 
-    if not start_time or not end_time:
+    if followup is None:
         messages.error(
             request,
             "No available time slot for the selected follow-up date and services.",
         )
         return redirect("appointment:appointment_page")
 
-    followup = Appointment.objects.create(
-        user=request.user if request.user.is_authenticated else original.user,
-        dentist_name=dentist_name,
-        location=location,
-        date=date_obj,
-        time=start_time,
-        end_time=end_time,
-        preferred_date=date_obj,
-        preferred_time=time_obj,
-        email=original.email,
-    )
-    followup.services.set(selected_services)
-    
-    AppointmentLog.objects.create(
-        appointment=followup,
-        action="created",
-        new_status=followup.status,
-        actor=request.user if request.user.is_authenticated else None,
-        note=f"Follow-up created from appointment {original.id}",
-    )
-
     messages.add_message(
         request,
         messages.SUCCESS,
@@ -266,9 +239,8 @@ def appointment_page(request):
         email = request.POST.get("email")
 
         service_ids = request.POST.getlist("services")
-        selected_services = Service.objects.filter(id__in=service_ids)
+        selected_services = list(Service.objects.filter(id__in=service_ids))
 
-        dentist = Dentist.objects.get(id=dentist_id)
         branch_obj = Branch.objects.get(id=branch_id)   # <-- get Branch instance
 
         date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
@@ -279,66 +251,52 @@ def appointment_page(request):
         preferred_time = datetime.strptime(time_str, "%H:%M").time()
         total_minutes = sum(s.duration for s in selected_services)
 
-        # We will use branch name as the location key for your greedy util
-        location_key = branch_obj.name
-
-        # Create or find patient by email (keep your existing code)
-        patient = None
-        if email:
-            patient = Patient.objects.filter(email=email).first()
-            if not patient:
-                total = Patient.objects.filter(is_guest=True).count() + 1
-                temp_id = f"P-{total:06d}-T"
-                patient = Patient.objects.create(
-                    name=email.split("@")[0] or "Guest Patient",
-                    email=email,
-                    address="TBD",
-                    telephone="00000000000",
-                    age=0,
-                    occupation="",
-                    is_guest=True,
-                    guest_id=temp_id,
-                )
-
-        with transaction.atomic():
-            start_time, end_time = find_next_available_slot(
-                dentist,
+        if dentist_id == ANY_DENTIST:
+            # Pick the dentist with the best slot; the locked search below
+            # re-checks it for that dentist
+            dentist, _, _ = find_earliest_any_dentist(
+                eligible_dentists(service_ids),
                 date_obj,
                 total_minutes,
                 preferred_time,
-                location=location_key,
+                branch=branch_obj,
+                cache=DentistDayCache(shared=True),
             )
+            if dentist is None:
+                messages.error(request, "No dentist has an available slot for the selected date and services.")
+                return redirect("appointment:appointment_page")
+        else:
+            dentist = Dentist.objects.get(id=dentist_id)
 
-        if not start_time or not end_time:
-            messages.error(
-                request,
-                "No available time slot for the selected date and services.",
+        repeat = request.POST.get("repeat")
+        if repeat in dict(AppointmentSeries.FREQUENCY_CHOICES):
+            return book_series_from_form(
+                request, dentist, branch_obj, selected_services, email,
+                date_obj, preferred_time, repeat,
             )
-            return redirect("appointment:appointment_page")
 
-        appointment = Appointment.objects.create(
+        # Slot search + insert run under the dentist/day lock; the patient
+        # (a new guest for an unknown email) is only resolved once a slot is found
+        appointment = booking.book_appointment(
+            dentist,
+            branch_obj,
+            selected_services,
+            email,
+            date_obj,
+            preferred_time,
             user=request.user if request.user.is_authenticated else None,
-            dentist=dentist,                 # <-- set FK
-            branch=branch_obj,               # <-- set FK
-            dentist_name=dentist.name,       # legacy text
-            location=location_key,           # branch name string
-            date=date_obj,
-            time=start_time,
-            end_time=end_time,
-            preferred_date=date_obj,
-            preferred_time=preferred_time,
-            email=email,
-        )
-        appointment.services.set(selected_services)
-
-        AppointmentLog.objects.create(
-            appointment=appointment,
-            action="created",
-            new_status=appointment.status,
             actor=request.user if request.user.is_authenticated else None,
             note="Appointment created from appointment_page",
+            create_patient=True,
         )
 
+        if appointment is None:
+            messages.error(
+                request,
+                "No available time slot for the selected date and services.",
+            )
+            return redirect("appointment:appointment_page")
+
         messages.add_message(
             request,
             messages.SUCCESS,
@@ -362,66 +320,263 @@ def appointment_page(request):
     })
 
 
-# Mainly for pre-Displaying or-prefilling Sruff, REQUEST
-def events(request):
-    branch = request.GET.get("branch")
+EVENT_COLORS = {
+    "not_arrived": "gray",
+    "arrived": "blue",
+    "ongoing": "gold",
+    "done": "green",
+    "cancelled": "red",
+}
 
-    # Decide if this user can manage appointments
-    user = request.user
-    is_admin = user.is_authenticated and (user.is_superuser or user.is_staff)
 
-    # Base queryset: nothing if not logged in
-    if not user.is_authenticated:
-        appointments = Appointment.objects.none()
-    else:
-        # Admin/staff see all, normal users see only their own
-        if is_admin:
-            appointments = Appointment.objects.all()
-        else:
-            appointments = Appointment.objects.filter(user=user)
+def parse_window_date(value):
+    """FullCalendar sends ISO strings ("2026-01-01T00:00:00+08:00"); keep the date part."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
 
 
-    if branch:
-        appointments = appointments.filter(location=branch)
-        appointments = appointments.filter(branch__name=branch)
+def serialize_events(appointments, is_admin):
+    """
+    Appointments -> FullCalendar event dicts, in a fixed number of queries:
+    one for appointments + dentist/branch, one for their service ids.
+    """
+    appointments = appointments.select_related("dentist", "branch").prefetch_related(
+        Prefetch("services", queryset=Service.objects.only("id"))
+    )
 
     events = []
     for a in appointments:
-        color_map = {
-            "not_arrived": "gray",
-            "arrived": "blue",
-            "ongoing": "gold",
-            "done": "green",
-            "cancelled": "red",
-        }
-
-        service_names = ", ".join([s.service_name for s in a.services.all()])
-        service_ids = list(a.services.values_list("id", flat=True))
-        dentist_obj = Dentist.objects.filter(name=a.dentist_name).first()
+        service_names = a.service_names
+        dentist_name = a.dentist.name if a.dentist else a.dentist_name
 
         events.append({
             "id": str(a.id),
-            "title": f"{service_names} - {(a.dentist.name if a.dentist else a.dentist_name) or 'N/A'}",
+            "title": f"{service_names} - {dentist_name or 'N/A'}",
             "start": f"{a.date}T{a.time}",
             "end": f"{a.date}T{a.end_time}" if a.end_time else None,
-            "color": color_map.get(a.status, "gray"),
+            "color": EVENT_COLORS.get(a.status, "gray"),
             "extendedProps": {
-                "dentist": a.dentist.name if a.dentist else a.dentist_name,
-                "dentist_id": a.dentist.id if a.dentist else None,
+                "dentist": dentist_name,
+                "dentist_id": a.dentist_id,
+                "branch_id": a.branch_id,
                 "location": a.branch.name if a.branch else a.location,
                 "date": str(a.date),
                 "time": a.time.strftime("%I:%M %p"),
                 "preferred_date": str(a.preferred_date) if a.preferred_date else None,
                 "preferred_time": a.preferred_time.strftime("%I:%M %p") if a.preferred_time else None,
                 "service": service_names,
-                "service_ids": service_ids,
+                "service_ids": [s.id for s in a.services.all()],
                 "email": a.email,
                 "status": a.status,
                 "can_manage": is_admin,
             }
         })
+    return events
+
+
+def book_series_from_form(request, dentist, branch, services, email, date_obj, preferred_time, frequency):
+    """Repeat section of the add-appointment form: book the whole series."""
+    try:
+        count = int(request.POST.get("repeat_count") or 0)
+    except ValueError:
+        count = 0
+    if not 2 <= count <= series.MAX_OCCURRENCES:
+        messages.error(request, f"A series needs between 2 and {series.MAX_OCCURRENCES} visits.")
+        return redirect("appointment:appointment_page")
+
+    shift_policy = request.POST.get("repeat_policy") or "next_day"
+    if shift_policy not in dict(AppointmentSeries.SHIFT_CHOICES):
+        shift_policy = "next_day"
+
+    try:
+        booked_series, appointments, skipped = series.book_series(
+            dentist,
+            branch,
+            services,
+            email,
+            date_obj,
+            preferred_time,
+            frequency,
+            count,
+            shift_policy=shift_policy,
+            create_patient=True,
+            user=request.user if request.user.is_authenticated else None,
+            actor=request.user if request.user.is_authenticated else None,
+        )
+    except IntegrityError:
+        # the overlap guard caught a clash the slot search didn't see
+        booked_series = None
+
+    if booked_series is None:
+        messages.error(request, "No available time slot for any visit of the series.")
+        return redirect("appointment:appointment_page")
+
+    shifted = sum(1 for appt in appointments if appt.date != appt.preferred_date)
+    summary = f"Series booked: {len(appointments)} visit(s)"
+    if shifted:
+        summary += f", {shifted} moved to the next day with room"
+    if skipped:
+        summary += f", {len(skipped)} skipped ({', '.join(d.strftime('%b %d') for d in skipped)})"
+    messages.add_message(request, messages.SUCCESS, summary + ".", extra_tags="appointment_created")
+    return redirect("appointment:appointment_page")
+
+
+def calendar_scope(user, branch=None, start=None, end=None):
+    """
+    (scope, appointments, is_admin): `scope` is every appointment the user
+    may see, `appointments` narrows it to the branch and date window.
+    """
+    # Decide if this user can manage appointments
+    is_admin = user.is_authenticated and (user.is_superuser or user.is_staff)
+
+    # Base queryset: nothing if not logged in
+    if not user.is_authenticated:
+        scope = Appointment.objects.none()
+    else:
+        # Admin/staff see all, normal users see only their own
+        if is_admin:
+            scope = Appointment.objects.all()
+        else:
+            scope = Appointment.objects.filter(user=user)
+
+    appointments = scope
+    if start:
+        appointments = appointments.filter(date__gte=start)
+    if end:
+        appointments = appointments.filter(date__lt=end)
+
+    if branch:
+        appointments = appointments.filter(branch__name=branch)
+
+    return scope, appointments, is_admin
+
+
+def calendar_delta(scope, appointments, since, cursor, is_admin):
+    """
+    What changed in (since, cursor]: `scope` is everything the user may see,
+    `appointments` the branch/window view of it.
+    """
+    changed_ids = set(
+        AppointmentLog.objects.filter(
+            id__gt=since,
+            id__lte=cursor,
+            appointment__in=scope,
+        ).values_list("appointment_id", flat=True)
+    )
+    events = serialize_events(appointments.filter(id__in=changed_ids), is_admin) if changed_ids else []
+    # changed but now outside this window/branch (e.g. rescheduled away)
+    removed = changed_ids - {int(e["id"]) for e in events}
+
+    return {
+        "cursor": cursor,
+        "events": events,
+        "removed": [str(i) for i in sorted(removed)],
+    }
+
+
+def compact_json(data):
+    # compact separators: this feed is refetched after every status change
+    return JsonResponse(data, safe=False, json_dumps_params={"separators": (",", ":")})
+
+
+# Mainly for pre-Displaying or-prefilling Sruff, REQUEST
+def events(request):
+    """
+    Calendar feed for the visible window (FullCalendar's `start`/`end`,
+    end exclusive).
+
+    - Full mode answers If-None-Match / If-Modified-Since with 304 while the
+      branch's calendar version (calendar_version.py) hasn't moved, and
+      sends the current cursor in X-Calendar-Cursor.
+    - `?since=<cursor>` returns only appointments logged after the cursor:
+      {"cursor": ..., "events": [...], "removed": [ids no longer in view]}.
+    """
+    since = request.GET.get("since")
+    user = request.user
+    scope, appointments, is_admin = calendar_scope(
+        user,
+        branch=request.GET.get("branch"),
+        start=parse_window_date(request.GET.get("start")),
+        end=parse_window_date(request.GET.get("end")),
+    )
+
+    cursor = calendar_version.latest_cursor()
+
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+        return compact_json(calendar_delta(scope, appointments, since, cursor, is_admin))
+
+    # The URL already carries window and branch; the user decides the scope
+    version = calendar_version.current(request.GET.get("branch"))
+    etag = quote_etag(f"{user.pk or 0}-{version['version'] or 0}")
+    last_modified = version["changed_at"]
+    last_modified_ts = int(last_modified.timestamp()) if last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified_ts)
+    if response is None:
+        response = compact_json(serialize_events(appointments, is_admin))
+
+    response["ETag"] = etag
+    if last_modified_ts:
+        response["Last-Modified"] = http_date(last_modified_ts)
+    response["X-Calendar-Cursor"] = str(cursor)
+    # let the browser keep the body but revalidate every time
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+async def live_schedule(request):
+    """
+    Server-Sent Events stream of calendar deltas for one branch
+    (`?branch=`, empty for all). Each message has the same shape as the
+    events feed's `?since=` answer; the message id is the cursor, so a
+    reconnecting EventSource resumes from Last-Event-ID.
+
+    Needs the ASGI server. Under WSGI the stream would pin a worker, so it
+    answers 204, which tells EventSource to stop.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=204)
+
+    scope, appointments, is_admin = calendar_scope(user, branch=request.GET.get("branch"))
+
+    try:
+        cursor = int(request.headers.get("Last-Event-ID") or request.GET.get("since") or 0)
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+    if not cursor:
+        cursor = await sync_to_async(calendar_version.latest_cursor)()
+
+    async def stream():
+        since = cursor
+        yield "retry: 5000\n\n"
+
+        async for latest in live.get_broker().listen(since):
+            if latest is None:
+                yield ": keep-alive\n\n"
+                continue
+            delta = await sync_to_async(calendar_delta)(scope, appointments, since, latest, is_admin)
+            if delta["events"] or delta["removed"]:
+                yield live.sse_frame(json.dumps(delta, separators=(",", ":")), event_id=latest)
+            since = latest
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
-    return JsonResponse(events, safe=False)
 
 #gets the booked time 
 def get_booked_times(request):
@@ -431,25 +586,35 @@ def get_booked_times(request):
 
     if not (dentist_id and date_str and branch_id):
         return JsonResponse({"error": "Missing parameters"}, status=400)
+    if not (dentist_id.isdigit() and branch_id.isdigit()):
+        return JsonResponse({"error": "Invalid dentist or location"}, status=400)
 
     try:
         date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
     except ValueError:
         return JsonResponse({"error": "Invalid date"}, status=400)
 
-    # Filter by FK ids instead of name + location string
-    appointments = Appointment.objects.filter(
-        dentist_id=dentist_id,
-        branch_id=branch_id,
-        date=date_obj,
-    ).exclude(status="cancelled")
+    # Same occupancy the slot finder uses: the dentist's bookings at every
+    # branch, plus the hours they are not scheduled at this branch
+    day = DentistDayCache(shared=True).get(int(dentist_id), date_obj)
 
     booked = [
         {
-            "start": a.time.strftime("%H:%M"),
-            "end": a.end_time.strftime("%H:%M") if a.end_time else None,
+            "start": to_time(start).strftime("%H:%M"),
+            "end": to_time(end).strftime("%H:%M") if end > start else None,
+            "branch": booking_branch,
+            "reason": "booked",
         }
-        for a in appointments
+        for start, end, booking_branch in sorted(day.bookings)
+    ]
+    booked += [
+        {
+            "start": to_time(start).strftime("%H:%M"),
+            "end": to_time(end).strftime("%H:%M"),
+            "branch": None,
+            "reason": "unavailable",
+        }
+        for start, end in day.unavailable(int(branch_id))
     ]
 
     return JsonResponse({"booked": booked})
@@ -461,13 +626,15 @@ def reschedule_appointment(request, appointment_id):
     appt = Appointment.objects.get(id=appointment_id)
 
     dentist = Dentist.objects.get(id=request.POST.get("dentist"))
-    location = request.POST.get("location")
+    branch = resolve_branch(request.POST.get("location"))
+    if branch is None:
+        return JsonResponse({"success": False, "error": "Unknown location"}, status=400)
     date_str = request.POST.get("date")
     time_str = request.POST.get("time")
     email = request.POST.get("email")
 
     service_ids = request.POST.getlist("services")
-    selected_services = Service.objects.filter(id__in=service_ids)
+    selected_services = list(Service.objects.filter(id__in=service_ids))
 
     try:
         date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
@@ -478,44 +645,22 @@ def reschedule_appointment(request, appointment_id):
     if date_obj < datetime.now().date():
         return JsonResponse({"success": False, "error": "You cannot reschedule in the past."}, status=400)
 
-    total_minutes = sum(s.duration for s in selected_services)
-
-    with transaction.atomic():
-        start_time, end_time = find_next_available_slot(
+    rescheduled = booking.reschedule_appointment(
+        appt,
         dentist,
+        branch,
+        selected_services,
+        email,
         date_obj,
-        total_minutes,
         preferred_time,
-        location=location,
+        actor=request.user if request.user.is_authenticated else None,
     )
-
-    if not start_time or not end_time:
+    if not rescheduled:
         return JsonResponse({
             "success": False,
             "error": "No available time slot for the selected date and services."
         }, status=400)
 
-    appt.dentist_name = dentist.name
-    appt.location = location
-    appt.date = date_obj
-    appt.time = start_time
-    appt.end_time = end_time
-    appt.preferred_date = date_obj
-    appt.preferred_time = preferred_time
-    appt.email = email
-    appt.services.set(selected_services)
-    appt.save()
-
-    AppointmentLog.objects.create(
-        appointment=appt,
-        action="rescheduled",
-        old_status=None,
-        new_status=appt.status,
-        actor=request.user if request.user.is_authenticated else None,
-        note=f"Rescheduled to {date_obj} {start_time} at {location}",
-    )
-
-
     messages.success(request, "Appointment rescheduled successfully!")
     return JsonResponse({"success": True})
 
@@ -530,32 +675,18 @@ def get_appointment_details(request, appointment_id):
         patient = None
         patient_id = None
         if appointment.email:
-            patient = Patient.objects.filter(email=appointment.email).first()
-            if not patient:
-                # Create patient if doesn't exist (for older appointments)
-                total = Patient.objects.filter(is_guest=True).count() + 1
-                temp_id = f"P-{total:06d}-T"
-                patient = Patient.objects.create(
-                    name=appointment.email.split("@")[0] or "Guest Patient",
-                    email=appointment.email,
-                    address="TBD",
-                    telephone="00000000000",
-                    age=0,
-                    occupation="",
-                    is_guest=True,
-                    guest_id=temp_id
-                )
+            # creates a guest patient for older appointments that have none
+            patient = booking.patient_for(appointment, create=True)
             if patient:
                 patient_id = patient.id
         
-        # Services and prices
-        service_qs = appointment.services.all()
-        service_names = ", ".join([s.service_name for s in service_qs])
-        service_ids = list(service_qs.values_list("id", flat=True))
+        # Services and prices (names and total are stored on the appointment)
+        service_names = appointment.service_names
+        service_ids = list(appointment.services.values_list("id", flat=True))
         # Sum of prices for Total Amount Due
-        total_price = sum((s.price or 0) for s in service_qs)
+        total_price = appointment.total_price
 
-        dentist_obj = Dentist.objects.filter(name=appointment.dentist_name).first()
+        dentist_obj = appointment.dentist or resolve_dentist(appointment.dentist_name)
         
         # Check if user is admin or staff
         is_admin_or_staff = request.user.is_authenticated and (request.user.is_staff or request.user.is_superuser)
@@ -564,9 +695,10 @@ def get_appointment_details(request, appointment_id):
             "success": True,
             "appointment": {
                 "id": appointment.id,
-                "dentist": appointment.dentist_name,
+                "dentist": dentist_obj.name if dentist_obj else appointment.dentist_name,
                 "dentist_id": dentist_obj.id if dentist_obj else None,
-                "location": appointment.location,
+                "branch_id": appointment.branch_id,
+                "location": appointment.branch.name if appointment.branch else appointment.location,
                 "date": str(appointment.date),
                 "time": appointment.time.strftime("%H:%M"),
                 "preferred_date": str(appointment.preferred_date) if appointment.preferred_date else None,
@@ -598,6 +730,8 @@ def precompute_appointment_slot(request):
     """
     Given dentist, services, date, preferred time, location,
     return the actual start/end time that the algorithm will pick.
+    dentist="any" searches every dentist eligible for the services and
+    also returns the one picked.
     """
     try:
         dentist_id = request.POST.get("dentist")
@@ -609,19 +743,35 @@ def precompute_appointment_slot(request):
         if not (dentist_id and location and date_str and time_str and service_ids):
             return JsonResponse({"success": False, "error": "Missing fields"}, status=400)
 
-        dentist = Dentist.objects.get(id=dentist_id)
+        branch = resolve_branch(location)
+        if branch is None:
+            return JsonResponse({"success": False, "error": "Unknown location"}, status=400)
         date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
         preferred_time = datetime.strptime(time_str, "%H:%M").time()
         selected_services = Service.objects.filter(id__in=service_ids)
         total_minutes = sum(s.duration for s in selected_services)
 
-        with transaction.atomic():
+        # advisory lookup: served from the schedule cache
+        cache = DentistDayCache(shared=True)
+        if dentist_id == ANY_DENTIST:
+            # every eligible dentist in one pass instead of one request each
+            dentist, start_time, end_time = find_earliest_any_dentist(
+                eligible_dentists(service_ids),
+                date_obj,
+                total_minutes,
+                preferred_time,
+                branch=branch,
+                cache=cache,
+            )
+        else:
+            dentist = Dentist.objects.get(id=dentist_id)
             start_time, end_time = find_next_available_slot(
                 dentist,
                 date_obj,
                 total_minutes,
                 preferred_time,
-                location=location,
+                branch=branch,
+                cache=cache,
             )
 
         if not start_time or not end_time:
@@ -635,6 +785,245 @@ def precompute_appointment_slot(request):
             "date": date_obj.strftime("%Y-%m-%d"),
             "start_time": start_time.strftime("%H:%M"),
             "end_time": end_time.strftime("%H:%M"),
+            "dentist_id": dentist.id,
+            "dentist": dentist.name,
         })
     except Exception as e:
         return JsonResponse({"success": False, "error": str(e)}, status=400)
+
+
+def next_available_slots(request):
+    """
+    First N bookable slots over the next `days` days, one per day, for a
+    dentist (or dentist=any) at a branch for the selected services:
+
+        GET ?dentist=3&location=1&services=2&services=5&date=2025-01-06&time=09:00&days=14&limit=5
+
+    date defaults to today and time is the preferred start (optional).
+    """
+    dentist_id = request.GET.get("dentist")
+    service_ids = request.GET.getlist("services")
+    branch = resolve_branch(request.GET.get("location"))
+
+    if not (dentist_id and service_ids):
+        return JsonResponse({"success": False, "error": "Missing fields"}, status=400)
+    if not all(s.isdigit() for s in service_ids):
+        return JsonResponse({"success": False, "error": "Invalid services"}, status=400)
+    if branch is None:
+        return JsonResponse({"success": False, "error": "Unknown location"}, status=400)
+
+    try:
+        date_str = request.GET.get("date")
+        first_date = datetime.strptime(date_str, "%Y-%m-%d").date() if date_str else datetime.now().date()
+        time_str = request.GET.get("time")
+        preferred_time = datetime.strptime(time_str, "%H:%M").time() if time_str else None
+        days = min(max(int(request.GET.get("days", 14)), 1), 60)
+        limit = min(max(int(request.GET.get("limit", 5)), 1), 20)
+    except ValueError:
+        return JsonResponse({"success": False, "error": "Invalid date, time or number"}, status=400)
+
+    total_minutes = sum(
+        Service.objects.filter(id__in=service_ids).values_list("duration", flat=True)
+    )
+    if dentist_id == ANY_DENTIST:
+        dentists = eligible_dentists(service_ids)
+    elif dentist_id.isdigit():
+        dentists = Dentist.objects.filter(id=dentist_id)
+    else:
+        return JsonResponse({"success": False, "error": "Invalid dentist"}, status=400)
+
+    slots = find_open_slots(
+        dentists,
+        first_date,
+        days,
+        total_minutes,
+        preferred_time,
+        branch=branch,
+        limit=limit,
+        cache=DentistDayCache(shared=True),
+    )
+
+    return JsonResponse({
+        "success": True,
+        "slots": [
+            {
+                "date": day.strftime("%Y-%m-%d"),
+                "start_time": start.strftime("%H:%M"),
+                "end_time": end.strftime("%H:%M"),
+                "dentist_id": dentist.id,
+                "dentist": dentist.name,
+            }
+            for day, dentist, start, end in slots
+        ],
+    })
+
+
+@require_POST
+def book_treatment_plan(request):
+    """
+    Solve (and unless dry_run, book) a multi-visit treatment plan. JSON body:
+
+        {"dentist": 3, "location": 1, "email": "...", "start_date": "2025-01-06",
+         "time": "09:00", "name": "RPD framework", "dry_run": false,
+         "steps": [{"services": [4], "min_gap_days": 0, "max_gap_days": 14},
+                   {"services": [7], "min_gap_days": 7, "max_gap_days": 21}]}
+
+    Gaps count days from the previous visit (from start_date for the first).
+    Anonymous callers are rate limited and book at most
+    settings.ANONYMOUS_PLAN_MAX_STEPS visits per plan.
+    """
+    if anonymous_limit_reached(request, "treatment_plan"):
+        return JsonResponse({"success": False, "error": "Too many requests, try again later."}, status=429)
+    try:
+        data = json.loads(request.body)
+        dentist = Dentist.objects.get(id=int(data["dentist"]))
+        start_date = datetime.strptime(data["start_date"], "%Y-%m-%d").date()
+        preferred_time = datetime.strptime(data["time"], "%H:%M").time() if data.get("time") else None
+        raw_steps = data["steps"]
+        email = data.get("email", "")
+    except (ValueError, KeyError, TypeError, Dentist.DoesNotExist):
+        return JsonResponse({"success": False, "error": "Invalid plan"}, status=400)
+
+    branch = resolve_branch(data.get("location"))
+    if branch is None:
+        return JsonResponse({"success": False, "error": "Unknown location"}, status=400)
+    max_steps = treatment_plan.MAX_STEPS
+    if not request.user.is_authenticated:
+        max_steps = min(max_steps, settings.ANONYMOUS_PLAN_MAX_STEPS)
+    if not raw_steps or len(raw_steps) > max_steps:
+        return JsonResponse({
+            "success": False,
+            "error": f"A plan needs 1 to {max_steps} steps.",
+        }, status=400)
+    if start_date < datetime.now().date():
+        return JsonResponse({"success": False, "error": "You cannot book in the past."}, status=400)
+
+    try:
+        step_service_ids = [[int(s) for s in step["services"]] for step in raw_steps]
+        gaps = [
+            (int(step.get("min_gap_days", 0)), int(step.get("max_gap_days", 0)))
+            for step in raw_steps
+        ]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"success": False, "error": "Invalid plan"}, status=400)
+    if any(low < 0 or high < low for low, high in gaps) or not all(step_service_ids):
+        return JsonResponse({"success": False, "error": "Each step needs services and 0 <= min_gap_days <= max_gap_days."}, status=400)
+
+    all_ids = {s for ids in step_service_ids for s in ids}
+    services = Service.objects.in_bulk(all_ids)
+    if len(services) != len(all_ids):
+        return JsonResponse({"success": False, "error": "Invalid services"}, status=400)
+    if not eligible_dentists(all_ids).filter(pk=dentist.pk).exists():
+        return JsonResponse({"success": False, "error": f"{dentist.name} does not offer every service in this plan."}, status=400)
+
+    steps = [
+        treatment_plan.PlanStep([services[s] for s in ids], low, high)
+        for ids, (low, high) in zip(step_service_ids, gaps)
+    ]
+
+    if data.get("dry_run"):
+        plan, picks = None, treatment_plan.solve(dentist, branch, steps, start_date, preferred_time)
+    else:
+        if not email:
+            return JsonResponse({"success": False, "error": "Missing email"}, status=400)
+        try:
+            plan, appointments = treatment_plan.book_plan(
+                dentist,
+                branch,
+                steps,
+                email,
+                start_date,
+                preferred_time,
+                name=data.get("name", ""),
+                patient=booking.find_patient(email),
+                user=request.user if request.user.is_authenticated else None,
+                actor=request.user if request.user.is_authenticated else None,
+            )
+        except IntegrityError:
+            # the overlap guard caught a clash the solver didn't see
+            plan, appointments = None, []
+        picks = [(a.date, a.time, a.end_time) for a in appointments] if plan else None
+
+    if not picks:
+        return JsonResponse({
+            "success": False,
+            "error": "No sequence of slots fits these gaps.",
+        }, status=400)
+
+    return JsonResponse({
+        "success": True,
+        "plan_id": plan.pk if plan else None,
+        "visits": [
+            {
+                "step": i + 1,
+                "date": day.strftime("%Y-%m-%d"),
+                "start_time": start.strftime("%H:%M"),
+                "end_time": end.strftime("%H:%M"),
+                "services": [s.service_name for s in step.services],
+            }
+            for i, ((day, start, end), step) in enumerate(zip(picks, steps))
+        ],
+    })
+
+
+@require_POST
+def join_waitlist(request):
+    """
+    Put a patient on the cancellation waitlist (waitlist.py):
+
+        POST dentist=3|any, location=1, services=2&services=5, email=...,
+             earliest_date=2025-01-06, latest_date=2025-01-20, auto_book=1
+
+    Anonymous callers are rate limited.
+    """
+    if anonymous_limit_reached(request, "waitlist"):
+        return JsonResponse({"success": False, "error": "Too many requests, try again later."}, status=429)
+    dentist_id = request.POST.get("dentist")
+    branch = resolve_branch(request.POST.get("location"))
+    service_ids = request.POST.getlist("services")
+    email = request.POST.get("email")
+
+    if not (dentist_id and service_ids and email):
+        return JsonResponse({"success": False, "error": "Missing fields"}, status=400)
+    if not all(s.isdigit() for s in service_ids):
+        return JsonResponse({"success": False, "error": "Invalid services"}, status=400)
+    if branch is None:
+        return JsonResponse({"success": False, "error": "Unknown location"}, status=400)
+
+    try:
+        earliest = datetime.strptime(request.POST.get("earliest_date", ""), "%Y-%m-%d").date()
+        latest = datetime.strptime(request.POST.get("latest_date", ""), "%Y-%m-%d").date()
+    except ValueError:
+        return JsonResponse({"success": False, "error": "Invalid date"}, status=400)
+    earliest = max(earliest, datetime.now().date())
+    if latest < earliest:
+        return JsonResponse({"success": False, "error": "The window has already passed."}, status=400)
+
+    dentist = None
+    if dentist_id != ANY_DENTIST:
+        dentist = Dentist.objects.filter(id=dentist_id if dentist_id.isdigit() else None).first()
+        if dentist is None:
+            return JsonResponse({"success": False, "error": "Invalid dentist"}, status=400)
+
+    services = list(Service.objects.filter(id__in=service_ids))
+    entry = WaitlistEntry.objects.create(
+        dentist=dentist,
+        branch=branch,
+        user=request.user if request.user.is_authenticated else None,
+        email=email,
+        duration_minutes=sum(s.duration for s in services),
+        earliest_date=earliest,
+        latest_date=latest,
+        auto_book=request.POST.get("auto_book") in ("1", "true", "on"),
+    )
+    entry.services.set(services)
+    return JsonResponse({"success": True, "entry_id": entry.pk})
+
+
+def schedule_cache_stats(request):
+    """Hit/miss counters of the schedule cache, for monitoring (staff only)."""
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    if request.method == "POST" and request.POST.get("reset"):
+        schedule_cache.reset_stats()
+    return JsonResponse(schedule_cache.stats())
@@ -0,0 +1,359 @@
+"""
+Cancellation waitlist.
+
+When an active appointment is cancelled (signals.py) a FreedSlot row is
+written in the cancelling transaction, that's all the request pays for.
+Once it commits, the dispatcher matches the slot against WaitlistEntry:
+
+- the free gap around the freed time is read under the dentist/day lock,
+  so it includes any free time next to it;
+- candidates come from one range query on the waitlist index
+  (branch, dentist or any dentist, earliest_date <= day <= latest_date,
+  duration <= gap); an "any dentist" entry only goes to a dentist who offers
+  all its services (utils.eligible_dentists);
+- best fit wins: the longest visit that fits (fills the most chair time),
+  then whoever has waited longest;
+- auto_book entries are booked straight into the gap, and the later booking
+  they were waiting to move up is cancelled in the same transaction (which
+  frees that time for the next entry); the rest are emailed an offer (first
+  come, first served: the slot isn't held).
+
+An offer nobody took within settings.WAITLIST_OFFER_HOURS lapses
+(expire_offers): the entry waits again, or expires once its window passed,
+and the slot is queued again for the next candidate, skipping the entries
+it was already offered to.
+
+settings.WAITLIST_DISPATCHER picks how matching runs (dotted path):
+
+- ThreadDispatcher: a background thread right after the commit.
+- CommandDispatcher: nothing on commit; `manage.py process_waitlist` (cron)
+  matches the queued slots.
+
+process_waitlist also picks up slots a thread never got to (restart, crash),
+and lapses stale offers, so it runs from cron with either dispatcher.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .utils import (
+    ACTIVE_STATUSES,
+    DentistDayCache,
+    eligible_dentists,
+    lock_dentist_day,
+    minutes_not_before,
+    to_minutes,
+    to_time,
+)
+
+logger = logging.getLogger(__name__)
+
+# waiting entries looked at per freed slot
+MAX_CANDIDATES = 20
+
+
+class ThreadDispatcher:
+    def dispatch(self, slot_id):
+        thread = threading.Thread(target=self.run, args=(slot_id,), daemon=True)
+        thread.start()
+
+    def run(self, slot_id):
+        try:
+            process_freed_slot(slot_id)
+        except Exception:
+            # process_waitlist retries anything left unprocessed
+            logger.exception("Waitlist match failed for freed slot %s", slot_id)
+        finally:
+            connection.close()
+
+
+class CommandDispatcher:
+    def dispatch(self, slot_id):
+        # matched by `manage.py process_waitlist`
+        pass
+
+
+_dispatcher = None
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        path = getattr(settings, "WAITLIST_DISPATCHER", "appointment.waitlist.ThreadDispatcher")
+        _dispatcher = import_string(path)()
+    return _dispatcher
+
+
+def slot_freed(appointment):
+    """Queue the cancelled appointment's time for matching (after commit)."""
+    from .models import FreedSlot
+
+    if appointment.dentist_id is None or appointment.date < datetime.now().date():
+        return None
+    slot = FreedSlot.objects.create(
+        dentist_id=appointment.dentist_id,
+        branch_id=appointment.branch_id,
+        date=appointment.date,
+        start_time=appointment.time,
+        end_time=appointment.end_time,
+        appointment=appointment,
+    )
+    transaction.on_commit(lambda: get_dispatcher().dispatch(slot.pk))
+    return slot
+
+
+def free_gap(schedule, start, not_before=None):
+    """The free (start, end) gap, in minutes, holding minute `start`, or None."""
+    for gap_start, gap_end in zip(schedule.gap_starts, schedule.gap_ends):
+        if gap_start <= start < gap_end:
+            return max(gap_start, not_before or gap_start), gap_end
+    return None
+
+
+def place_in_gap(schedule, gap, duration, freed_start):
+    """
+    Start (minutes) for `duration` inside `gap`: at the freed time if it fits
+    there, else as early in the gap as it fits. None when the 15-minute grid
+    leaves less room than the gap's length.
+    """
+    for lower in (max(freed_start, gap[0]), gap[0]):
+        start = schedule.earliest_fit(duration, lower)
+        if start is not None and start + duration <= gap[1]:
+            return start
+    return None
+
+
+def candidates(slot, gap_minutes):
+    """
+    Waiting entries that fit the slot, best first (waitlist_waiting_idx),
+    without those it was already offered to (a lapsed offer re-queues it).
+    """
+    from .models import FreedSlot, WaitlistEntry
+
+    offered = FreedSlot.objects.filter(
+        dentist_id=slot.dentist_id,
+        date=slot.date,
+        start_time=slot.start_time,
+        matched_entry__isnull=False,
+    ).values("matched_entry")
+    return (
+        WaitlistEntry.objects.filter(
+            status="waiting",
+            branch_id=slot.branch_id,
+            earliest_date__lte=slot.date,
+            latest_date__gte=slot.date,
+            duration_minutes__lte=gap_minutes,
+        )
+        .filter(Q(dentist_id=slot.dentist_id) | Q(dentist__isnull=True))
+        .exclude(pk__in=offered)
+        .order_by("-duration_minutes", "created_at", "pk")
+    )
+
+
+def offers_services(dentist, entry):
+    """Whether `dentist` may take `entry`: its own dentist, or one offering all its services."""
+    if entry.dentist_id is not None:
+        return entry.dentist_id == dentist.pk
+    service_ids = [service.pk for service in entry.services.all()]
+    return eligible_dentists(service_ids).filter(pk=dentist.pk).exists()
+
+
+def process_freed_slot(slot_id):
+    """
+    Match one freed slot. Returns the WaitlistEntry it went to, or None.
+    Safe to run twice: a processed slot is skipped.
+    """
+    from .models import FreedSlot
+
+    offer = None
+    with transaction.atomic():
+        slot = (
+            FreedSlot.objects.select_for_update()
+            .select_related("dentist", "branch")
+            .filter(pk=slot_id, processed_at__isnull=True)
+            .first()
+        )
+        if slot is None:
+            return None
+
+        entry = None
+        now = datetime.now()
+        if slot.date >= now.date():
+            lock_dentist_day(slot.dentist, slot.date)
+            day = DentistDayCache(materialized=False).get(slot.dentist, slot.date)
+            schedule = day.schedule(slot.branch)
+            floor = minutes_not_before(now, slot.date) if slot.date == now.date() else None
+            gap = free_gap(schedule, to_minutes(slot.start_time), floor)
+
+            start = None
+            if gap and gap[1] > gap[0]:
+                waiting = candidates(slot, gap[1] - gap[0]).select_for_update().prefetch_related("services")
+                for entry in waiting[:MAX_CANDIDATES]:
+                    if not offers_services(slot.dentist, entry):
+                        continue
+                    start = place_in_gap(schedule, gap, entry.duration_minutes, to_minutes(slot.start_time))
+                    if start is not None:
+                        break
+            if start is None:
+                entry = None
+            elif entry.auto_book:
+                entry = book_entry(entry, slot, start)
+            else:
+                entry.status = "offered"
+                entry.offered_at = timezone.now()
+                entry.save(update_fields=["status", "offered_at"])
+                offer = (entry, to_time(start))
+
+        slot.matched_entry = entry
+        slot.processed_at = timezone.now()
+        slot.save(update_fields=["matched_entry", "processed_at"])
+
+    if offer:
+        send_offer(slot, *offer)
+    return entry
+
+
+def book_entry(entry, slot, start):
+    """
+    Book `entry` at `start` (minutes) on the slot's day and cancel the later
+    booking it replaces; caller holds the lock.
+    """
+    from .booking import create_appointment, find_patient
+
+    services = list(entry.services.all())
+    patient = find_patient(entry.email)
+    try:
+        with transaction.atomic():
+            appt = create_appointment(
+                services,
+                note=f"Booked from the waitlist (freed slot {slot.pk})",
+                user=entry.user,
+                dentist=slot.dentist,
+                branch=slot.branch,
+                dentist_name=slot.dentist.name,
+                location=slot.branch.name if slot.branch else "",
+                date=slot.date,
+                time=to_time(start),
+                end_time=to_time(start + entry.duration_minutes),
+                preferred_date=slot.date,
+                preferred_time=to_time(start),
+                email=entry.email,
+                patient=patient,
+            )
+            replaced = later_booking(appt, services)
+            if replaced is not None:
+                cancel_replaced(replaced, appt)
+    except IntegrityError:
+        # the overlap guard caught a clash; leave the entry waiting
+        return None
+
+    entry.status = "booked"
+    entry.matched_appointment = appt
+    entry.save(update_fields=["status", "matched_appointment"])
+    return entry
+
+
+def later_booking(appointment, services):
+    """
+    The booking a waitlisted patient wanted to move up: their earliest active
+    appointment after `appointment` for one of the same services, or None.
+    """
+    from .models import Appointment
+
+    same_patient = Q(email__iexact=appointment.email)
+    if appointment.patient_id is not None:
+        same_patient |= Q(patient_id=appointment.patient_id)
+    later = Q(date__gt=appointment.date) | Q(date=appointment.date, time__gt=appointment.time)
+    return (
+        Appointment.objects.select_for_update()
+        .filter(same_patient, later, status__in=ACTIVE_STATUSES, services__in=[s.pk for s in services])
+        .exclude(pk=appointment.pk)
+        .order_by("date", "time", "pk")
+        .distinct()
+        .first()
+    )
+
+
+def cancel_replaced(replaced, appointment):
+    """Cancel the booking the waitlist moved up (offer_cancelled_time frees its time)."""
+    from .models import AppointmentLog
+
+    old_status = replaced.status
+    replaced.status = "cancelled"
+    replaced.save(update_fields=["status"])
+    AppointmentLog.objects.create(
+        appointment=replaced,
+        action="cancelled",
+        old_status=old_status,
+        new_status="cancelled",
+        note=f"Moved up from the waitlist to appointment {appointment.pk} on {appointment.date} {appointment.time}",
+    )
+
+
+def send_offer(slot, entry, start_time):
+    message = (
+        f"Good day!\n\n"
+        f"An earlier appointment is now open on {slot.date.strftime('%B %d, %Y')} "
+        f"at {start_time.strftime('%I:%M %p')} with {slot.dentist.name}"
+        f"{' at ' + slot.branch.name if slot.branch else ''}.\n\n"
+        f"Please contact Tactay Billedo Dental Clinic within {settings.WAITLIST_OFFER_HOURS} "
+        f"hours to take it. Slots are given to whoever confirms first.\n\n"
+        f"Thank you."
+    )
+    send_mail("An earlier appointment is available", message, None, [entry.email], fail_silently=True)
+
+
+def expire_entries(today=None):
+    """Entries whose window has passed stop waiting. Returns how many."""
+    from .models import WaitlistEntry
+
+    today = today or datetime.now().date()
+    return WaitlistEntry.objects.filter(status="waiting", latest_date__lt=today).update(status="expired")
+
+
+def expire_offers(now=None):
+    """
+    Offers older than settings.WAITLIST_OFFER_HOURS lapse: the entry waits
+    again (or expires, its window passed) and each slot still ahead is queued
+    again for the next candidate. Returns how many offers lapsed.
+    """
+    from .models import FreedSlot, WaitlistEntry
+
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=settings.WAITLIST_OFFER_HOURS)
+    today = timezone.localdate(now)
+    with transaction.atomic():
+        lapsed = list(
+            WaitlistEntry.objects.select_for_update()
+            .filter(status="offered", offered_at__lt=cutoff)
+            .values_list("pk", flat=True)
+        )
+        if not lapsed:
+            return 0
+        WaitlistEntry.objects.filter(pk__in=lapsed, latest_date__gte=today).update(status="waiting", offered_at=None)
+        WaitlistEntry.objects.filter(pk__in=lapsed, latest_date__lt=today).update(status="expired")
+
+        offered = FreedSlot.objects.filter(matched_entry__in=lapsed, date__gte=today).order_by("pk")
+        requeued = FreedSlot.objects.bulk_create([
+            FreedSlot(
+                dentist_id=slot.dentist_id,
+                branch_id=slot.branch_id,
+                date=slot.date,
+                start_time=slot.start_time,
+                end_time=slot.end_time,
+                appointment_id=slot.appointment_id,
+            )
+            for slot in offered
+        ])
+        for slot in requeued:
+            # bulk_create sets no pk on MySQL; process_waitlist picks those up
+            if slot.pk is not None:
+                transaction.on_commit(lambda pk=slot.pk: get_dispatcher().dispatch(pk))
+    return len(lapsed)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0016_hot_path_indexes'),
+        ('billing', '0002_billingrecord_appointment_billingrecord_patient_and_more'),
+        ('patient', '0024_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='billingrecord',
+            index=models.Index(fields=['patient', 'date_issued'], name='billing_patient_date_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0023_appointment_patient'),
+        ('billing', '0003_hot_path_indexes'),
+        ('patient', '0028_list_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='billingrecord',
+            index=models.Index(fields=['date_issued', 'id'], name='billing_date_idx'),
+        ),
+    ]
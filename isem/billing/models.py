@@ -19,7 +19,14 @@ class BillingRecord(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)   
     date_issued = models.DateTimeField(default=timezone.now)
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='unpaid')
-    
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'date_issued'], name='billing_patient_date_idx'),
+            # keyset pagination of the billing list (core.pagination)
+            models.Index(fields=['date_issued', 'id'], name='billing_date_idx'),
+        ]
+
 
 def save(self, *args, **kwargs):
         # Auto-fill patient_name from patient FK
@@ -1,3 +1,52 @@
-from django.test import TestCase
+from datetime import datetime, timedelta
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from patient.models import Patient
+from .models import BillingRecord
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BillingPageTests(TestCase):
+    """The billing list walks by cursor (-date_issued, -id), 5 rows a page."""
+
+    @classmethod
+    def setUpTestData(cls):
+        patient = Patient.objects.create(
+            name="Ana", email="ana@example.com", address="", telephone="09170000000", age=30,
+        )
+        newest = timezone.make_aware(datetime(2026, 3, 2, 10))
+        # four bills share a timestamp, so the first page break falls inside the tie
+        issued = [newest] + [newest - timedelta(hours=1)] * 4 + [newest - timedelta(days=1)] * 2
+        cls.bills = [
+            BillingRecord.objects.create(patient=patient, patient_name="Ana", type="Cleaning", amount=500, date_issued=at)
+            for at in issued
+        ]
+
+    def page(self, cursor=None):
+        params = {"cursor": cursor} if cursor else {}
+        return self.client.get(reverse("billing:list"), params).context["page_obj"]
+
+    def test_pages_cross_equal_timestamps_without_gaps(self):
+        first = self.page()
+        second = self.page(first.next_cursor)
+
+        expected = sorted(self.bills, key=lambda b: (b.date_issued, b.pk), reverse=True)
+        self.assertEqual([b.pk for b in first] + [b.pk for b in second], [b.pk for b in expected])
+        self.assertEqual((len(first), len(second)), (5, 2))
+        self.assertFalse(first.has_previous)
+        self.assertFalse(second.has_next)
+
+    def test_previous_cursor_returns_the_same_page(self):
+        first = self.page()
+        second = self.page(first.next_cursor)
+        back = self.page(second.previous_cursor)
+
+        self.assertEqual([b.pk for b in back], [b.pk for b in first])
+        self.assertTrue(back.has_next)
+        self.assertFalse(back.has_previous)
+
+    def test_bad_cursor_gives_the_first_page(self):
+        self.assertEqual([b.pk for b in self.page("not-a-cursor")], [b.pk for b in self.page()])
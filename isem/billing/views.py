@@ -10,23 +10,24 @@ from patient.models import Patient
 from appointment.models import Appointment, Service
 from .models import BillingRecord
 from .forms import BillingRecordForm
-from django.core.paginator import Paginator
+from core.pagination import keyset_paginate
 # Create your views here.
 def billing(request):
-    bill = BillingRecord.objects.select_related('patient', 'appointment').all().order_by('-date_issued')
+    # only the columns the table shows
+    bill = BillingRecord.objects.select_related('patient').only(
+        'id', 'amount', 'type', 'date_issued', 'patient__id', 'patient__name'
+    )
 
-    print("=" * 50)
-    print(f"Total billing records: {bill.count()}")
-    for b in bill[:5]:  # Print first 5
-        print(f"ID: {b.pk}, Patient: {b.patient.name if b.patient else 'None'}, Amount: {b.amount}, Appointment: {b.appointment.id if b.appointment else 'None'}")
-    print("=" * 50)
+    # Show 5 items per page, newest first, walked by cursor (billing_date_idx)
+    page_obj = keyset_paginate(
+        bill,
+        ordering=('-date_issued', '-id'),
+        cursor=request.GET.get('cursor'),
+        per_page=5,
+        count='approximate',
+    )
 
-    paginator = Paginator(bill, 5)  # Show 5 items per page
-    page_number = request.GET.get('page')
-    bill = paginator.get_page(page_number)
-    page_obj = bill
-    
-    patients = Patient.objects.all().order_by('name')
+    patients = Patient.objects.only('id', 'name', 'email').order_by('name')
     services = Service.objects.all().order_by('service_name') 
 
     return render(request, 'billing/billing.html', {
@@ -0,0 +1,220 @@
+"""
+Keyset (cursor) pagination for the dashboard lists: patient_records,
+billing and inventory_list.
+
+Paginator runs COUNT(*) and then OFFSET n on every page, so page 5,000
+reads (and throws away) 25,000 rows first. A keyset page instead asks for
+the rows after the last one shown:
+
+    WHERE name >= 'Reyes' AND (name > 'Reyes' OR (name = 'Reyes' AND id > 812))
+    ORDER BY name, id LIMIT 6
+
+which is one index range scan however deep the page is. Usage:
+
+    page = keyset_paginate(
+        Patient.objects.only("id", "name", ...),
+        ordering=("name", "id"),
+        cursor=request.GET.get("cursor"),
+        per_page=5,
+        count="approximate",
+    )
+
+- `ordering` must end in a unique column (the pk) and name concrete,
+  non-null columns; an index over the same columns makes it a range scan.
+  "-field" pages that column descending.
+- Cursors are opaque (url-safe base64) strings holding the boundary row's
+  key and the direction; a bad or stale cursor just gives the first page.
+- `count`: None (no count query), "exact" (COUNT(*)), or "approximate":
+  the planner's row estimate for an unfiltered table on PostgreSQL/MySQL,
+  otherwise a count capped at COUNT_CAP rows ("1,000+").
+
+core/keyset_pagination.html renders the page's links.
+"""
+import base64
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+# "approximate" counts stop here when there's no table estimate to use
+COUNT_CAP = 1000
+
+
+class KeysetPage:
+    """One page of rows, with cursors to its neighbours (None at either end)."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None, count_kind=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        # "exact", "estimate" (table statistics) or "at_least" (capped count)
+        self.count_kind = count_kind
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def count_label(self):
+        if self.count is None:
+            return ""
+        if self.count_kind == "estimate":
+            return f"about {self.count:,}"
+        if self.count_kind == "at_least" and self.count >= COUNT_CAP:
+            return f"{COUNT_CAP:,}+"
+        return f"{self.count:,}"
+
+
+def _key_fields(model, ordering):
+    """[(field, descending)] for `ordering`, with "pk" resolved."""
+    fields = []
+    for name in ordering:
+        descending = name.startswith("-")
+        name = name.lstrip("-")
+        field = model._meta.pk if name == "pk" else model._meta.get_field(name)
+        fields.append((field, descending))
+    return fields
+
+
+def _dump(value):
+    if isinstance(value, (datetime, date, time)):
+        # full precision: the boundary row has to compare equal to itself
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+def pack_cursor(key, direction="next"):
+    """Opaque cursor for a boundary row's key values."""
+    raw = json.dumps({"k": [_dump(value) for value in key], "d": direction}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def unpack_cursor(cursor):
+    """(raw key values, direction) from pack_cursor; ValueError if it isn't one."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        key, direction = data["k"], data["d"]
+    # binascii / json / unicode errors are ValueErrors
+    except (KeyError, TypeError) as e:
+        raise ValueError("malformed cursor") from e
+    if direction not in ("next", "previous") or not isinstance(key, list):
+        raise ValueError("malformed cursor")
+    return key, direction
+
+
+def encode_cursor(fields, row, direction):
+    return pack_cursor([getattr(row, field.attname) for field, _ in fields], direction)
+
+
+def decode_cursor(fields, cursor):
+    """(key values, "next" | "previous"), or (None, "next") for no/bad cursor."""
+    if not cursor:
+        return None, "next"
+    try:
+        key, direction = unpack_cursor(cursor)
+        if len(key) != len(fields):
+            raise ValueError
+        return [field.to_python(value) for (field, _), value in zip(fields, key)], direction
+    except (ValueError, ValidationError):
+        return None, "next"
+
+
+def _beyond(fields, key, backwards):
+    """
+    Rows after `key` in the ordering (before it when `backwards`). The
+    leading >= / <= bound is redundant but gives every database an index
+    range on the first column rather than relying on it seeing through the OR.
+    """
+    condition = Q()
+    for i, (field, descending) in enumerate(fields):
+        op = "lt" if descending != backwards else "gt"
+        term = Q(**{f"{field.attname}__{op}": key[i]})
+        for (earlier, _), value in zip(fields[:i], key):
+            term &= Q(**{earlier.attname: value})
+        condition |= term
+    first, descending = fields[0]
+    bound = "lte" if descending != backwards else "gte"
+    return Q(**{f"{first.attname}__{bound}": key[0]}) & condition
+
+
+def table_estimate(queryset):
+    """The planner's row count for an unfiltered queryset's table, or None."""
+    if queryset.query.where:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if connection.vendor == "postgresql":
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass"
+    elif connection.vendor == "mysql":
+        sql = "SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s"
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    # reltuples is -1 until the table is first analyzed
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def count_rows(queryset, mode):
+    """(count, kind) for `mode` ("exact" / "approximate"), or (None, None)."""
+    if mode == "exact":
+        return queryset.count(), "exact"
+    if mode == "approximate":
+        estimate = table_estimate(queryset)
+        if estimate is not None:
+            return estimate, "estimate"
+        return queryset.order_by()[:COUNT_CAP].count(), "at_least"
+    return None, None
+
+
+def keyset_paginate(queryset, ordering, cursor=None, per_page=5, count=None):
+    """The KeysetPage of `queryset` (sorted by `ordering`) that `cursor` points at."""
+    fields = _key_fields(queryset.model, ordering)
+    key, direction = decode_cursor(fields, cursor)
+    backwards = direction == "previous"
+
+    rows = queryset.order_by(*ordering)
+    if key is not None:
+        rows = rows.filter(_beyond(fields, key, backwards))
+    if backwards:
+        rows = rows.reverse()
+    rows = list(rows[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    # walking forwards there is a previous page iff we came from a cursor;
+    # walking backwards there is a next page (the one we came from)
+    has_next = more if not backwards else key is not None
+    has_previous = key is not None if not backwards else more
+
+    total, kind = count_rows(queryset, count)
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(fields, rows[-1], "next") if rows and has_next else None,
+        previous_cursor=encode_cursor(fields, rows[0], "previous") if rows and has_previous else None,
+        count=total,
+        count_kind=kind,
+    )
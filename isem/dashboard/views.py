@@ -1,5 +1,6 @@
-from datetime import date, timedelta
+from datetime import date, datetime, time, timedelta
 from django.shortcuts import render
+from django.utils import timezone
 from appointment.models import Appointment
 from inventory.models import InventoryItem
 from patient.models import Patient
@@ -14,7 +15,12 @@ def dashboard(request):
         date__lte=today + timedelta(days=7)
     )
 
-    new_patients_today = Patient.objects.filter(created_at__date=today)
+    # a plain range (not created_at__date) so the created_at index is used
+    start_of_day = timezone.make_aware(datetime.combine(today, time.min))
+    new_patients_today = Patient.objects.filter(
+        created_at__gte=start_of_day,
+        created_at__lt=start_of_day + timedelta(days=1),
+    )
 
     cancelled = Appointment.objects.filter(
         # date=today,
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_alter_inventoryitem_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(fields=['status', 'expiry_date'], name='inventory_status_expiry_idx'),
+        ),
+    ]
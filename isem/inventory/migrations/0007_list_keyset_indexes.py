@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(fields=['created_at', 'id'], name='inventory_created_idx'),
+        ),
+    ]
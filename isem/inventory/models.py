@@ -60,3 +60,8 @@ class InventoryItem(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'expiry_date'], name='inventory_status_expiry_idx'),
+            # keyset pagination of the inventory list (core.pagination)
+            models.Index(fields=['created_at', 'id'], name='inventory_created_idx'),
+        ]
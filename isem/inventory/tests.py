@@ -1,3 +1,49 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import InventoryItem
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class InventoryPageTests(TestCase):
+    """The inventory list walks by cursor (-created_at, -id), 5 rows a page."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.items = [
+            InventoryItem.objects.create(
+                item_name=f"Gloves {n}", category="consumable", stock=50,
+                expiry_date=date.today() + timedelta(days=365),
+            )
+            for n in range(11)
+        ]
+        # created_at is auto_now_add: give most items the same timestamp afterwards
+        created = timezone.make_aware(datetime(2026, 3, 2, 10))
+        InventoryItem.objects.filter(pk__in=[i.pk for i in cls.items[:9]]).update(created_at=created)
+        InventoryItem.objects.filter(pk__in=[i.pk for i in cls.items[9:]]).update(created_at=created - timedelta(days=1))
+
+    def page(self, cursor=None):
+        params = {"cursor": cursor} if cursor else {}
+        return self.client.get(reverse("inventory:list"), params).context["page_obj"]
+
+    def test_pages_cross_equal_timestamps_without_gaps(self):
+        pages = [self.page()]
+        while pages[-1].has_next:
+            pages.append(self.page(pages[-1].next_cursor))
+
+        ids = [item.pk for page in pages for item in page]
+        self.assertEqual([len(page) for page in pages], [5, 5, 1])
+        # the nine tied items newest id first, then the two older ones
+        expected = [i.pk for i in reversed(self.items[:9])] + [i.pk for i in reversed(self.items[9:])]
+        self.assertEqual(ids, expected)
+
+    def test_walking_back_from_the_last_page(self):
+        first = self.page()
+        second = self.page(first.next_cursor)
+        third = self.page(second.next_cursor)
+
+        self.assertEqual([i.pk for i in self.page(third.previous_cursor)], [i.pk for i in second])
+        self.assertEqual([i.pk for i in self.page(second.previous_cursor)], [i.pk for i in first])
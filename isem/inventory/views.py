@@ -5,22 +5,30 @@ from django.shortcuts import render, get_object_or_404, redirect
 from .models import InventoryItem
 from .forms import InventoryItemForm
 from django.http import JsonResponse, HttpResponse
-from django.core.paginator import Paginator
+from core.pagination import keyset_paginate
 from django.shortcuts import render
 from django.contrib import messages
 from django.db.models import Q
 
 # LIST
 def inventory_list(request):
-    for item in InventoryItem.objects.all():
+    # Stock changes set the status on save; only expiry changes with the
+    # calendar, so re-save just the items that expired since (status/expiry index)
+    newly_expired = InventoryItem.objects.filter(
+        status__in=['available', 'low_stock', 'out_of_stock'],
+        expiry_date__lt=datetime.date.today(),
+    )
+    for item in newly_expired:
         item.save()
-    qs = InventoryItem.objects.all().order_by('-created_at')
-    
 
-    paginator = Paginator(qs, 5)  # Show 5 items per page
-    page_number = request.GET.get('page')
-    items = paginator.get_page(page_number)
-    page_obj = items
+    # Show 5 items per page, newest first, walked by cursor (inventory_created_idx)
+    page_obj = keyset_paginate(
+        InventoryItem.objects.only('id', 'item_name', 'category', 'stock', 'expiry_date', 'status'),
+        ordering=('-created_at', '-id'),
+        cursor=request.GET.get('cursor'),
+        per_page=5,
+        count='approximate',
+    )
 
      # Form for adding new items
     form = InventoryItemForm()  # Empty form for adding new items
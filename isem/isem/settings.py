@@ -90,6 +90,11 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "isem.wsgi.application"
+ASGI_APPLICATION = "isem.asgi.application"
+
+# Which server start_server.sh runs: "wsgi" (gunicorn) or "asgi" (uvicorn,
+# needed for the calendar's live updates, appointment/live.py)
+SERVER_INTERFACE = os.environ.get("SERVER_INTERFACE", "wsgi")
 
 # --------------------------
 # DATABASE
@@ -101,7 +106,9 @@ if DATABASE_URL:
     DATABASES = {
         "default": dj_database_url.config(
             default=DATABASE_URL,
-            conn_max_age=600,
+            # persistent connections don't work under ASGI: each request's
+            # sync work runs on its own thread
+            conn_max_age=0 if SERVER_INTERFACE == "asgi" else 600,
             conn_health_checks=True,
         )
     }
@@ -118,6 +125,77 @@ else:
         }
     }
 
+# --------------------------
+# LIVE SCHEDULE UPDATES
+# --------------------------
+# Broker behind the calendar's Server-Sent Events stream (appointment/live.py).
+# Empty picks PostgresBroker (LISTEN/NOTIFY, works across workers) on
+# PostgreSQL and InProcessBroker (one ASGI process) elsewhere.
+LIVE_SCHEDULE_BROKER = os.environ.get("LIVE_SCHEDULE_BROKER", "")
+
+# --------------------------
+# BACKGROUND WORK
+# --------------------------
+# How cancelled slots are matched against the waitlist (appointment/waitlist.py).
+# ThreadDispatcher matches right after the cancel commits; CommandDispatcher
+# leaves it to a cron'd `manage.py process_waitlist`.
+WAITLIST_DISPATCHER = os.environ.get(
+    "WAITLIST_DISPATCHER", "appointment.waitlist.ThreadDispatcher"
+)
+# Hours an emailed waitlist offer stays open before process_waitlist offers
+# the slot to the next entry.
+WAITLIST_OFFER_HOURS = int(os.environ.get("WAITLIST_OFFER_HOURS", "4"))
+
+# How uploaded X-rays get their thumbnail / preview (patient/xray_images.py).
+# ThreadDispatcher builds them right after the upload commits; CommandDispatcher
+# leaves them to a cron'd `manage.py build_xray_derivatives`.
+XRAY_DERIVATIVES_DISPATCHER = os.environ.get(
+    "XRAY_DERIVATIVES_DISPATCHER", "patient.xray_images.ThreadDispatcher"
+)
+
+# --------------------------
+# ANONYMOUS BOOKING
+# --------------------------
+# Treatment plans and waitlist entries can be submitted without logging in:
+# requests per client IP per hour (appointment/utils.py anonymous_limit_reached),
+# and how many visits one anonymous plan may book.
+ANONYMOUS_REQUESTS_PER_HOUR = int(os.environ.get("ANONYMOUS_REQUESTS_PER_HOUR", "10"))
+ANONYMOUS_PLAN_MAX_STEPS = int(os.environ.get("ANONYMOUS_PLAN_MAX_STEPS", "4"))
+
+# --------------------------
+# PATIENT IDS
+# --------------------------
+# Guest patient IDs are reserved this many at a time (patient/id_allocator.py)
+GUEST_ID_BLOCK_SIZE = int(os.environ.get("GUEST_ID_BLOCK_SIZE", "20"))
+
+# --------------------------
+# CACHES
+# --------------------------
+# "schedule": dentist-day occupancy (appointment/schedule_cache.py), and the
+# anonymous booking rate limits. Per-process LRU memory by default, enough
+# for one worker; with WEB_CONCURRENCY > 1 share it so invalidations and
+# limits reach every worker, e.g.
+#   SCHEDULE_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#   SCHEDULE_CACHE_LOCATION=redis://host:6379/1
+# (or ...memcached.PyMemcacheCache with host:11211). Not the database
+# cache: a lookup there costs as many queries as the one it saves.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "schedule": {
+        "BACKEND": os.environ.get(
+            "SCHEDULE_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("SCHEDULE_CACHE_LOCATION", "isem-schedule"),
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+}
+
+# Days ahead kept in the materialized free-time table (DentistFreeTime);
+# later dates are computed from the appointments on the fly.
+AVAILABILITY_HORIZON_DAYS = int(os.environ.get("AVAILABILITY_HORIZON_DAYS", "60"))
+
 # --------------------------
 # PASSWORD VALIDATION
 # --------------------------
@@ -0,0 +1,93 @@
+"""
+Merge patients that share an email (Patient.email_normalized), so the email
+can be unique (patient_email_unique).
+
+Every set of patients with the same non-empty email_normalized becomes its
+oldest record (lowest pk), the one Patient.for_email() already resolved to:
+
+- rows pointing at the others (appointments, billing, histories, odontogram,
+  X-rays) are moved to it; for ToothState, one row per tooth, the newer of
+  the two states is kept;
+- its login: if it has none, it takes the (oldest) login of the others;
+- the others are deleted, keeping the oldest record's own details.
+
+A record holding a different login than the one kept can't be merged (a
+login has one patient): it stays, with its email cleared (the login keeps
+it). Takes the model classes, so migrations can pass their historical ones.
+"""
+from django.db.models import Count
+
+from . import search
+
+
+def duplicate_emails(Patient):
+    return (
+        Patient.objects.exclude(email_normalized="")
+        .values("email_normalized")
+        .annotate(n=Count("pk"))
+        .filter(n__gt=1)
+        .values_list("email_normalized", flat=True)
+    )
+
+
+def merge_states(ToothState, keeper_id, other_ids):
+    """Move the others' tooth states to the keeper, the newer state winning per tooth."""
+    kept = {state.tooth_number: state for state in ToothState.objects.filter(patient_id=keeper_id)}
+    for state in ToothState.objects.filter(patient_id__in=other_ids).order_by("pk"):
+        current = kept.get(state.tooth_number)
+        if current is not None and (current.date, current.entry_id or 0) >= (state.date, state.entry_id or 0):
+            state.delete()
+            continue
+        if current is not None:
+            current.delete()
+        state.patient_id = keeper_id
+        state.save(update_fields=["patient"])
+        kept[state.tooth_number] = state
+
+
+def merge_duplicates(Patient, ToothState, dry_run=False):
+    """
+    Merge every set of patients sharing an email. Returns
+    {"emails": n, "merged": n, "cleared": n}: the emails that were shared, the
+    records merged away, the records left with their email cleared.
+    """
+    counts = {"emails": 0, "merged": 0, "cleared": 0}
+    for email in list(duplicate_emails(Patient)):
+        counts["emails"] += 1
+        patients = list(Patient.objects.filter(email_normalized=email).order_by("pk"))
+        keeper, others = patients[0], patients[1:]
+
+        if keeper.user_id is None:
+            with_login = [p for p in others if p.user_id is not None]
+            if with_login:
+                keeper.user_id, with_login[0].user_id = with_login[0].user_id, None
+        separate = [p for p in others if p.user_id is not None]
+        merged = [p for p in others if p.user_id is None]
+        counts["merged"] += len(merged)
+        counts["cleared"] += len(separate)
+        if dry_run:
+            continue
+
+        for patient in separate:
+            Patient.objects.filter(pk=patient.pk).update(email=None, email_normalized="")
+            patient.email, patient.email_normalized = None, ""
+            search.index_patient(patient)
+
+        merged_ids = [p.pk for p in merged]
+        if not merged_ids:
+            continue
+        # the login moves first: it's a one-to-one, it can't be on both rows
+        Patient.objects.filter(pk__in=merged_ids).update(user=None)
+        Patient.objects.filter(pk=keeper.pk).update(user_id=keeper.user_id)
+
+        for relation in Patient._meta.related_objects:
+            if relation.related_model is ToothState:
+                continue
+            field = relation.field.name
+            relation.related_model._base_manager.filter(**{f"{field}__in": merged_ids}).update(**{field: keeper.pk})
+        merge_states(ToothState, keeper.pk, merged_ids)
+
+        Patient.objects.filter(pk__in=merged_ids).delete()
+        for patient_id in merged_ids:
+            search.unindex_patient(patient_id)
+    return counts
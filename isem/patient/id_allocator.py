@@ -0,0 +1,123 @@
+"""
+Guest patient IDs (P-000123-T) without counting the guest rows.
+
+Numbers come from the database in blocks of settings.GUEST_ID_BLOCK_SIZE
+and are handed out from memory, so most guests cost no query at all:
+
+- PostgreSQL: a sequence (patient_guest_id_seq); one
+  `SELECT nextval(...) FROM generate_series(1, n)` takes a block.
+- Elsewhere: the IdCounter row, bumped under select_for_update().
+
+Numbers are unique but not gap-free: a block that is not used up before the
+process exits is lost. A block taken inside an outer transaction is only
+kept once that transaction commits: if it rolls back, so does the counter,
+and the numbers will be handed out again.
+"""
+import re
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import connection, transaction
+
+GUEST_SERIES = "guest_id"
+SEQUENCE = "patient_guest_id_seq"
+GUEST_ID_RE = re.compile(r"^P-(\d+)-T$")
+
+
+def format_guest_id(number):
+    return f"P-{number:06d}-T"
+
+
+def guest_number(guest_id):
+    """123 for "P-000123-T", None for anything else."""
+    match = GUEST_ID_RE.match(guest_id or "")
+    return int(match.group(1)) if match else None
+
+
+def highest_guest_number(Patient):
+    numbers = (
+        guest_number(g)
+        for g in Patient.objects.filter(is_guest=True).exclude(guest_id=None).values_list("guest_id", flat=True)
+    )
+    return max((n for n in numbers if n is not None), default=0)
+
+
+class IdAllocator:
+    def __init__(self, name, sequence=None, block_size=None):
+        self.name = name
+        self.sequence = sequence
+        self.block_size = block_size
+        self._free = deque()
+        self._lock = threading.Lock()
+
+    def take(self, count=1):
+        """`count` new numbers."""
+        taken = []
+        with self._lock:
+            while self._free and len(taken) < count:
+                taken.append(self._free.popleft())
+        while len(taken) < count:
+            block = self._fetch(max(count - len(taken), self._block_size()))
+            needed = count - len(taken)
+            taken.extend(block[:needed])
+            self._keep(block[needed:])
+        return taken
+
+    def next(self):
+        return self.take(1)[0]
+
+    def _block_size(self):
+        return self.block_size or getattr(settings, "GUEST_ID_BLOCK_SIZE", 20)
+
+    def _keep(self, spare):
+        if not spare:
+            return
+        if connection.vendor == "postgresql" and self.sequence:
+            # nextval() is never rolled back
+            self._add(spare)
+        else:
+            # runs now in autocommit, after the commit otherwise
+            transaction.on_commit(lambda: self._add(spare))
+
+    def _add(self, numbers):
+        with self._lock:
+            self._free.extend(numbers)
+
+    def _fetch(self, size):
+        if connection.vendor == "postgresql" and self.sequence:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT nextval(%s) FROM generate_series(1, %s)", [self.sequence, size])
+                return sorted(row[0] for row in cursor.fetchall())
+
+        from .models import IdCounter
+
+        with transaction.atomic():
+            counter = IdCounter.objects.select_for_update().filter(name=self.name).first()
+            if counter is None:
+                IdCounter.objects.bulk_create([IdCounter(name=self.name)], ignore_conflicts=True)
+                counter = IdCounter.objects.select_for_update().get(name=self.name)
+            first = counter.value + 1
+            counter.value += size
+            counter.save(update_fields=["value"])
+        return list(range(first, first + size))
+
+
+guest_ids = IdAllocator(GUEST_SERIES, sequence=SEQUENCE)
+
+
+def next_guest_id():
+    return format_guest_id(guest_ids.next())
+
+
+def install(schema_editor, Patient, IdCounter):
+    """Create the guest sequence / counter, starting after the highest guest ID in use."""
+    highest = highest_guest_number(Patient)
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"CREATE SEQUENCE IF NOT EXISTS {SEQUENCE} START WITH {highest + 1}")
+    IdCounter.objects.update_or_create(name=GUEST_SERIES, defaults={"value": highest})
+
+
+def uninstall(schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP SEQUENCE IF EXISTS {SEQUENCE}")
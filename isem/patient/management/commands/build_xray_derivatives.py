@@ -0,0 +1,90 @@
+"""
+Build the thumbnail / preview of X-rays that don't have them yet: the
+backlog of originals uploaded before derivatives existed, and (with
+XRAY_DERIVATIVES_DISPATCHER = CommandDispatcher) new uploads. From cron:
+
+    python manage.py build_xray_derivatives
+    python manage.py build_xray_derivatives --workers 8 --chunk-size 100
+    python manage.py build_xray_derivatives --retry-failed
+    python manage.py build_xray_derivatives --all      # rebuild everything
+
+Decoding and resizing run in a process pool (xray_images.render_stored,
+which never touches the database); this process stores the results and
+updates the rows, one chunk at a time, so an interrupted run resumes
+where it stopped.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from patient import xray_images
+from patient.models import Xray
+
+
+def init_worker():
+    # spawn-started workers (macOS, Windows) import Django from scratch
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+class Command(BaseCommand):
+    help = "Build X-ray thumbnails and previews, in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (1 renders in this process).")
+        parser.add_argument("--chunk-size", type=int, default=50)
+        parser.add_argument("--retry-failed", action="store_true", help="Also retry X-rays that failed before.")
+        parser.add_argument("--all", action="store_true", help="Rebuild every X-ray's derivatives.")
+
+    def handle(self, *args, **options):
+        statuses = ["pending"]
+        if options["retry_failed"]:
+            statuses.append("failed")
+        xrays = Xray.objects.only("id", "file", "thumbnail", "preview").order_by("pk")
+        if not options["all"]:
+            xrays = xrays.filter(derivatives_status__in=statuses)
+
+        total = xrays.count()
+        self.stdout.write(f"{total} X-ray(s) to process.")
+        if not total:
+            return
+
+        workers = max(options["workers"], 1)
+        pool = None
+        if workers > 1:
+            # forked workers mustn't inherit this process's database connections
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+
+        last_pk = 0
+        ready = failed = 0
+        try:
+            while True:
+                chunk = list(xrays.filter(pk__gt=last_pk)[:options["chunk_size"]])
+                if not chunk:
+                    break
+                last_pk = chunk[-1].pk
+
+                names = [xray.file.name for xray in chunk]
+                results = pool.map(xray_images.render_stored, names) if pool else map(xray_images.render_stored, names)
+                for xray, (_, thumbnail, preview) in zip(chunk, results):
+                    xray_images.save_derivatives(xray, thumbnail, preview)
+                    if thumbnail is None:
+                        failed += 1
+                    else:
+                        ready += 1
+
+                self.stdout.write(f"  up to pk {last_pk}: {ready + failed}/{total}, {failed} failed")
+        finally:
+            if pool:
+                pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built derivatives for {ready} X-ray(s); {failed} could not be read as images."
+        ))
@@ -0,0 +1,30 @@
+"""
+Merge patients that share an email into the oldest record (patient/dedupe.py).
+
+    python manage.py merge_duplicate_patients --dry-run
+    python manage.py merge_duplicate_patients
+
+Migration 0032 runs the same merge before adding patient_email_unique; this
+is for looking at what it would do beforehand, or re-running it by hand.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from patient.dedupe import merge_duplicates
+from patient.models import Patient, ToothState
+
+
+class Command(BaseCommand):
+    help = "Merge patients sharing an email into the oldest record."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change, write nothing.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = merge_duplicates(Patient, ToothState, dry_run=options["dry_run"])
+        verb = "Would merge" if options["dry_run"] else "Merged"
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['emails']} email(s) shared by several patients. {verb} {counts['merged']} record(s) "
+            f"into the oldest one; {counts['cleared']} with a login of their own keep it and lose the email."
+        ))
@@ -0,0 +1,23 @@
+"""
+Rebuild the SQLite patient search table (patient_search) from the patients,
+e.g. after bulk imports that skipped the signals. Nothing to do on
+PostgreSQL, whose trigram indexes live on the table itself.
+
+    python manage.py rebuild_patient_search
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from patient import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the patient search shadow table (SQLite)."
+
+    def handle(self, *args, **options):
+        if not search.uses_fts():
+            self.stdout.write("This database searches patients through indexes on the table; nothing to rebuild.")
+            return
+        with transaction.atomic():
+            rows = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {rows} patient(s)."))
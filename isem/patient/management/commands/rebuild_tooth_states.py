@@ -0,0 +1,23 @@
+"""
+Recompute the per-tooth odontogram snapshot (ToothState) from the
+odontogram history, for every patient or the ones given.
+
+    python manage.py rebuild_tooth_states
+    python manage.py rebuild_tooth_states --patient 12 --patient 40
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from patient.odontogram import rebuild_tooth_states
+
+
+class Command(BaseCommand):
+    help = "Rebuild the current-state odontogram snapshot from its history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patient", type=int, action="append", help="Only this patient id (repeatable).")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            written = rebuild_tooth_states(options["patient"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the current state of {written} charted teeth."))
@@ -0,0 +1,59 @@
+"""
+One-off repair of guest patient IDs handed out by the old count()-based
+scheme: duplicates get fresh IDs from the allocator (the oldest patient of
+each duplicate keeps the ID), and guests with no ID get one.
+
+    python manage.py repair_guest_ids --dry-run
+    python manage.py repair_guest_ids
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min, Q
+
+from patient.id_allocator import format_guest_id, guest_ids
+from patient.models import Patient
+
+
+class Command(BaseCommand):
+    help = "Give duplicate or missing guest patient IDs fresh unique ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change, write nothing.")
+
+    def handle(self, *args, **options):
+        duplicates = (
+            Patient.objects.filter(is_guest=True)
+            .exclude(Q(guest_id=None) | Q(guest_id=""))
+            .values("guest_id")
+            .annotate(copies=Count("id"), keeper=Min("id"))
+            .filter(copies__gt=1)
+        )
+        keepers = {row["guest_id"]: row["keeper"] for row in duplicates}
+
+        # every copy except the oldest, plus guests that never got an ID
+        to_fix = list(
+            Patient.objects.filter(is_guest=True)
+            .filter(Q(guest_id__in=keepers.keys()) | Q(guest_id=None) | Q(guest_id=""))
+            .exclude(pk__in=keepers.values())
+            .order_by("pk")
+            .only("pk", "guest_id")
+        )
+        self.stdout.write(
+            f"{len(keepers)} duplicated guest ID(s); {len(to_fix)} patient(s) need a new one."
+        )
+        if options["dry_run"] or not to_fix:
+            for patient in to_fix[:20]:
+                self.stdout.write(f"  patient {patient.pk}: {patient.guest_id or '(none)'}")
+            return
+
+        batch_size = options["batch_size"]
+        for i in range(0, len(to_fix), batch_size):
+            batch = to_fix[i:i + batch_size]
+            with transaction.atomic():
+                for patient, number in zip(batch, guest_ids.take(len(batch))):
+                    patient.guest_id = format_guest_id(number)
+                Patient.objects.bulk_update(batch, ["guest_id"])
+            self.stdout.write(f"  {i + len(batch)}/{len(to_fix)}")
+
+        self.stdout.write(self.style.SUCCESS(f"Reassigned {len(to_fix)} guest ID(s)."))
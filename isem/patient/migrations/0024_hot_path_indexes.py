@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0023_rename_service_to_services'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['created_at'], name='patient_created_at_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:07
+
+from django.db import migrations, models
+
+from patient import id_allocator
+
+
+def add_guest_id_allocator(apps, schema_editor):
+    id_allocator.install(schema_editor, apps.get_model("patient", "Patient"), apps.get_model("patient", "IdCounter"))
+
+
+def remove_guest_id_allocator(apps, schema_editor):
+    id_allocator.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0024_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        # Guest IDs continue after the highest one already in use
+        migrations.RunPython(add_guest_id_allocator, remove_guest_id_allocator),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_email_normalized(apps, schema_editor):
+    Patient = apps.get_model("patient", "Patient")
+    batch = []
+    for patient in Patient.objects.exclude(email=None).only("pk", "email").iterator(chunk_size=1000):
+        patient.email_normalized = patient.email.strip().lower()
+        batch.append(patient)
+        if len(batch) == 1000:
+            Patient.objects.bulk_update(batch, ["email_normalized"])
+            batch = []
+    Patient.objects.bulk_update(batch, ["email_normalized"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0025_guest_id_allocator'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='email_normalized',
+            field=models.CharField(blank=True, default='', max_length=254),
+        ),
+        migrations.RunPython(fill_email_normalized, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['email_normalized'], name='patient_email_norm_idx'),
+        ),
+    ]
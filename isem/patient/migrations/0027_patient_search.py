@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+from patient import search
+
+
+def fill_phone_digits(apps, schema_editor):
+    Patient = apps.get_model("patient", "Patient")
+    batch = []
+    for patient in Patient.objects.only("pk", "telephone").iterator(chunk_size=1000):
+        patient.phone_digits = search.normalize_phone(patient.telephone)
+        batch.append(patient)
+        if len(batch) == 1000:
+            Patient.objects.bulk_update(batch, ["phone_digits"])
+            batch = []
+    Patient.objects.bulk_update(batch, ["phone_digits"])
+
+
+def add_patient_search(apps, schema_editor):
+    search.install(schema_editor)
+
+
+def remove_patient_search(apps, schema_editor):
+    search.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0026_patient_email_normalized'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='phone_digits',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.RunPython(fill_phone_digits, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['phone_digits'], name='patient_phone_digits_idx'),
+        ),
+        migrations.RunPython(add_patient_search, remove_patient_search),
+    ]
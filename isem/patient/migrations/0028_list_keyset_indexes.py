@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0027_patient_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['name', 'id'], name='patient_name_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0028_list_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='financialhistory',
+            index=models.Index(fields=['patient', 'date'], name='finhist_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalhistory',
+            index=models.Index(fields=['patient', 'date'], name='medhist_patient_date_idx'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_tooth_states(apps, schema_editor):
+    # the newest entry of every (patient, tooth), with its service names
+    Odontogram = apps.get_model("patient", "Odontogram")
+    ToothState = apps.get_model("patient", "ToothState")
+    Through = Odontogram.service.through
+
+    def flush(batch):
+        names = {}
+        rows = (
+            Through.objects.filter(odontogram_id__in=[e.pk for e in batch])
+            .order_by("odontogram_id", "pk")
+            .values_list("odontogram_id", "service__service_name")
+        )
+        for entry_id, name in rows:
+            names.setdefault(entry_id, []).append(name)
+        ToothState.objects.bulk_create([
+            ToothState(
+                patient_id=e.patient_id,
+                tooth_number=e.tooth_number,
+                entry_id=e.pk,
+                date=e.date,
+                dentist=e.dentist,
+                status=e.status,
+                service_names=", ".join(names.get(e.pk, [])),
+            )
+            for e in batch
+        ])
+
+    batch = []
+    last_key = None
+    entries = Odontogram.objects.order_by("patient_id", "tooth_number", "-date", "-id")
+    for entry in entries.iterator(chunk_size=1000):
+        key = (entry.patient_id, entry.tooth_number)
+        if key == last_key:
+            continue
+        last_key = key
+        batch.append(entry)
+        if len(batch) == 1000:
+            flush(batch)
+            batch = []
+    flush(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0023_appointment_patient'),
+        ('patient', '0029_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ToothState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tooth_number', models.PositiveIntegerField()),
+                ('date', models.DateField()),
+                ('dentist', models.CharField(blank=True, max_length=255, null=True)),
+                ('status', models.CharField(blank=True, max_length=100, null=True)),
+                ('service_names', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='odontogram',
+            index=models.Index(fields=['patient', 'tooth_number', 'date'], name='odontogram_tooth_idx'),
+        ),
+        migrations.AddField(
+            model_name='toothstate',
+            name='entry',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='patient.odontogram'),
+        ),
+        migrations.AddField(
+            model_name='toothstate',
+            name='patient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tooth_states', to='patient.patient'),
+        ),
+        migrations.AddConstraint(
+            model_name='toothstate',
+            constraint=models.UniqueConstraint(fields=('patient', 'tooth_number'), name='tooth_state_unique'),
+        ),
+        migrations.RunPython(fill_tooth_states, migrations.RunPython.noop),
+    ]
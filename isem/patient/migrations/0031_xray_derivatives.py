@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0030_tooth_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='xray',
+            name='derivatives_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='xray',
+            name='preview',
+            field=models.FileField(blank=True, upload_to='xrays/previews/'),
+        ),
+        migrations.AddField(
+            model_name='xray',
+            name='thumbnail',
+            field=models.FileField(blank=True, upload_to='xrays/thumbs/'),
+        ),
+        migrations.AddIndex(
+            model_name='xray',
+            index=models.Index(condition=models.Q(('derivatives_status', 'pending')), fields=['id'], name='xray_derivatives_pending_idx'),
+        ),
+    ]
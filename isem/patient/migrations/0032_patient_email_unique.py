@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+from patient.dedupe import merge_duplicates
+
+
+def merge_duplicate_emails(apps, schema_editor):
+    merge_duplicates(apps.get_model("patient", "Patient"), apps.get_model("patient", "ToothState"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0024_calendar_version'),
+        ('billing', '0004_list_keyset_indexes'),
+        ('patient', '0031_xray_derivatives'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='patient',
+            constraint=models.UniqueConstraint(condition=models.Q(('email_normalized', ''), _negated=True), fields=('email_normalized',), name='patient_email_unique'),
+        ),
+    ]
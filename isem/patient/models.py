@@ -4,13 +4,23 @@ from django.contrib.auth.models import User
 from appointment.models import Service
 
 
+def normalize_email(email):
+    """The form emails are matched on: trimmed, lower-cased ("" for none)."""
+    return (email or "").strip().lower()
+
+
 class Patient(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='patient_patient', 
                                 null=True, blank=True)
     name = models.CharField(max_length=255)
     email = models.EmailField(blank=True, null=True)
+    # normalize_email(email), kept by save(); what appointments are matched on,
+    # unique unless blank (merge_duplicate_patients merged the old duplicates)
+    email_normalized = models.CharField(max_length=254, blank=True, default="")
     address = models.TextField()
     telephone = models.CharField(max_length=11, null=False, blank=False)
+    # search.normalize_phone(telephone), kept by save(); prefix-searched
+    phone_digits = models.CharField(max_length=20, blank=True, default="")
     age = models.PositiveIntegerField()
     occupation = models.CharField(max_length=100, blank=True, null=True)
  
@@ -28,6 +38,64 @@ class Patient(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # MySQL ignores the conditional unique constraint, lookups use this
+            models.Index(fields=["email_normalized"], name="patient_email_norm_idx"),
+            # keyset pagination of the patient list (core.pagination)
+            models.Index(fields=["name", "id"], name="patient_name_idx"),
+            models.Index(fields=["phone_digits"], name="patient_phone_digits_idx"),
+            models.Index(fields=["created_at"], name="patient_created_at_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["email_normalized"],
+                condition=~models.Q(email_normalized=""),
+                name="patient_email_unique",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        from .search import normalize_phone
+
+        self.email_normalized = normalize_email(self.email)
+        self.phone_digits = normalize_phone(self.telephone)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            derived = {"email": "email_normalized", "telephone": "phone_digits"}
+            extra = [derived[f] for f in derived if f in update_fields and derived[f] not in update_fields]
+            kwargs["update_fields"] = [*update_fields, *extra]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def for_email(cls, email):
+        """The patient an email belongs to (the oldest record if several), or None."""
+        email = normalize_email(email)
+        if not email:
+            return None
+        return cls.objects.filter(email_normalized=email).order_by("pk").first()
+
+    @classmethod
+    def email_in_use(cls, email, exclude_pk=None):
+        """Whether another patient already has `email` (patient_email_unique)."""
+        email = normalize_email(email)
+        if not email:
+            return False
+        return cls.objects.filter(email_normalized=email).exclude(pk=exclude_pk).exists()
+
+
+class IdCounter(models.Model):
+    """
+    Last value handed out for a named ID series (see id_allocator.py).
+    Used where the database has no sequences; PostgreSQL uses one instead.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
 class MedicalHistory(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='medical_history')
     date = models.DateField()
@@ -42,6 +110,10 @@ class MedicalHistory(models.Model):
         ordering = ['-date', '-created_at']
         verbose_name = 'Treatment History'
         verbose_name_plural = 'Treatment Histories'
+        indexes = [
+            # patient timeline (timeline.py)
+            models.Index(fields=['patient', 'date'], name='medhist_patient_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.patient.name} - {self.date} - {self.procedure}"
@@ -63,6 +135,10 @@ class FinancialHistory(models.Model):
         ordering = ['-date', '-created_at']
         verbose_name = 'Billing History'
         verbose_name_plural = 'Billing Histories'
+        indexes = [
+            # patient timeline (timeline.py)
+            models.Index(fields=['patient', 'date'], name='finhist_patient_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.patient.name} - {self.date} - ₱{self.amount}"
@@ -78,12 +154,63 @@ class Odontogram(models.Model):
     dentist = models.CharField(max_length=255, blank=True, null=True)
     status = models.CharField(max_length=100, blank=True, null=True)
     # notes = models.TextField(blank=True, null=True)
-    
+
+    class Meta:
+        indexes = [
+            # one tooth's history, newest first
+            models.Index(fields=["patient", "tooth_number", "date"], name="odontogram_tooth_idx"),
+        ]
+
+
+class ToothState(models.Model):
+    """
+    The current state of one charted tooth: a copy of its newest Odontogram
+    entry, written by odontogram.update_tooth_states() in the same
+    transaction as the entry. The chart reads these rows (one query)
+    instead of rebuilding the state from the full history.
+    """
+    patient = models.ForeignKey(Patient, related_name="tooth_states", on_delete=models.CASCADE)
+    tooth_number = models.PositiveIntegerField()
+    entry = models.ForeignKey(Odontogram, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    date = models.DateField()
+    dentist = models.CharField(max_length=255, blank=True, null=True)
+    status = models.CharField(max_length=100, blank=True, null=True)
+    service_names = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["patient", "tooth_number"], name="tooth_state_unique"),
+        ]
+
+    def __str__(self):
+        return f"Tooth {self.tooth_number} of patient {self.patient_id}: {self.status}"
+
 class Xray(models.Model):
+    DERIVATIVE_STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),  # not an image Pillow can read; only the original is shown
+    )
+
     patient = models.ForeignKey(Patient, related_name = 'xrays', on_delete=models.CASCADE)
     file = models.FileField(upload_to='xrays/')
     description = models.TextField(max_length=255, blank=True, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # small JPEGs made from `file` off the request path (xray_images.py)
+    thumbnail = models.FileField(upload_to='xrays/thumbs/', blank=True)
+    preview = models.FileField(upload_to='xrays/previews/', blank=True)
+    derivatives_status = models.CharField(max_length=10, choices=DERIVATIVE_STATUS_CHOICES, default='pending')
+
+    class Meta:
+        indexes = [
+            # build_xray_derivatives' backlog
+            models.Index(
+                fields=['id'],
+                condition=models.Q(derivatives_status='pending'),
+                name='xray_derivatives_pending_idx',
+            ),
+        ]
 
 def __str__(self):
         return f"Xray for {self.patient.name} uploaded on {self.uploaded_at}"
\ No newline at end of file
@@ -0,0 +1,331 @@
+"""
+Odontogram reads and the per-tooth snapshot.
+
+Odontogram rows are append-only history: one row per tooth per entry.
+ToothState keeps the newest entry of each (patient, tooth):
+
+- update_tooth_states(entries) upserts the teeth of freshly written
+  entries in one statement; call it inside the write's transaction.
+  Entries are dated on insert (auto_now_add), so a new entry is always
+  the newest for its tooth.
+- chart(patient) is the whole 32-tooth chart from one query.
+- histories(patient) is every tooth's history with its services in two
+  queries (entries + prefetched services), grouped by tooth.
+- rebuild_tooth_states() recomputes the snapshot from the history
+  (`manage.py rebuild_tooth_states`), e.g. after rows were edited by hand.
+
+Writes go through write_rows(): the add-odontogram form (rows_from_form)
+or its JSON body (rows_from_json) becomes a list of ChartRows, is
+validated as a whole (validate_rows), then inserted with one bulk insert
+for the entries, one for their service links and one ToothState upsert,
+in one transaction.
+"""
+from django.db import connection, transaction
+from django.db.models import Prefetch
+
+TOOTH_COUNT = 32
+
+TOOTH_NAMES = {
+  1: "Upper Right Third Molar (Wisdom Tooth)",
+  2: "Upper Right Second Molar",
+  3: "Upper Right First Molar",
+  4: "Upper Right Second Premolar",
+  5: "Upper Right First Premolar",
+  6: "Upper Right Canine (Cuspid)",
+  7: "Upper Right Lateral Incisor",
+  8: "Upper Right Central Incisor",
+  9: "Upper Left Central Incisor",
+  10: "Upper Left Lateral Incisor",
+  11: "Upper Left Canine (Cuspid)",
+  12: "Upper Left First Premolar",
+  13: "Upper Left Second Premolar",
+  14: "Upper Left First Molar",
+  15: "Upper Left Second Molar",
+  16: "Upper Left Third Molar (Wisdom Tooth)",
+
+  17: "Lower Left Third Molar (Wisdom Tooth)",
+  18: "Lower Left Second Molar",
+  19: "Lower Left First Molar",
+  20: "Lower Left Second Premolar",
+  21: "Lower Left First Premolar",
+  22: "Lower Left Canine (Cuspid)",
+  23: "Lower Left Lateral Incisor",
+  24: "Lower Left Central Incisor",
+  25: "Lower Right Central Incisor",
+  26: "Lower Right Lateral Incisor",
+  27: "Lower Right Canine (Cuspid)",
+  28: "Lower Right First Premolar",
+  29: "Lower Right Second Premolar",
+  30: "Lower Right First Molar",
+  31: "Lower Right Second Molar",
+  32: "Lower Right Third Molar (Wisdom Tooth)"
+}
+
+STATE_FIELDS = ["entry", "date", "dentist", "status", "service_names", "updated_at"]
+
+# rows (findings) in one odontogram entry
+MAX_ROWS = 64
+
+
+def tooth_name(number):
+    return TOOTH_NAMES.get(number, "Unknown Tooth")
+
+
+def _service_names(entries):
+    """{entry pk: "Cleaning, Filling"} for `entries`, in one query."""
+    from .models import Odontogram
+
+    Through = Odontogram.service.through
+    names = {}
+    rows = (
+        Through.objects.filter(odontogram_id__in=[e.pk for e in entries])
+        .order_by("odontogram_id", "pk")
+        .values_list("odontogram_id", "service__service_name")
+    )
+    for entry_id, name in rows:
+        names.setdefault(entry_id, []).append(name)
+    return {pk: ", ".join(value) for pk, value in names.items()}
+
+
+def _upsert(states):
+    from .models import ToothState
+
+    if not states:
+        return
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+    target = ["patient", "tooth_number"] if connection.features.supports_update_conflicts_with_target else None
+    ToothState.objects.bulk_create(
+        states,
+        update_conflicts=True,
+        unique_fields=target,
+        update_fields=STATE_FIELDS,
+        batch_size=500,
+    )
+
+
+def update_tooth_states(entries, service_names=None):
+    """
+    Point the ToothState of every tooth in `entries` (just-created Odontogram
+    rows) at its newest entry. `service_names` ({entry pk: text}) saves the
+    lookup when the caller already knows them.
+    """
+    from .models import ToothState
+
+    newest = {}
+    for entry in entries:
+        key = (entry.patient_id, entry.tooth_number)
+        if key not in newest or (entry.date, entry.pk) > (newest[key].date, newest[key].pk):
+            newest[key] = entry
+    if not newest:
+        return
+    if service_names is None:
+        service_names = _service_names(newest.values())
+
+    _upsert([
+        ToothState(
+            patient_id=entry.patient_id,
+            tooth_number=entry.tooth_number,
+            entry=entry,
+            date=entry.date,
+            dentist=entry.dentist,
+            status=entry.status,
+            service_names=service_names.get(entry.pk, ""),
+        )
+        for entry in newest.values()
+    ])
+
+
+def chart(patient):
+    """[{tooth_number, tooth_name, status, ...}] for teeth 1-32; None fields for uncharted teeth."""
+    states = {state.tooth_number: state for state in patient.tooth_states.all()}
+    teeth = []
+    for number in range(1, TOOTH_COUNT + 1):
+        state = states.get(number)
+        teeth.append({
+            "tooth_number": number,
+            "tooth_name": tooth_name(number),
+            "date": state.date.strftime("%Y-%m-%d") if state else None,
+            "dentist": state.dentist if state else None,
+            "status": state.status if state else None,
+            "services": state.service_names if state else "",
+        })
+    return teeth
+
+
+def history_entries(patient, tooth_number=None):
+    """A patient's odontogram entries, newest first, services prefetched (two queries)."""
+    from appointment.models import Service
+
+    from .models import Odontogram
+
+    entries = Odontogram.objects.filter(patient=patient)
+    if tooth_number is not None:
+        entries = entries.filter(tooth_number=tooth_number)
+    return entries.order_by("tooth_number", "-date", "-id").prefetch_related(
+        Prefetch("service", queryset=Service.objects.only("id", "service_name").order_by("pk"))
+    )
+
+
+def entry_data(entry):
+    return {
+        "tooth_name": tooth_name(entry.tooth_number),
+        "date": entry.date.strftime("%Y-%m-%d"),
+        "services": [service.service_name for service in entry.service.all()],
+        "dentist": entry.dentist,
+        "status": entry.status,
+    }
+
+
+def histories(patient):
+    """{tooth number: [entry data, newest first]} for every charted tooth."""
+    data = {}
+    for entry in history_entries(patient):
+        data.setdefault(entry.tooth_number, []).append(entry_data(entry))
+    return data
+
+
+def rebuild_tooth_states(patient_ids=None, chunk_size=2000):
+    """Recompute ToothState from the history. Returns the number of teeth written."""
+    from .models import Odontogram, ToothState
+
+    states = ToothState.objects.all()
+    entries = Odontogram.objects.order_by("patient_id", "tooth_number", "-date", "-id")
+    if patient_ids is not None:
+        states = states.filter(patient_id__in=patient_ids)
+        entries = entries.filter(patient_id__in=patient_ids)
+    states.delete()
+
+    written = 0
+    batch = []
+    last_key = None
+    for entry in entries.iterator(chunk_size=chunk_size):
+        key = (entry.patient_id, entry.tooth_number)
+        if key == last_key:
+            continue  # an older entry of a tooth already taken
+        last_key = key
+        batch.append(entry)
+        if len(batch) == chunk_size:
+            update_tooth_states(batch)
+            written += len(batch)
+            batch = []
+    update_tooth_states(batch)
+    return written + len(batch)
+
+
+class InvalidEntry(ValueError):
+    """An odontogram entry that can't be saved; the message is for the user."""
+
+
+class ChartRow:
+    """One finding of an odontogram entry: a status (and services) on one or more teeth."""
+
+    def __init__(self, teeth, status, dentist, services=()):
+        self.teeth = teeth
+        self.status = status
+        self.dentist = dentist
+        self.services = list(services)
+
+
+def _int_list(values):
+    return [int(value) for value in values]
+
+
+def rows_from_form(post):
+    """
+    ChartRows from the add-odontogram form (date_N, status_N, dentist_N,
+    tooth_number_N, services_N for N = 0, 1, ...). Incomplete rows are
+    skipped, as the form always did. Raises ValueError on non-numbers.
+    """
+    rows = []
+    index = 0
+    while f"date_{index}" in post:
+        status = post.get(f"status_{index}")
+        dentist = post.get(f"dentist_{index}")
+        teeth = post.getlist(f"tooth_number_{index}")
+        if post.get(f"date_{index}") and status and dentist and teeth:
+            rows.append(ChartRow(_int_list(teeth), status, dentist, _int_list(post.getlist(f"services_{index}"))))
+        index += 1
+    return rows
+
+
+def rows_from_json(data):
+    """
+    ChartRows from a JSON body:
+
+        {"rows": [{"teeth": [3, 4], "status": "Caries", "dentist": 2, "services": [5, 9]}, ...]}
+
+    Raises ValueError when it isn't shaped like that.
+    """
+    try:
+        return [
+            ChartRow(_int_list(row["teeth"]), str(row["status"]), str(row["dentist"]), _int_list(row.get("services", [])))
+            for row in data["rows"]
+        ]
+    except (KeyError, TypeError, AttributeError) as e:
+        raise InvalidEntry("Each row needs teeth, status and dentist.") from e
+
+
+def validate_rows(rows):
+    """
+    Check a whole batch before anything is written; returns {id: Service}
+    for the services it uses (one query). Raises InvalidEntry.
+    """
+    from appointment.models import Service
+
+    if not rows:
+        raise InvalidEntry("No valid odontogram entries were provided.")
+    if len(rows) > MAX_ROWS:
+        raise InvalidEntry(f"An entry can have at most {MAX_ROWS} rows.")
+
+    service_ids = set()
+    for row in rows:
+        if not row.teeth or not row.status or not row.dentist:
+            raise InvalidEntry("Each row needs teeth, status and dentist.")
+        bad = [tooth for tooth in row.teeth if not 1 <= tooth <= TOOTH_COUNT]
+        if bad:
+            raise InvalidEntry(f"Unknown tooth number {bad[0]}.")
+        # the same tooth picked twice in a row is one record
+        row.teeth = list(dict.fromkeys(row.teeth))
+        row.services = list(dict.fromkeys(row.services))
+        service_ids.update(row.services)
+
+    services = Service.objects.only("id", "service_name").in_bulk(service_ids)
+    if len(services) != len(service_ids):
+        raise InvalidEntry("Unknown service.")
+    return services
+
+
+def write_rows(patient, rows, services):
+    """
+    Insert the validated `rows` for `patient`, with their service links and
+    the teeth's ToothState, in one transaction. Returns the entries.
+    """
+    from .models import Odontogram
+
+    Through = Odontogram.service.through
+    # (entry, its row) in insert order
+    pairs = [
+        (Odontogram(patient=patient, tooth_number=tooth, dentist=row.dentist, status=row.status), row)
+        for row in rows
+        for tooth in row.teeth
+    ]
+    entries = [entry for entry, _ in pairs]
+
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Odontogram.objects.bulk_create(entries)
+        else:
+            # MySQL doesn't hand back the new ids, which the links need
+            for entry in entries:
+                entry.save()
+
+        Through.objects.bulk_create([
+            Through(odontogram_id=entry.pk, service_id=service_id)
+            for entry, row in pairs
+            for service_id in row.services
+        ])
+        update_tooth_states(entries, service_names={
+            entry.pk: ", ".join(services[s].service_name for s in row.services)
+            for entry, row in pairs
+        })
+    return entries
@@ -0,0 +1,228 @@
+"""
+Patient search (the patient list's search box and its live-search AJAX).
+
+Matches name, email, address and telephone, best matches first, without
+scanning the table:
+
+- PostgreSQL: pg_trgm GIN indexes on name / email_normalized / address.
+  Substring matches (ILIKE) and fuzzy word matches (`<%`, typo tolerant)
+  both use them; ranked by word_similarity().
+- SQLite: an FTS5 shadow table (patient_search, rowid = patient id) kept in
+  step by the Patient signals (signals.py); word-prefix matches ranked by
+  bm25().
+- Telephone: Patient.phone_digits (digits only, +63 written as 0) with a
+  B-tree index; a digit query matches it as a prefix (range scan).
+- Other databases (MySQL): one OR-ed query with the same filters.
+
+install() / uninstall() are called from migrations. Bulk writes skip the
+signals: run `manage.py rebuild_patient_search` after them (SQLite).
+"""
+import re
+
+from django.db import connection
+
+MAX_RESULTS = 50
+
+FTS_TABLE = "patient_search"
+# bm25 weights per FTS column: name, email, address, phone
+FTS_WEIGHTS = "10.0, 5.0, 1.0, 5.0"
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS patient_name_trgm ON patient_patient USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS patient_email_trgm ON patient_patient USING gin (email_normalized gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS patient_address_trgm ON patient_patient USING gin (address gin_trgm_ops)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS patient_name_trgm",
+    "DROP INDEX IF EXISTS patient_email_trgm",
+    "DROP INDEX IF EXISTS patient_address_trgm",
+]
+
+SQLITE_FORWARD = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, email, address, phone,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, email, address, phone)
+    SELECT id, name, email_normalized, address, phone_digits FROM patient_patient
+    """,
+]
+SQLITE_BACKWARD = [f"DROP TABLE IF EXISTS {FTS_TABLE}"]
+
+STATEMENTS = {
+    "postgresql": (POSTGRES_FORWARD, POSTGRES_BACKWARD),
+    "sqlite": (SQLITE_FORWARD, SQLITE_BACKWARD),
+}
+
+
+def normalize_phone(telephone):
+    """Digits only; a leading +63 / 63 country code becomes the local 0."""
+    telephone = (telephone or "").strip()
+    digits = re.sub(r"\D", "", telephone)
+    # "+63 917..." (also a partial one typed into search) or a bare 12-digit 63...
+    if digits.startswith("63") and (telephone.startswith("+") or len(digits) == 12):
+        digits = "0" + digits[2:]
+    return digits
+
+
+def phone_query(query):
+    """The digits to prefix-match when the query looks like a phone number."""
+    if re.fullmatch(r"[\d\s()+-]+", query or ""):
+        digits = normalize_phone(query)
+        if len(digits) >= 3:
+            return digits
+    return None
+
+
+def _run(schema_editor, forward):
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if not statements:
+        return
+    for sql in statements[0 if forward else 1]:
+        schema_editor.execute(sql)
+
+
+def install(schema_editor):
+    _run(schema_editor, forward=True)
+
+
+def uninstall(schema_editor):
+    _run(schema_editor, forward=False)
+
+
+def uses_fts():
+    return connection.vendor == "sqlite"
+
+
+def search_patient_ids(query, limit=10):
+    """Ids of the patients best matching `query`, best first (at most `limit`)."""
+    query = (query or "").strip()
+    limit = min(limit, MAX_RESULTS)
+    if not query:
+        return []
+    if connection.vendor == "postgresql":
+        return _search_postgres(query, limit)
+    if uses_fts():
+        return _search_fts(query, limit)
+    return _search_fallback(query, limit)
+
+
+def search_patients(query, limit=10, fields=None):
+    """Patients best matching `query`, best first; `fields` narrows the columns loaded."""
+    from .models import Patient
+
+    ids = search_patient_ids(query, limit)
+    patients = Patient.objects.all()
+    if fields:
+        patients = patients.only(*fields)
+    found = patients.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
+
+
+def _phone_range(digits):
+    # every string starting with `digits` sorts in [digits, digits + ":")
+    return digits, digits + ":"
+
+
+def _search_postgres(query, limit):
+    like = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    digits = phone_query(query)
+    low, high = _phone_range(digits) if digits else ("", "")
+    sql = """
+        SELECT id FROM (
+            SELECT id, name, GREATEST(
+                word_similarity(%(q)s, name),
+                word_similarity(%(q)s, email_normalized),
+                0.5 * word_similarity(%(q)s, address),
+                CASE WHEN phone_digits >= %(low)s AND phone_digits < %(high)s THEN 1 ELSE 0 END
+            ) AS rank
+            FROM patient_patient
+            WHERE name ILIKE %(like)s
+               OR email_normalized LIKE lower(%(like)s)
+               OR address ILIKE %(like)s
+               OR %(q)s <%% name
+               OR %(q)s <%% email_normalized
+               OR (%(has_phone)s AND phone_digits >= %(low)s AND phone_digits < %(high)s)
+        ) matches
+        ORDER BY rank DESC, name, id
+        LIMIT %(limit)s
+    """
+    params = {"q": query, "like": like, "low": low, "high": high, "has_phone": bool(digits), "limit": limit}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def fts_match(query):
+    """FTS5 MATCH expression: every word as a prefix, phone digits against the phone column."""
+    digits = phone_query(query)
+    if digits:
+        return f'phone : "{digits}"*'
+    words = re.findall(r"\w+", query.lower())
+    return " AND ".join(f'"{word}"*' for word in words)
+
+
+def _search_fts(query, limit):
+    match = fts_match(query)
+    if not match:
+        return []
+    sql = f"""
+        SELECT rowid FROM {FTS_TABLE}
+        WHERE {FTS_TABLE} MATCH %s
+        ORDER BY bm25({FTS_TABLE}, {FTS_WEIGHTS}), rowid
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_fallback(query, limit):
+    from django.db.models import Q
+
+    from .models import Patient
+
+    condition = (
+        Q(name__icontains=query)
+        | Q(email_normalized__contains=query.lower())
+        | Q(address__icontains=query)
+    )
+    digits = phone_query(query)
+    if digits:
+        low, high = _phone_range(digits)
+        condition |= Q(phone_digits__gte=low, phone_digits__lt=high)
+    return list(Patient.objects.filter(condition).order_by("name", "id").values_list("id", flat=True)[:limit])
+
+
+def index_patient(patient):
+    """Write one patient's row of the SQLite shadow table."""
+    if not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [patient.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, email, address, phone) VALUES (%s, %s, %s, %s, %s)",
+            [patient.pk, patient.name, patient.email_normalized, patient.address, patient.phone_digits],
+        )
+
+
+def unindex_patient(patient_id):
+    if not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [patient_id])
+
+
+def rebuild():
+    """Rebuild the SQLite shadow table from patient_patient. Returns the row count."""
+    if not uses_fts():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(SQLITE_FORWARD[1])
+        return cursor.rowcount
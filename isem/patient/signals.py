@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import search
+from .models import Patient
+
+
+@receiver(post_save, sender=Patient)
+def index_patient_for_search(sender, instance, **kwargs):
+    """Keep the SQLite search shadow table in step (no-op elsewhere)."""
+    search.index_patient(instance)
+
+
+@receiver(post_delete, sender=Patient)
+def unindex_patient_for_search(sender, instance, **kwargs):
+    search.unindex_patient(instance.pk)
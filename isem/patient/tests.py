@@ -1,3 +1,454 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from datetime import date, datetime, time
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from appointment import booking
+from appointment.models import Appointment, Service
+from billing.models import BillingRecord
+from . import id_allocator, odontogram, search, timeline, xray_images
+from .models import FinancialHistory, IdCounter, MedicalHistory, Odontogram, Patient, ToothState, Xray
+
+
+def make_patient(name, email, **fields):
+    return Patient.objects.create(name=name, email=email, address="", telephone="09170000000", age=30, **fields)
+
+
+def image_file(image, format="PNG"):
+    buffer = BytesIO()
+    image.save(buffer, format)
+    return buffer.getvalue()
+
+
+class PatientEmailTests(TestCase):
+    def test_email_is_unique_unless_blank(self):
+        make_patient("Ana", "ana@example.com")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_patient("Ana again", " ANA@example.com ")
+        make_patient("No email 1", None)
+        make_patient("No email 2", "")
+        self.assertEqual(Patient.objects.filter(email_normalized="").count(), 2)
+
+    def test_email_in_use_skips_the_patient_itself(self):
+        ana = make_patient("Ana", "ana@example.com")
+        self.assertTrue(Patient.email_in_use("Ana@Example.com"))
+        self.assertFalse(Patient.email_in_use("ana@example.com", exclude_pk=ana.pk))
+        self.assertFalse(Patient.email_in_use(""))
+
+
+class GuestIdTests(TestCase):
+    """Guest IDs come from id_allocator in blocks; repair_guest_ids fixes the old ones."""
+
+    def setUp(self):
+        # a fresh allocator per test: the module one keeps spare numbers in memory
+        allocator = id_allocator.IdAllocator(id_allocator.GUEST_SERIES, block_size=5)
+        patcher = mock.patch.object(id_allocator, "guest_ids", allocator)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.allocator = allocator
+
+    def counter(self):
+        return IdCounter.objects.get(name=id_allocator.GUEST_SERIES).value
+
+    def test_numbers_come_in_blocks_and_spares_cost_no_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.allocator.take(3), [1, 2, 3])
+        self.assertEqual(self.counter(), 5)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.allocator.take(2), [4, 5])
+        self.assertEqual(self.allocator.take(1), [6])
+        self.assertEqual(self.counter(), 10)
+
+    def test_a_rolled_back_block_is_handed_out_again(self):
+        with transaction.atomic():
+            self.assertEqual(self.allocator.take(2), [1, 2])
+            transaction.set_rollback(True)
+        self.assertEqual(self.counter(), 0)
+        self.assertEqual(self.allocator.take(2), [1, 2])
+
+    def test_guest_patients_get_distinct_ids(self):
+        # the block's spare numbers are kept once the first guest commits
+        with self.captureOnCommitCallbacks(execute=True):
+            first = booking.find_or_create_patient("one@example.com")
+        second = booking.find_or_create_patient("two@example.com")
+
+        self.assertTrue(first.is_guest)
+        self.assertEqual(id_allocator.guest_number(first.guest_id), 1)
+        self.assertEqual(id_allocator.guest_number(second.guest_id), 2)
+        self.assertEqual(booking.find_or_create_patient("ONE@example.com"), first)
+
+    def test_repair_gives_duplicates_and_blanks_fresh_ids(self):
+        IdCounter.objects.filter(name=id_allocator.GUEST_SERIES).update(value=7)
+        keeper = make_patient("Ana", "ana@example.com", is_guest=True, guest_id="P-000007-T")
+        copy = make_patient("Ben", "ben@example.com", is_guest=True, guest_id="P-000007-T")
+        blank = make_patient("Cy", "cy@example.com", is_guest=True, guest_id="")
+        member = make_patient("Di", "di@example.com", guest_id="P-000007-T")
+
+        out = StringIO()
+        call_command("repair_guest_ids", "--dry-run", stdout=out)
+        self.assertIn("1 duplicated guest ID(s); 2 patient(s) need a new one.", out.getvalue())
+        copy.refresh_from_db()
+        self.assertEqual(copy.guest_id, "P-000007-T")
+
+        call_command("repair_guest_ids", stdout=StringIO())
+
+        ids = {p.pk: p.guest_id for p in Patient.objects.all()}
+        self.assertEqual(ids[keeper.pk], "P-000007-T")
+        self.assertEqual(ids[member.pk], "P-000007-T")
+        self.assertEqual({ids[copy.pk], ids[blank.pk]}, {"P-000008-T", "P-000009-T"})
+
+
+@skipUnless(search.uses_fts(), "the FTS5 shadow table is SQLite only")
+class PatientSearchTests(TestCase):
+    """search.search_patient_ids on SQLite: ranked FTS5 word prefixes and phone prefixes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        def patient(name, email, address="", telephone="0281234567"):
+            return Patient.objects.create(name=name, email=email, address=address, telephone=telephone, age=30)
+
+        cls.maria = patient("Maria Santos", "maria@example.com", address="Quezon City")
+        cls.ben = patient("Ben Cruz", "ben@example.com", address="12 Maria Clara St")
+        cls.jose = patient("José Rizal", "jrizal@example.com", telephone="+63 917 123 4567")
+
+    def test_name_matches_rank_above_address_matches(self):
+        self.assertEqual(search.search_patient_ids("mari"), [self.maria.pk, self.ben.pk])
+
+    def test_every_word_matches_as_a_prefix(self):
+        self.assertEqual(search.search_patient_ids("san mar"), [self.maria.pk])
+        self.assertEqual(search.search_patient_ids("jose"), [self.jose.pk])
+        self.assertEqual(search.search_patient_ids("clara quezon"), [])
+
+    def test_phone_matches_its_digit_prefix_in_any_format(self):
+        for query in ("0917", "0917 123", "+63 917-123", "(0917) 1234567"):
+            self.assertEqual(search.search_patient_ids(query), [self.jose.pk], query)
+        self.assertEqual(search.search_patient_ids("0918"), [])
+
+    def test_bulk_writes_are_found_after_a_rebuild(self):
+        Patient.objects.bulk_create([
+            Patient(name="Liza Soberano", email="liza@example.com", address="", telephone="", age=30),
+        ])
+        self.assertEqual(search.search_patient_ids("liza"), [])
+        search.rebuild()
+        self.assertEqual(len(search.search_patient_ids("liza")), 1)
+
+
+class OdontogramWriteTests(TestCase):
+    """A whole odontogram entry is validated first, then written in one transaction."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = make_patient("Ana", "ana@example.com")
+        cls.filling = Service.objects.create(service_name="Filling", duration=30, price=800)
+
+    def row(self, teeth=(3,), status="Caries", dentist="Dr A", services=()):
+        return odontogram.ChartRow(list(teeth), status, dentist, list(services))
+
+    def assertRejected(self, rows, message):
+        with self.assertRaisesMessage(odontogram.InvalidEntry, message):
+            odontogram.validate_rows(rows)
+
+    def test_validate_rows_rejections(self):
+        self.assertRejected([], "No valid odontogram entries")
+        self.assertRejected([self.row()] * (odontogram.MAX_ROWS + 1), f"at most {odontogram.MAX_ROWS} rows")
+        self.assertRejected([self.row(), self.row(status="")], "needs teeth, status and dentist")
+        self.assertRejected([self.row(teeth=())], "needs teeth, status and dentist")
+        self.assertRejected([self.row(teeth=(3, 33))], "Unknown tooth number 33")
+        self.assertRejected([self.row(services=[self.filling.pk, 999])], "Unknown service")
+
+    def test_validate_rows_folds_repeated_teeth_and_services(self):
+        row = self.row(teeth=(3, 3, 4), services=[self.filling.pk, self.filling.pk])
+        self.assertEqual(odontogram.validate_rows([row]), {self.filling.pk: self.filling})
+        self.assertEqual((row.teeth, row.services), ([3, 4], [self.filling.pk]))
+
+    def test_malformed_json_is_an_invalid_entry(self):
+        for body in ({}, {"rows": [{"teeth": [3]}]}, {"rows": "3"}):
+            with self.assertRaises(odontogram.InvalidEntry):
+                odontogram.rows_from_json(body)
+
+    def test_write_rows_writes_entries_links_and_states(self):
+        rows = [self.row(teeth=(3, 4), services=[self.filling.pk]), self.row(teeth=(5,), status="Missing")]
+        entries = odontogram.write_rows(self.patient, rows, odontogram.validate_rows(rows))
+
+        self.assertEqual([e.tooth_number for e in entries], [3, 4, 5])
+        self.assertEqual(Odontogram.service.through.objects.count(), 2)
+        states = dict(ToothState.objects.filter(patient=self.patient).values_list("tooth_number", "status"))
+        self.assertEqual(states, {3: "Caries", 4: "Caries", 5: "Missing"})
+
+    def test_write_rows_is_all_or_nothing(self):
+        rows = [self.row(teeth=(3, 4), services=[self.filling.pk])]
+        services = odontogram.validate_rows(rows)
+        with mock.patch.object(odontogram, "update_tooth_states", side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                odontogram.write_rows(self.patient, rows, services)
+
+        self.assertFalse(Odontogram.objects.exists())
+        self.assertFalse(Odontogram.service.through.objects.exists())
+        self.assertFalse(ToothState.objects.exists())
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_one_bad_row_rejects_the_whole_entry(self):
+        body = {"rows": [{"teeth": [3], "status": "Caries", "dentist": "Dr A"}, {"teeth": [40], "status": "Caries", "dentist": "Dr A"}]}
+        response = self.client.post(
+            reverse("patient:add_odontogram", args=[self.patient.pk]), json.dumps(body),
+            content_type="application/json", HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+        self.assertEqual(response.json(), {"success": False, "error": "Unknown tooth number 40."})
+        self.assertFalse(Odontogram.objects.exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class UpdateOdontogramTests(TestCase):
+    """update_odontogram appends an entry through odontogram.write_rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = make_patient("Ana", "ana@example.com")
+
+    def post(self, **data):
+        return self.client.post(reverse("patient:update_odontogram", args=[self.patient.pk]), data)
+
+    def test_new_state_is_appended_and_becomes_the_tooth_state(self):
+        self.post(tooth_number=3, status="Caries", dentist="Dr A")
+        response = self.post(tooth_number=3, status="Filled", dentist="Dr A")
+
+        self.assertEqual(response.json()["data"]["status"], "Filled")
+        self.assertEqual(Odontogram.objects.filter(patient=self.patient, tooth_number=3).count(), 2)
+        self.assertEqual(ToothState.objects.get(patient=self.patient, tooth_number=3).status, "Filled")
+
+    def test_invalid_entry_writes_nothing(self):
+        self.assertEqual(self.post(tooth_number=40, status="Caries", dentist="Dr A").status_code, 400)
+        self.assertEqual(self.post(tooth_number="x", status="Caries", dentist="Dr A").status_code, 400)
+        self.assertEqual(self.post(tooth_number=3, status="Caries", dentist="Dr A", services=[999]).status_code, 400)
+        self.assertFalse(Odontogram.objects.exists())
+
+
+class XrayRenderTests(SimpleTestCase):
+    """xray_images.render: 8-bit JPEG derivatives from whatever Pillow opens."""
+
+    def open_jpeg(self, data):
+        image = Image.open(BytesIO(data))
+        self.assertEqual(image.format, "JPEG")
+        return image
+
+    def test_16_bit_radiograph_is_scaled_not_clipped(self):
+        thumbnail, preview = xray_images.render(BytesIO(image_file(Image.new("I;16", (2000, 1000), 40000))))
+
+        thumbnail, preview = self.open_jpeg(thumbnail), self.open_jpeg(preview)
+        self.assertEqual((thumbnail.mode, thumbnail.size), ("L", (320, 160)))
+        self.assertEqual((preview.mode, preview.size), ("L", (1600, 800)))
+        # 40000 / 256; clipping to 8 bits would give 255
+        self.assertAlmostEqual(preview.getpixel((800, 400)), 156, delta=2)
+
+    def test_transparency_is_flattened_onto_white(self):
+        image = Image.new("RGBA", (100, 100), (0, 0, 0, 0))
+        image.paste((255, 0, 0, 255), (25, 25, 75, 75))
+        _, preview = xray_images.render(BytesIO(image_file(image)))
+
+        preview = self.open_jpeg(preview)
+        self.assertEqual(preview.mode, "RGB")
+        corner, middle = preview.getpixel((2, 2)), preview.getpixel((50, 50))
+        self.assertTrue(all(channel > 245 for channel in corner), corner)
+        self.assertGreater(middle[0], 240)
+        self.assertLess(middle[1], 15)
+
+    def test_a_file_that_is_not_an_image_raises(self):
+        with self.assertRaises(UnidentifiedImageError):
+            xray_images.render(BytesIO(b"not an image"))
+
+
+class BuildXrayDerivativesTests(TestCase):
+    """`manage.py build_xray_derivatives`: pending X-rays only, resumable chunk by chunk."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = make_patient("Ana", "ana@example.com")
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def xray(self, name, data, **fields):
+        return Xray.objects.create(patient=self.patient, file=SimpleUploadedFile(name, data), **fields)
+
+    def build(self, *args):
+        out = StringIO()
+        call_command("build_xray_derivatives", "--workers", "1", "--chunk-size", "1", *args, stdout=out)
+        return out.getvalue()
+
+    def statuses(self):
+        return list(Xray.objects.order_by("pk").values_list("derivatives_status", flat=True))
+
+    def test_interrupted_run_resumes_with_what_is_left(self):
+        png = image_file(Image.new("L", (400, 400), 128))
+        self.xray("a.png", png)
+        second = self.xray("b.png", png)
+        self.xray("notes.png", b"not an image")
+        done = self.xray("c.png", png, derivatives_status="ready")
+
+        render_stored = xray_images.render_stored
+        calls = []
+
+        def crash_on_second(name):
+            calls.append(name)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return render_stored(name)
+
+        with mock.patch.object(xray_images, "render_stored", crash_on_second), self.assertRaises(KeyboardInterrupt):
+            self.build()
+        self.assertEqual(self.statuses(), ["ready", "pending", "pending", "ready"])
+
+        with self.assertLogs("patient.xray_images", "WARNING"):
+            output = self.build()
+        self.assertIn("2 X-ray(s) to process.", output)
+        self.assertEqual(self.statuses(), ["ready", "ready", "failed", "ready"])
+        second.refresh_from_db()
+        self.assertTrue(second.thumbnail.name.startswith("xrays/thumbs/"))
+        self.assertEqual(Image.open(second.preview.path).size, (400, 400))
+
+        # already ready before the run: left alone
+        done.refresh_from_db()
+        self.assertFalse(done.thumbnail)
+
+        self.assertIn("0 X-ray(s) to process.", self.build())
+        # --retry-failed picks the unreadable file up again (and it fails again)
+        with self.assertLogs("patient.xray_images", "WARNING"):
+            self.assertIn("1 X-ray(s) to process.", self.build("--retry-failed"))
+
+
+class TimelinePageTests(TestCase):
+    """Keyset pages of the merged timeline: every entry exactly once, newest first."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = make_patient("Ana", "ana@example.com")
+        cls.days = [date(2026, 3, 2), date(2026, 3, 1)]
+
+    def walk(self, tab, per_page):
+        entries, cursor = timeline.timeline_page(self.patient, tab, per_page=per_page)
+        pages = [entries]
+        while cursor:
+            entries, cursor = timeline.timeline_page(self.patient, tab, cursor, per_page=per_page)
+            pages.append(entries)
+        return pages
+
+    def keys(self, pages):
+        return [(entry["date"], entry["source"], entry["id"]) for page in pages for entry in page]
+
+    def test_treatment_pages_cross_equal_dates_without_gaps(self):
+        # three manual entries and two appointments on each of two days
+        for day in self.days:
+            for _ in range(3):
+                MedicalHistory.objects.create(patient=self.patient, date=day, dentist="Dr A", findings="ok")
+            for hour in (9, 10):
+                Appointment.objects.create(
+                    patient=self.patient, email="ana@example.com", date=day, time=time(hour), status="done",
+                )
+
+        pages = self.walk("treatment", per_page=2)
+        keys = self.keys(pages)
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 2, 2])
+        self.assertEqual(len(set(keys)), 10)
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        # manual entries sort before appointments within a day, page breaks fall mid-day
+        self.assertEqual([source for _, source, _ in keys[:5]], ["manual"] * 3 + ["appointment"] * 2)
+
+    def test_billing_pages_cross_equal_timestamps(self):
+        issued = timezone.make_aware(datetime.combine(self.days[0], time(10)))
+        for _ in range(3):
+            FinancialHistory.objects.create(patient=self.patient, date=self.days[0])
+            BillingRecord.objects.create(patient=self.patient, patient_name="Ana", type="Cleaning", amount=500, date_issued=issued)
+
+        keys = self.keys(self.walk("billing", per_page=4))
+
+        self.assertEqual(len(keys), 6)
+        self.assertEqual(len(set(keys)), 6)
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_last_page_has_no_cursor(self):
+        MedicalHistory.objects.create(patient=self.patient, date=self.days[0], dentist="Dr A", findings="ok")
+        entries, cursor = timeline.timeline_page(self.patient, "treatment", per_page=1)
+        self.assertEqual(len(entries), 1)
+        self.assertIsNone(cursor)
+
+    def test_bad_cursor_starts_over(self):
+        MedicalHistory.objects.create(patient=self.patient, date=self.days[0], dentist="Dr A", findings="ok")
+        entries, _ = timeline.timeline_page(self.patient, "treatment", "not-a-cursor")
+        self.assertEqual(len(entries), 1)
+
+
+class MergeDuplicatesTests(TransactionTestCase):
+    """Migration 0032 merges the patients sharing an email before adding patient_email_unique."""
+
+    before = [("patient", "0031_xray_derivatives")]
+    after = [("patient", "0032_patient_email_unique")]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        self.old_apps = executor.loader.project_state(self.before).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.after)
+
+    def old_patient(self, name, email, **fields):
+        OldPatient = self.old_apps.get_model("patient", "Patient")
+        return OldPatient.objects.create(
+            name=name, email=email, email_normalized=email.strip().lower(),
+            address="", telephone="09170000000", age=30, **fields
+        ).pk
+
+    def test_duplicates_merge_into_the_oldest_record(self):
+        old = self.old_apps.get_model
+        user_id = old("auth", "User").objects.create(username="ana", email="ana@example.com").pk
+        oldest = self.old_patient("Ana", "ana@example.com", is_guest=True)
+        newer = self.old_patient("Ana Cruz", "Ana@Example.com ", user_id=user_id)
+        old("patient", "MedicalHistory").objects.create(patient_id=newer, date=date(2026, 1, 5))
+        appointment = old("appointment", "Appointment").objects.create(
+            email="ana@example.com", patient_id=newer, date=date(2026, 3, 2), time=time(9),
+        ).pk
+        ToothStates = old("patient", "ToothState").objects
+        ToothStates.create(patient_id=oldest, tooth_number=11, date=date(2026, 1, 1), status="caries")
+        ToothStates.create(patient_id=newer, tooth_number=11, date=date(2026, 2, 1), status="filled")
+
+        self.migrate()
+
+        self.assertEqual(list(Patient.objects.values_list("pk", flat=True)), [oldest])
+        patient = Patient.objects.get()
+        self.assertEqual(patient.user_id, user_id)
+        self.assertEqual(MedicalHistory.objects.get().patient, patient)
+        self.assertEqual(Appointment.objects.get(pk=appointment).patient, patient)
+        self.assertEqual(list(patient.tooth_states.values_list("status", flat=True)), ["filled"])
+
+    def test_a_second_login_keeps_its_record_without_the_email(self):
+        Users = self.old_apps.get_model("auth", "User").objects
+        first = self.old_patient("Ana", "ana@example.com", user_id=Users.create(username="ana").pk)
+        second = self.old_patient("Ana", "ana@example.com", user_id=Users.create(username="ana2").pk)
+
+        self.migrate()
+
+        self.assertEqual(Patient.for_email("ana@example.com").pk, first)
+        self.assertEqual(Patient.objects.get(pk=second).email_normalized, "")
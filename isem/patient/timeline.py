@@ -0,0 +1,170 @@
+"""
+The medical history page's treatment and billing tabs, one page at a time.
+
+Each tab merges two sources in the database with UNION ALL instead of
+loading both and sorting in Python:
+
+- treatment: MedicalHistory rows + the patient's done/completed
+  appointments (appt_patient_status_idx);
+- billing: FinancialHistory rows + BillingRecords (billing_patient_date_idx).
+
+Every branch selects the same columns (see COLUMNS), newest first on
+(day, source, entry_id). Pages are keyset cursors over that key
+(core.pagination.pack_cursor): the "after the cursor" condition is pushed
+into each branch, so every branch is an index range on (patient, date),
+and only one page of rows leaves the database.
+
+    entries, next_cursor = timeline_page(patient, "treatment", cursor)
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.db import models
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from core.pagination import pack_cursor, unpack_cursor
+
+PAGE_SIZE = 20
+
+TABS = ("treatment", "billing")
+
+# the columns of each tab, in UNION order (every branch annotates them all)
+COLUMNS = {
+    "treatment": ["day", "source", "entry_id", "dentist_label", "services_text", "amount_value",
+                  "findings_text", "prescriptions_text"],
+    "billing": ["day", "source", "entry_id", "bill_type_text", "payment_mode_text", "amount_value",
+                "total_bill_value", "balance_value"],
+}
+
+# JSON keys for the columns (what the old template context called them)
+OUTPUT_NAMES = {
+    "day": "date", "entry_id": "id", "dentist_label": "dentist", "services_text": "services",
+    "amount_value": "amount", "findings_text": "findings", "prescriptions_text": "prescriptions",
+    "bill_type_text": "bill_type", "payment_mode_text": "payment_mode",
+    "total_bill_value": "total_bill", "balance_value": "balance",
+}
+
+
+def _text(value):
+    return Value(value, output_field=models.CharField())
+
+
+def _money(expression):
+    if not hasattr(expression, "resolve_expression"):
+        expression = Value(expression)
+    return models.ExpressionWrapper(expression, output_field=models.DecimalField(max_digits=10, decimal_places=2))
+
+
+def _branches(patient, tab):
+    """(source, queryset annotated with COLUMNS[tab], date column) per source."""
+    from appointment.models import Appointment
+    from billing.models import BillingRecord
+
+    if tab == "treatment":
+        return [
+            ("manual", patient.medical_history.annotate(
+                day=F("date"),
+                source=_text("manual"),
+                entry_id=F("id"),
+                dentist_label=F("dentist"),
+                services_text=F("services"),
+                amount_value=_money(F("amount")),
+                findings_text=F("findings"),
+                prescriptions_text=F("prescriptions"),
+            ), "date"),
+            ("appointment", Appointment.objects.filter(patient=patient, status__in=["done", "completed"]).annotate(
+                day=F("date"),
+                source=_text("appointment"),
+                entry_id=F("id"),
+                dentist_label=Coalesce(F("dentist__name"), F("dentist_name")),
+                services_text=F("service_names"),
+                amount_value=_money(F("total_price")),
+                findings_text=_text(""),
+                prescriptions_text=_text(""),
+            ), "date"),
+        ]
+    return [
+        ("manual", patient.financial_history.annotate(
+            day=F("date"),
+            source=_text("manual"),
+            entry_id=F("id"),
+            bill_type_text=F("bill_type"),
+            payment_mode_text=F("payment_mode"),
+            amount_value=_money(F("amount")),
+            total_bill_value=_money(F("total_bill")),
+            balance_value=_money(F("balance")),
+        ), "date"),
+        ("appointment", BillingRecord.objects.filter(patient=patient).annotate(
+            day=TruncDate("date_issued"),
+            source=_text("appointment"),
+            entry_id=F("id"),
+            bill_type_text=_text("Services"),
+            payment_mode_text=_text("N/A"),
+            amount_value=_money(F("amount")),
+            total_bill_value=_money(F("amount")),
+            balance_value=_money(0),
+        ), "date_issued"),
+    ]
+
+
+def _after(source, key):
+    """This branch's rows that come after `key` = (day, source, id), newest first."""
+    day, key_source, entry_id = key
+    if source < key_source:
+        # the whole day sorts after the key's source
+        return Q(day__lte=day)
+    if source > key_source:
+        return Q(day__lt=day)
+    return Q(day__lt=day) | Q(day=day, entry_id__lt=entry_id)
+
+
+def _date_bound(column, day):
+    """
+    A plain range on the branch's own date column so the (patient, date)
+    index narrows the scan; `day` filters on the annotation can't use it.
+    Billing's date_issued is a datetime: before the local midnight ending
+    `day` (TruncDate works in the current time zone too).
+    """
+    if column == "date_issued":
+        return Q(date_issued__lt=timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min)))
+    return Q(**{f"{column}__lte": day})
+
+
+def decode(cursor):
+    """(day, source, id) from a timeline cursor, or None."""
+    if not cursor:
+        return None
+    try:
+        (day, source, entry_id), _ = unpack_cursor(cursor)
+        return date.fromisoformat(day), str(source), int(entry_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def timeline_page(patient, tab, cursor=None, per_page=PAGE_SIZE):
+    """
+    ([entry dicts], next cursor or None) for one page of `tab`, newest
+    first. Entries carry the keys the tab's table shows plus "source".
+    """
+    columns = COLUMNS[tab]
+    key = decode(cursor)
+
+    union = None
+    for source, queryset, column in _branches(patient, tab):
+        if key is not None:
+            queryset = queryset.filter(_date_bound(column, key[0])).filter(_after(source, key))
+        # Meta.ordering isn't allowed inside a compound statement
+        queryset = queryset.order_by().values(*columns)
+        union = queryset if union is None else union.union(queryset, all=True)
+
+    rows = list(union.order_by("-day", "-source", "-entry_id")[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    entries = [{OUTPUT_NAMES.get(name, name): row[name] for name in columns} for row in rows]
+    next_cursor = None
+    if more:
+        last = rows[-1]
+        next_cursor = pack_cursor([last["day"], last["source"], last["entry_id"]])
+    return entries, next_cursor
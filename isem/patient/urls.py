@@ -11,12 +11,15 @@ urlpatterns = [
     path("<int:pk>/", views.medical_history, name="medical_history"),
     path("<int:patient_id>/add_history/", views.add_medical_history, name="add_medical_history"),
     path("<int:pk>/financial_history/", views.medical_history, name="financial_history"),
+    path("<int:pk>/timeline/<str:tab>/", views.patient_timeline, name="timeline"),
     path("<int:patient_id>/add_financial_history/", views.add_financial_history, name="add_financial_history"),
     path("<int:patient_id>/odontogram/", views.odontogram, name="odontogram"),
     path("<int:patient_id>/add_odontogram/", views.add_odontogram, name="add_odontogram"),
     path("<int:patient_id>/odontogram_history/", views.odontogram_history, name="odontogram_history"),
     path("<int:patient_id>/update_odontogram/", views.update_odontogram, name="update_odontogram"),
     path("<int:patient_id>/odontogram/history/<int:tooth_number>/", views.odontogram_history, name="odontogram_tooth_history"),
+    path("<int:patient_id>/odontogram/histories/", views.odontogram_histories, name="odontogram_histories"),
+    path("<int:patient_id>/odontogram/state/", views.odontogram_state, name="odontogram_state"),
     path('<int:xray_id>/delete-xray/', views.delete_xray, name='delete_xray'),
 
 ]
\ No newline at end of file
@@ -1,13 +1,19 @@
 from sys import path
+import json
 from django.contrib import messages                 
 from django.shortcuts import get_object_or_404, redirect, render
-from django.http import JsonResponse
+from django.db import transaction
+from django.http import Http404, JsonResponse
 from django.contrib.auth.decorators import login_required, user_passes_test
-from .models import Patient, MedicalHistory, FinancialHistory, Odontogram
+from core.pagination import KeysetPage, keyset_paginate
+
+from . import odontogram as odontogram_chart, search, timeline, xray_images
+from .odontogram import TOOTH_NAMES
+from .id_allocator import next_guest_id
+from .models import Patient, MedicalHistory, FinancialHistory
 from appointment.models import Dentist, Service
 
 #pagination import
-from django.core.paginator import Paginator
 from django.shortcuts import render
 
 
@@ -22,12 +28,12 @@ def patient_records(request):
 
 
         is_guest = request.POST.get("is_guest") == "true"  
+        # one patient per email (patient_email_unique), guest or registered
+        if Patient.email_in_use(email):
+            messages.error(request, "A patient with this email already exists.")
+            return redirect("patient:list")
+
         if not is_guest:
-            # Registered patient: check for existing email
-            if email and Patient.objects.filter(email=email).exists():
-                messages.error(request, "A patient with this email already exists.")
-                return redirect("patient:list")
-            
             Patient.objects.create(
                 name=name,
                 address=address,
@@ -42,8 +48,6 @@ def patient_records(request):
         else:
             
             # Guest patient: temporary ID
-            total = Patient.objects.filter(is_guest=True).count() + 1
-            temp_id = f"P-{total:06d}-T"
             Patient.objects.create(
                 name=name,
                 address=address,
@@ -52,37 +56,41 @@ def patient_records(request):
                 occupation=occupation,
                 email=email,  
                 is_guest=True,
-                guest_id=temp_id
+                guest_id=next_guest_id()
             )
 
         return redirect("patient:list")
     if request.user.is_staff or request.user.is_superuser:
-        qs = Patient.objects.all().order_by('id')
-
         search_query = request.GET.get('search', '')  # Get search parameter
-        
+        is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+        fields = ['id', 'name', 'email', 'telephone', 'address']
+
         if search_query:
-            # Search by name, email, telephone, or address
-            qs = Patient.objects.filter(
-                name__icontains=search_query
-            ) | Patient.objects.filter(
-                email__icontains=search_query
-            ) | Patient.objects.filter(
-                telephone__icontains=search_query
-            ) | Patient.objects.filter(
-                address__icontains=search_query
-            )
-            qs = qs.order_by('id')
+            # Search by name, email, telephone, or address: indexed, best matches first
+            limit = 10 if is_ajax else search.MAX_RESULTS
+            qs = search.search_patients(search_query, limit, fields=fields if is_ajax else None)
         else:
             qs = Patient.objects.all().order_by('name')
-        
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            patients_data = list(qs[:10].values('id', 'name', 'email', 'telephone', 'address'))
+
+        if is_ajax:
+            patients_data = [
+                {field: getattr(patient, field) for field in fields}
+                for patient in qs[:10]
+            ]
 
             return JsonResponse({'patients': patients_data})
-        paginator = Paginator(qs, 5)  # 5 records per page
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+        if search_query:
+            # ranked top matches on one page
+            page_obj = KeysetPage(qs, count=len(qs), count_kind="exact")
+        else:
+            # 5 records per page, walked by cursor on (name, id); only the listed columns
+            page_obj = keyset_paginate(
+                qs.only(*fields, 'age', 'occupation'),
+                ordering=('name', 'id'),
+                cursor=request.GET.get('cursor'),
+                per_page=5,
+                count='approximate',
+            )
 
         return render(
             request,
@@ -94,7 +102,9 @@ def patient_records(request):
             },
         )
     else:
-        patient = get_object_or_404(Patient, email=request.user.email)
+        patient = Patient.for_email(request.user.email)
+        if patient is None:
+            raise Http404("No patient record for this account.")
     return medical_history(request, pk=patient.id)
 
 def delete_patient(request, pk):
@@ -110,6 +120,9 @@ def update_patient(request):
     if request.method == "POST":
         pk = request.POST.get("id")
         patient = get_object_or_404(Patient, pk=pk)
+        if Patient.email_in_use(request.POST.get("email"), exclude_pk=patient.pk):
+            messages.error(request, "A patient with this email already exists.")
+            return redirect("patient:list")
         patient.name = request.POST.get("name")
         patient.email = request.POST.get("email")
         patient.address = request.POST.get("address")
@@ -125,6 +138,10 @@ def medical_history(request, pk):
 
 
     if request.method == "POST" and 'update_patient_info' in request.POST:
+        if Patient.email_in_use(request.POST.get("email"), exclude_pk=patient.pk):
+            messages.error(request, "A patient with this email already exists.")
+            return redirect("patient:medical_history", pk=pk)
+
         age = request.POST.get("age")
         if age:
             try:
@@ -149,112 +166,47 @@ def medical_history(request, pk):
         xray_files = request.FILES.getlist('xray_images')
         if xray_files:
             from .models import Xray
+            uploaded = []
             for xray_file in xray_files:
-                Xray.objects.create(
+                uploaded.append(Xray.objects.create(
                     patient=patient,
                     file=xray_file,
                     description=request.POST.get("xray_description", "")
-                )
-                messages.success(request, f"Patient information and {len(xray_files)} X-ray images updated successfully.")
-            else:
-                messages.success(request, "Patient information updated successfully.")
+                ))
+            # thumbnails / previews are built off the request (xray_images.py)
+            xray_images.queue(uploaded)
+            messages.success(request, f"Patient information and {len(xray_files)} X-ray images updated successfully.")
+        else:
+            messages.success(request, "Patient information updated successfully.")
         return redirect("patient:medical_history", pk=pk)
 
 
-    medical_history_qs = patient.medical_history.all()
-    financial_history_qs = patient.financial_history.all()
-
-    from appointment.models import Appointment
-    appointments = Appointment.objects.filter(
-        email=patient.email,
-        status__in=['done', 'completed']
-    ).order_by('-date')
-    
-    # Combine treatment history
-    treatment_history = []
-    
-    for record in medical_history_qs:
-        treatment_history.append({
-            'source': 'manual',
-            'id': record.id,
-            'date': record.date,
-            'dentist': record.dentist,
-            'services': record.services,
-            'amount': record.amount,
-            'findings': record.findings,
-            'prescriptions': record.prescriptions,
-        })
-    
-    for appt in appointments:
-        services_text = ", ".join([s.service_name for s in appt.services.all()])
-        total_amount = sum((s.price or 0) for s in appt.services.all())
-        
-        # Convert datetime to date if needed
-        appt_date = appt.date.date() if hasattr(appt.date, 'date') else appt.date
-        
-        treatment_history.append({
-            'source': 'appointment',
-            'id': appt.id,
-            'date': appt_date,  # ← Ensure it's a date object
-            'dentist': appt.dentist.name if appt.dentist else appt.dentist_name,
-            'services': services_text,
-            'amount': total_amount,
-            'findings': '',
-            'prescriptions': '',
-        })
-    
-    treatment_history.sort(key=lambda x: x['date'], reverse=True)
-        # ===== FETCH BILLING HISTORY =====
-    financial_history_qs = patient.financial_history.all()
-    
-    from billing.models import BillingRecord
-    billing_records = BillingRecord.objects.filter(patient=patient).order_by('-date_issued')
-    
-    # Combine billing history
-    billing_history = []
-    
-    # Add manual financial history
-    for record in financial_history_qs:
-        billing_history.append({
-            'source': 'manual',
-            'id': record.id,
-            'date': record.date,  # This is already a date object
-            'bill_type': record.bill_type,
-            'payment_mode': record.payment_mode,
-            'amount': record.amount,
-            'total_bill': record.total_bill,
-            'balance': record.balance,
-        })
-    
-    # Add billing records from appointments
-    for bill in billing_records:
-        # Convert datetime to date for consistent sorting
-        bill_date = bill.date_issued.date() if hasattr(bill.date_issued, 'date') else bill.date_issued
-        
-        billing_history.append({
-            'source': 'appointment',
-            'id': bill.id,
-            'date': bill_date,  # ← Now it's a date object
-            'bill_type': 'Services',
-            'payment_mode': 'N/A',
-            'amount': bill.amount,
-            'total_bill': bill.amount,
-            'balance': 0,
-        })
-    
-    billing_history.sort(key=lambda x: x['date'], reverse=True)
-
+    # The treatment and billing tabs load their rows from patient_timeline
+    # (JSON, a page at a time) when they're first opened.
     tooth_num = range(1, 33)
 
     return render(request, "patient/medical_history.html", {
         "patient": patient,
-        "treatment_history": treatment_history,
-        "billing_history": billing_history,
         "tooth_num": tooth_num,
-        "services": Service.objects.all(),
-        "dentists": Dentist.objects.all()
+        "chart": odontogram_chart.chart(patient),
+        # only what the add-record forms list
+        "services": Service.objects.only("id", "service_name", "price"),
+        "dentists": Dentist.objects.only("id", "name"),
     })
 
+
+def patient_timeline(request, pk, tab):
+    """
+    One page of the medical history page's treatment / billing tab:
+    {"entries": [...], "next_cursor": "..." or null}, newest first.
+    """
+    if tab not in timeline.TABS:
+        raise Http404("Unknown timeline.")
+    patient = get_object_or_404(Patient.objects.only("id"), pk=pk)
+    entries, next_cursor = timeline.timeline_page(patient, tab, request.GET.get("cursor"))
+    return JsonResponse({"entries": entries, "next_cursor": next_cursor})
+
+
 def add_medical_history(request, patient_id):
     patient = get_object_or_404(Patient, pk=patient_id)
     
@@ -376,41 +328,6 @@ def add_financial_history(request, patient_id):
     return redirect("patient:medical_history", pk=patient_id)
 
 
-TOOTH_NAMES = {
-  1: "Upper Right Third Molar (Wisdom Tooth)",
-  2: "Upper Right Second Molar",
-  3: "Upper Right First Molar",
-  4: "Upper Right Second Premolar",
-  5: "Upper Right First Premolar",
-  6: "Upper Right Canine (Cuspid)",
-  7: "Upper Right Lateral Incisor",
-  8: "Upper Right Central Incisor",
-  9: "Upper Left Central Incisor",
-  10: "Upper Left Lateral Incisor",
-  11: "Upper Left Canine (Cuspid)",
-  12: "Upper Left First Premolar",
-  13: "Upper Left Second Premolar",
-  14: "Upper Left First Molar",
-  15: "Upper Left Second Molar",
-  16: "Upper Left Third Molar (Wisdom Tooth)",
-
-  17: "Lower Left Third Molar (Wisdom Tooth)",
-  18: "Lower Left Second Molar",
-  19: "Lower Left First Molar",
-  20: "Lower Left Second Premolar",
-  21: "Lower Left First Premolar",
-  22: "Lower Left Canine (Cuspid)",
-  23: "Lower Left Lateral Incisor",
-  24: "Lower Left Central Incisor",
-  25: "Lower Right Central Incisor",
-  26: "Lower Right Lateral Incisor",
-  27: "Lower Right Canine (Cuspid)",
-  28: "Lower Right First Premolar",
-  29: "Lower Right Second Premolar",
-  30: "Lower Right First Molar",
-  31: "Lower Right Second Molar",
-  32: "Lower Right Third Molar (Wisdom Tooth)"
-}
 def odontogram(request, patient_id):
     patient = get_object_or_404(Patient, pk=patient_id)
     tooth_num = range(1, 33)
@@ -419,142 +336,85 @@ def odontogram(request, patient_id):
     services = Service.objects.all()
     dentists = Dentist.objects.all()
 
-    return render(request, "patient/medical_history.html", {"patient": patient, "tooth_num": tooth_num, "tooth_name": tooth_names, "services": services, "dentists": dentists})
+    return render(request, "patient/medical_history.html", {"patient": patient, "tooth_num": tooth_num, "tooth_name": tooth_names, "chart": odontogram_chart.chart(patient), "services": services, "dentists": dentists})
 
 def add_odontogram(request, patient_id):
-    
-    #idk why but shits not posting on my part!
-    print("=" * 50)
-    print("ADD_ODONTOGRAM VIEW CALLED")
-    print(f"Patient ID: {patient_id}")
-    print(f"Method: {request.method}")
-    print(f"POST data: {request.POST}")
-    print(f"Is AJAX: {request.headers.get('X-Requested-With') == 'XMLHttpRequest'}")
-    print("=" * 50)
-
+    """
+    Save an odontogram entry: the add-odontogram form, or a JSON body
+    (odontogram.rows_from_json) from AJAX clients. The whole entry is
+    validated first and written in one transaction (odontogram.write_rows).
+    """
     patient = get_object_or_404(Patient, pk=patient_id)
     if request.method == "POST":
-        index = 0
-        created_any= False
-
-        while True:
-            date_key = f"date_{index}"
-            if date_key not in request.POST:
-
-                break
-
-            date_val = request.POST.get(date_key)
-            status_val = request.POST.get(f"status_{index}")  
-            dentist_id = request.POST.get(f"dentist_{index}")
-            tooth_numbers = request.POST.getlist(f"tooth_number_{index}")
-            services_ids = request.POST.getlist(f"services_{index}")
-
-            if not date_val or not status_val or not dentist_id or not tooth_numbers:
-                index += 1
-                continue
-
-            dentist = dentist_id
-
-            print(f"ROW {index} TEETH:", tooth_numbers)
-
-            for tooth_number in tooth_numbers:
-                odontogram = Odontogram.objects.create(
-                    patient=patient,
-                    tooth_number=int(tooth_number),
-                    date=date_val,
-                    dentist=dentist,
-                    status=status_val,
-                )
-
-                if services_ids:
-                    odontogram.service.add(*services_ids)
-                
-                messages.success(request,f"Tooth {tooth_number} added successfully with services.")
-                created_any = True
-            index += 1
-        if not created_any:
-            messages.error(request, "No valid odontogram entries were provided.")
-        # Return JSON response for AJAX requests
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            if created_any:
-                return JsonResponse({"success": True, "message": "Odontogram saved successfully"})
+        is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+        try:
+            if request.content_type == "application/json":
+                rows = odontogram_chart.rows_from_json(json.loads(request.body))
             else:
-                return JsonResponse({"success": False, "error": "No valid odontogram entries were provided."}, status=400)
+                rows = odontogram_chart.rows_from_form(request.POST)
+            services = odontogram_chart.validate_rows(rows)
+        except ValueError as e:
+            # InvalidEntry explains itself; bad JSON / numbers get a generic message
+            error = str(e) if isinstance(e, odontogram_chart.InvalidEntry) else "Invalid odontogram entry."
+            if is_ajax:
+                return JsonResponse({"success": False, "error": error}, status=400)
+            messages.error(request, error)
+            return redirect("patient:odontogram", patient_id=patient_id)
+
+        entries = odontogram_chart.write_rows(patient, rows, services)
+        teeth = len({entry.tooth_number for entry in entries})
+        summary = f"Odontogram saved: {len(entries)} tooth record(s)."
+        # Return JSON response for AJAX requests
+        if is_ajax:
+            return JsonResponse({"success": True, "message": summary, "records": len(entries), "teeth": teeth})
+        messages.success(request, summary)
         return redirect("patient:odontogram", patient_id=patient_id)
     return render(request, "patient/medical_history.html", {"patient": patient})
-        # print("POST DATA:", request.POST)
-        # print("tooth_number getlist:", request.POST.get("tooth_number"))
-        # tooth_number=request.POST.getlist("tooth_number")
-        # services=request.POST.getlist("services")
-        # dentist=request.POST.get("dentist")
-        # print("TEETH:", tooth_number)
-
-        # for tooth_number in tooth_number:
-        #     odontogram = Odontogram.objects.create(
-        #         patient=patient,
-        #         tooth_number=int(tooth_number),
-        #         dentist=dentist,
-        #         status=request.POST.get("status"),
-        # )
-
-        #     if services:
-        #         odontogram.service.add(*services)
-        #     messages.success(request,f"Tooth {tooth_number} added successfully with services.")
-        # return redirect("patient:odontogram", patient_id=patient_id)
 
 
 def odontogram_history(request, patient_id, tooth_number):
-    patient = get_object_or_404(Patient, pk=patient_id)
-    records = Odontogram.objects.filter(patient=patient, tooth_number=tooth_number)
-    data = []
-    for record in records:
-        data.append({
-            "tooth_name": TOOTH_NAMES.get(record.tooth_number, "Unknown Tooth"),
-            "date": record.date.strftime("%Y-%m-%d"),
-            "services": [service.service_name for service in record.service.all()],
-            "dentist": record.dentist,
-            "status": record.status,
-        })
+    patient = get_object_or_404(Patient.objects.only("id"), pk=patient_id)
+    records = odontogram_chart.history_entries(patient, tooth_number)
+    data = [odontogram_chart.entry_data(record) for record in records]
     return JsonResponse({"data": data})
 
+
+def odontogram_histories(request, patient_id):
+    """Every tooth's history at once: {"teeth": {"<tooth number>": [records]}} (two queries)."""
+    patient = get_object_or_404(Patient.objects.only("id"), pk=patient_id)
+    return JsonResponse({"teeth": odontogram_chart.histories(patient)})
+
+
+def odontogram_state(request, patient_id):
+    """The current chart, one entry per tooth, from the ToothState snapshot (one query)."""
+    patient = get_object_or_404(Patient.objects.only("id"), pk=patient_id)
+    return JsonResponse({"teeth": odontogram_chart.chart(patient)})
+
 def update_odontogram(request, patient_id):
+    """
+    Record a new state for one tooth (POST tooth_number, status, dentist,
+    services). The history is append-only, so this adds an entry through
+    odontogram.write_rows like add_odontogram, which also moves the tooth's
+    ToothState.
+    """
     patient = get_object_or_404(Patient, pk=patient_id)
-    if request.method == "POST":
-        tooth_number = request.POST.get("tooth_number")
-        date = request.POST.get("date")
-        condition = request.POST.get("condition")
-        treatment = request.POST.get("treatment")
-        dentist = request.POST.get("dentist")
-        status = request.POST.get("status")
-        notes = request.POST.get("notes")
-
-        odontogram, _ = Odontogram.objects.get_or_create(
-            patient=patient,
-            tooth_number=tooth_number,
-            defaults={
-                "date": date,
-                "condition": condition,
-                "treatment": treatment,
-                "dentist": dentist,
-                "status": status,
-                "notes": notes,
-            }
+    if request.method != "POST":
+        return JsonResponse({"success": False, "error": "Invalid request method."}, status=400)
+
+    try:
+        row = odontogram_chart.ChartRow(
+            [int(request.POST.get("tooth_number", ""))],
+            request.POST.get("status"),
+            request.POST.get("dentist"),
+            [int(s) for s in request.POST.getlist("services")],
         )
+        services = odontogram_chart.validate_rows([row])
+    except ValueError as e:
+        error = str(e) if isinstance(e, odontogram_chart.InvalidEntry) else "Invalid odontogram entry."
+        return JsonResponse({"success": False, "error": error}, status=400)
 
-        return JsonResponse({
-            "success" : True,
-            "data": {
-                "tooth_name": tooth_number,
-                "date": odontogram.date,
-                "condition": odontogram.condition,
-                "treatment": odontogram.treatment,
-                "dentist": odontogram.dentist,
-                "status": odontogram.status,
-                "notes": odontogram.notes,
-            }
-        })
-
-    return JsonResponse({"success": False, "error": "Invalid request method."}, status=400)
+    entry, = odontogram_chart.write_rows(patient, [row], services)
+    return JsonResponse({"success": True, "data": odontogram_chart.entry_data(entry)})
 
 def delete_xray(request, xray_id):
     """Delete an X-ray image"""
@@ -564,9 +424,8 @@ def delete_xray(request, xray_id):
             xray = Xray.objects.get(id=xray_id)
             patient_id = xray.patient.id
             
-            # Delete the file from disk
-            if xray.file:
-                xray.file.delete()
+            # Delete the file and its thumbnail / preview from disk
+            xray_images.delete_files(xray)
             
             # Delete the database record
             xray.delete()
@@ -0,0 +1,182 @@
+"""
+X-ray derivatives: what the patient chart shows instead of the originals.
+
+Every uploaded Xray.file gets two JPEGs, with all metadata (EXIF, ICC,
+comments) left behind:
+
+- thumbnail: fits THUMBNAIL_SIZE, for the chart's grid (lazy-loaded);
+- preview: fits PREVIEW_SIZE, opened from the thumbnail.
+
+The original is only fetched when someone follows its "Original" link.
+
+New uploads are queued after the upload commits (queue()), and
+settings.XRAY_DERIVATIVES_DISPATCHER picks how they're built (dotted path):
+
+- ThreadDispatcher: a background thread right after the commit.
+- CommandDispatcher: nothing on commit; `manage.py build_xray_derivatives`
+  (cron) builds everything still pending.
+
+build_xray_derivatives also works through the existing backlog in
+parallel: render_stored() only touches storage and Pillow, so it runs in a
+process pool while the parent process saves the files and rows.
+"""
+import logging
+import os
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 320)
+PREVIEW_SIZE = (1600, 1600)
+THUMBNAIL_QUALITY = 75
+PREVIEW_QUALITY = 85
+
+# what Pillow raises for files it can't (or won't) turn into derivatives
+RENDER_ERRORS = (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError, SyntaxError)
+
+
+class ThreadDispatcher:
+    def dispatch(self, xray_ids):
+        thread = threading.Thread(target=self.run, args=(xray_ids,), daemon=True)
+        thread.start()
+
+    def run(self, xray_ids):
+        try:
+            build_many(xray_ids)
+        except Exception:
+            # build_xray_derivatives picks up anything left pending
+            logger.exception("Building X-ray derivatives failed for %s", xray_ids)
+        finally:
+            connection.close()
+
+
+class CommandDispatcher:
+    def dispatch(self, xray_ids):
+        # built by `manage.py build_xray_derivatives`
+        pass
+
+
+_dispatcher = None
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        path = getattr(settings, "XRAY_DERIVATIVES_DISPATCHER", "patient.xray_images.ThreadDispatcher")
+        _dispatcher = import_string(path)()
+    return _dispatcher
+
+
+def queue(xrays):
+    """Build the derivatives of freshly uploaded `xrays` once the upload commits."""
+    ids = [xray.pk for xray in xrays]
+    if ids:
+        transaction.on_commit(lambda: get_dispatcher().dispatch(ids))
+
+
+def _flatten(image):
+    """An 8-bit L (grayscale radiographs) or RGB image JPEG can hold."""
+    if image.mode in ("I;16", "I;16B", "I;16L", "I"):
+        # 16-bit radiographs: scale down to 8 bits rather than clipping
+        return image.point(lambda value: value / 256).convert("L")
+    if image.mode in ("L", "RGB"):
+        return image
+    if image.mode in ("RGBA", "LA", "P", "PA"):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, "white")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _jpeg(image, quality):
+    buffer = BytesIO()
+    # no exif= / icc_profile= passed: the derivative carries no metadata
+    image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def render(source):
+    """(thumbnail bytes, preview bytes) for an image file object. Raises RENDER_ERRORS."""
+    with Image.open(source) as image:
+        # JPEG originals decode straight at a reduced scale
+        image.draft(image.mode, PREVIEW_SIZE)
+        image = ImageOps.exif_transpose(image)
+        image = _flatten(image)
+        preview = image.copy()
+    preview.thumbnail(PREVIEW_SIZE, Image.Resampling.LANCZOS)
+    thumbnail = preview.copy()
+    thumbnail.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+    return _jpeg(thumbnail, THUMBNAIL_QUALITY), _jpeg(preview, PREVIEW_QUALITY)
+
+
+def _storage():
+    from .models import Xray
+
+    return Xray._meta.get_field("file").storage
+
+
+def render_stored(name):
+    """
+    render() for a stored original, by storage name. Safe to run in a worker
+    process: no database access. Returns (name, thumbnail, preview), or
+    (name, None, None) when the file isn't a usable image.
+    """
+    try:
+        with _storage().open(name, "rb") as source:
+            thumbnail, preview = render(source)
+        return name, thumbnail, preview
+    except RENDER_ERRORS as e:
+        logger.warning("Cannot build X-ray derivatives of %s: %s", name, e)
+        return name, None, None
+
+
+def save_derivatives(xray, thumbnail, preview):
+    """Store rendered derivatives (or mark the X-ray failed when they're None)."""
+    from .models import Xray
+
+    if thumbnail is None:
+        Xray.objects.filter(pk=xray.pk).update(derivatives_status="failed")
+        xray.derivatives_status = "failed"
+        return
+
+    # a rebuild replaces the old files
+    for field in (xray.thumbnail, xray.preview):
+        if field:
+            field.delete(save=False)
+    base = os.path.splitext(os.path.basename(xray.file.name))[0]
+    xray.thumbnail.save(f"{base}.jpg", ContentFile(thumbnail), save=False)
+    xray.preview.save(f"{base}.jpg", ContentFile(preview), save=False)
+    xray.derivatives_status = "ready"
+    # only these columns: the description may have been edited meanwhile
+    Xray.objects.filter(pk=xray.pk).update(
+        thumbnail=xray.thumbnail.name,
+        preview=xray.preview.name,
+        derivatives_status="ready",
+    )
+
+
+def build(xray):
+    save_derivatives(xray, *render_stored(xray.file.name)[1:])
+
+
+def build_many(xray_ids):
+    """Build the derivatives of these X-rays, in this process."""
+    from .models import Xray
+
+    for xray in Xray.objects.filter(pk__in=xray_ids).only("id", "file", "thumbnail", "preview"):
+        build(xray)
+
+
+def delete_files(xray):
+    """Remove the original and its derivatives from storage."""
+    for field in (xray.file, xray.thumbnail, xray.preview):
+        if field:
+            field.delete(save=False)
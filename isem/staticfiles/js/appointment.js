@@ -103,9 +103,8 @@ confirmYes?.addEventListener("click", () => {
         }
       }
 
-      // 2) Refetch from the server so everything stays in sync
-      if (window.timelineCalendar) window.timelineCalendar.refetchEvents();
-      if (window.mainCalendar) window.mainCalendar.refetchEvents();
+      // 2) Pull what changed from the server so everything stays in sync
+      if (typeof window.syncCalendarChanges === "function") window.syncCalendarChanges();
 
       // 3) Rebuild today's side list after refetch
       setTimeout(() => {
@@ -441,6 +440,7 @@ confirmYes?.addEventListener("click", () => {
                 // If API fails, you can show an error and close overlay
                 confirmDateEl.textContent = "N/A";
                 confirmTimeEl.textContent = "No available slot";
+                suggestNextSlot(formData, confirmTimeEl);
               } else {
                 // Use the actual scheduled slot from the server
                 const dateVal = data.date;               // "YYYY-MM-DD"
@@ -462,6 +462,9 @@ confirmYes?.addEventListener("click", () => {
 
                   confirmTimeEl.textContent =
                     `${format12(start)} – ${format12(end)}`;
+                  if (data.dentist) {
+                    confirmTimeEl.textContent += ` with ${data.dentist}`;
+                  }
                 } else {
                   confirmTimeEl.textContent = "N/A";
                 }
@@ -591,6 +594,8 @@ function buildBlockedMinuteMap(booked) {
 // ===== Fetch Booked Times =====
 async function fetchBookedTimes(dentistId, date, location) {
   if (!dentistId || !date || !location) return [];
+  // "any" dentist: nothing to grey out, the server picks whoever is free
+  if (dentistId === "any") return [];
   try {
     const res = await fetch(`/dashboard/appointment/get-booked-times/?dentist=${dentistId}&date=${date}&location=${location}`);
     const data = await res.json();
@@ -601,6 +606,28 @@ async function fetchBookedTimes(dentistId, date, location) {
   }
 }
 
+// ===== Next open slots on later days (when the picked date is full) =====
+async function suggestNextSlot(formData, targetEl) {
+  const params = new URLSearchParams();
+  ["dentist", "location", "date", "time"].forEach(key => {
+    if (formData.get(key)) params.set(key, formData.get(key));
+  });
+  formData.getAll("services").forEach(id => params.append("services", id));
+  params.set("limit", "1");
+
+  try {
+    const res = await fetch(`/dashboard/appointment/next-slots/?${params}`);
+    const data = await res.json();
+    const slot = (data.slots || [])[0];
+    if (slot) {
+      targetEl.textContent =
+        `No available slot – next opening: ${slot.date} ${slot.start_time} with ${slot.dentist}`;
+    }
+  } catch (err) {
+    console.error("Error fetching next open slots:", err);
+  }
+}
+
 // ===== 24-hour converter =====
 function to24Hour(hour, ampm) {
   hour = parseInt(hour);
@@ -1072,8 +1099,7 @@ function initRescheduleForm() {
 
             closeAppointmentModal("reschedule-modal");
 
-            if (window.timelineCalendar) window.timelineCalendar.refetchEvents();
-            if (window.mainCalendar) window.mainCalendar.refetchEvents();
+            if (typeof window.syncCalendarChanges === "function") window.syncCalendarChanges();
             setTimeout(() => {
               if (typeof window.renderTodaysAppointments === "function") {
                 window.renderTodaysAppointments();
@@ -1571,6 +1597,26 @@ if (step1ServicesContainer && doneAmountInput) {
 }
 
 
+// Odontogram form rows (date_N, tooth_number_N, services_N, dentist_N, status_N)
+// as the batch add_odontogram takes; incomplete rows are left out
+function odontogramRows(form) {
+  const formData = new FormData(form);
+  const rows = [];
+  for (let i = 0; formData.has(`date_${i}`); i++) {
+    const teeth = formData.getAll(`tooth_number_${i}`).map(Number);
+    const status = formData.get(`status_${i}`);
+    const dentist = formData.get(`dentist_${i}`);
+    if (!formData.get(`date_${i}`) || !status || !dentist || !teeth.length) continue;
+    rows.push({
+      teeth,
+      status,
+      dentist,
+      services: formData.getAll(`services_${i}`).map(Number),
+    });
+  }
+  return rows;
+}
+
 // Odontogram final step submit (attach only once)
 const doneOdontoForm = document.getElementById("done-odontogram-form");
 if (doneOdontoForm && !doneOdontogramHandlerAttached) {
@@ -1583,14 +1629,15 @@ if (doneOdontoForm && !doneOdontogramHandlerAttached) {
       return;
     }
 
-    const formData = new FormData(this);
     fetch(this.action, {
       method: "POST",
       headers: {
+        "Content-Type": "application/json",
         "X-CSRFToken": getCookie("csrftoken"),
         "X-Requested-With": "XMLHttpRequest",
       },
-      body: formData,
+      // the whole entry as one batch; the server validates and saves it at once
+      body: JSON.stringify({ rows: odontogramRows(this) }),
     })
     .then(res => res.json())
     .then(data => {
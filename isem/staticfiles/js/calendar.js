@@ -4,6 +4,8 @@ let currentEventId = null;
 window.currentEventId = null;
 let mainCalendar = null;
 let timelineCalendar = null;
+// last change cursor seen from the events feed (X-Calendar-Cursor)
+let calendarCursor = null;
 
 document.addEventListener('DOMContentLoaded', function () {
   const mainCalendarEl = document.getElementById('calendar');
@@ -40,6 +42,7 @@ document.addEventListener('DOMContentLoaded', function () {
   branchFilterEl.addEventListener("change", function () {
     if (mainCalendar) mainCalendar.refetchEvents();
     if (timelineCalendar) timelineCalendar.refetchEvents();
+    openLiveUpdates();
 
     setTimeout(() => {
       if (typeof window.renderTodaysAppointments === "function") {
@@ -54,20 +57,90 @@ document.addEventListener('DOMContentLoaded', function () {
 
   function fetchEvents(info, successCallback, failureCallback) {
     const branch = branchFilterEl.value;
-    let url = eventsUrl;
-    if (branch) url += `?branch=${branch}`;
-
-    console.log("FETCHING:", url);
+    // only ask for the visible range
+    const params = new URLSearchParams({ start: info.startStr, end: info.endStr });
+    if (branch) params.set("branch", branch);
+    const url = `${eventsUrl}?${params.toString()}`;
 
     fetch(url)
-      .then(res => res.json())
+      .then(res => {
+        const cursor = res.headers.get("X-Calendar-Cursor");
+        if (cursor !== null) {
+          calendarCursor = calendarCursor === null
+            ? Number(cursor)
+            : Math.min(calendarCursor, Number(cursor));
+        }
+        return res.json();
+      })
       .then(events => {
-        console.log("RECEIVED EVENTS:", events);
         successCallback(events)
       })
       .catch(err => failureCallback(err));
   }
 
+  // Patch both calendars in place with {cursor, events, removed}
+  function applyCalendarDelta(delta) {
+    [mainCalendar, timelineCalendar].forEach(cal => {
+      if (!cal) return;
+      const source = cal.getEventSources()[0];
+
+      delta.removed.forEach(id => {
+        const ev = cal.getEventById(id);
+        if (ev) ev.remove();
+      });
+      delta.events.forEach(data => {
+        const ev = cal.getEventById(data.id);
+        if (ev) ev.remove();
+        cal.addEvent(data, source);
+      });
+    });
+    calendarCursor = delta.cursor;
+  }
+
+  // Live updates pushed by the server (SSE). The server answers 204 when it
+  // can't stream, which closes the EventSource for good.
+  let liveSource = null;
+  function openLiveUpdates() {
+    if (!window.EventSource) return;
+    if (liveSource) liveSource.close();
+
+    const params = new URLSearchParams();
+    if (calendarCursor !== null) params.set("since", calendarCursor);
+    const branch = branchFilterEl.value;
+    if (branch) params.set("branch", branch);
+
+    liveSource = new EventSource(`/dashboard/appointment/live/?${params.toString()}`);
+    liveSource.addEventListener("schedule", e => {
+      applyCalendarDelta(JSON.parse(e.data));
+      if (typeof window.renderTodaysAppointments === "function") {
+        window.renderTodaysAppointments();
+      }
+    });
+  }
+
+  // Apply only what changed since the last fetch to both calendars,
+  // instead of re-downloading every event twice.
+  function syncCalendarChanges() {
+    if (calendarCursor === null) {
+      if (mainCalendar) mainCalendar.refetchEvents();
+      if (timelineCalendar) timelineCalendar.refetchEvents();
+      return Promise.resolve();
+    }
+
+    const params = new URLSearchParams({ since: calendarCursor });
+    const branch = branchFilterEl.value;
+    if (branch) params.set("branch", branch);
+
+    return fetch(`${eventsUrl}?${params.toString()}`)
+      .then(res => res.json())
+      .then(applyCalendarDelta)
+      .catch(() => {
+        if (mainCalendar) mainCalendar.refetchEvents();
+        if (timelineCalendar) timelineCalendar.refetchEvents();
+      });
+  }
+  window.syncCalendarChanges = syncCalendarChanges;
+
   // Colormaps for Status
   const colorMap = {
     not_arrived: "#9CA3AF",  
@@ -116,8 +189,7 @@ document.addEventListener('DOMContentLoaded', function () {
         .then(res => res.json())
         .then(data => {
           if (data.success) {
-            if (timelineCalendar) timelineCalendar.refetchEvents();
-            if (mainCalendar) mainCalendar.refetchEvents();
+            syncCalendarChanges();
 
             setTimeout(() => {
               if (typeof window.renderTodaysAppointments === "function") {
@@ -478,7 +550,7 @@ document.addEventListener('DOMContentLoaded', function () {
             const rEmail    = document.getElementById("resched-email");
 
             if (rDentist)  rDentist.value  = propsInner.dentist_id || "";
-            if (rLocation) rLocation.value = propsInner.location || "";
+            if (rLocation) rLocation.value = propsInner.branch_id || "";
             if (rDate)     rDate.value     = propsInner.preferred_date || propsInner.date || "";
             if (rEmail)    rEmail.value    = propsInner.email || "";
 
@@ -592,6 +664,8 @@ document.addEventListener('DOMContentLoaded', function () {
     window.mainCalendar = mainCalendar;
     window.timelineCalendar = timelineCalendar;
 
+    openLiveUpdates();
+
     // --- Extra timeline controls (Day/Week/Today) ---
     function makeBtn(label, onClick) {
       const btn = document.createElement("button");
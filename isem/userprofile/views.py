@@ -110,6 +110,12 @@ def signup(request):
         if User.objects.filter(email=email).exists():
             messages.error(request, "Email already exists.")
             return redirect("userprofile:signup")
+
+        # a guest record made when they booked becomes their patient record
+        existing_patient = Patient.for_email(email)
+        if existing_patient is not None and existing_patient.user_id is not None:
+            messages.error(request, "Email already exists.")
+            return redirect("userprofile:signup")
         
         #user creation role based
         if role == "patient":
@@ -121,23 +127,28 @@ def signup(request):
             patient_group, created = Group.objects.get_or_create(name='Patient')
             user.groups.add(patient_group)
             print("DEBUG: Creating Patient object")
-            Patient.objects.create(
-                user=user,
-                name=f"{first_name} {last_name}",
-                email=email,
-                address="",
-                telephone="",
-                age=0,
-                occupation="",
-                is_guest=False,
-
-                gender="",
-                particular_condition="",
-                allergy="",
-                pregnancy_status="",
-                medications="",
-                abnormal_bleeding_history=""
-            )
+            if existing_patient is not None:
+                existing_patient.user = user
+                existing_patient.is_guest = False
+                existing_patient.save(update_fields=["user", "is_guest"])
+            else:
+                Patient.objects.create(
+                    user=user,
+                    name=f"{first_name} {last_name}",
+                    email=email,
+                    address="",
+                    telephone="",
+                    age=0,
+                    occupation="",
+                    is_guest=False,
+
+                    gender="",
+                    particular_condition="",
+                    allergy="",
+                    pregnancy_status="",
+                    medications="",
+                    abnormal_bleeding_history=""
+                )
             print("DEBUG: Logging in user")
             login(request, user)
             print("DEBUG: About to redirect")
@@ -383,6 +394,12 @@ def add_user(request):
         if User.objects.filter(email=email).exists():
             messages.error(request, "Email already exists.")
             return redirect("userprofile:admin_dashboard")
+
+        # a guest record made when they booked becomes their patient record
+        existing_patient = Patient.for_email(email)
+        if existing_patient is not None and existing_patient.user_id is not None:
+            messages.error(request, "Email already exists.")
+            return redirect("userprofile:admin_dashboard")
         
         # Create patient user
         user = User.objects.create_user(
@@ -397,22 +414,27 @@ def add_user(request):
         user.groups.add(patient_group)
         
         # Create patient record
-        Patient.objects.create(
-            user=user,
-            name=f"{first_name} {last_name}",
-            email=email,
-            address="",
-            telephone="",
-            age=0,
-            occupation="",
-            is_guest=False,
-            gender="",
-            particular_condition="",
-            allergy="",
-            pregnancy_status="",
-            medications="",
-            abnormal_bleeding_history=""
-        )
+        if existing_patient is not None:
+            existing_patient.user = user
+            existing_patient.is_guest = False
+            existing_patient.save(update_fields=["user", "is_guest"])
+        else:
+            Patient.objects.create(
+                user=user,
+                name=f"{first_name} {last_name}",
+                email=email,
+                address="",
+                telephone="",
+                age=0,
+                occupation="",
+                is_guest=False,
+                gender="",
+                particular_condition="",
+                allergy="",
+                pregnancy_status="",
+                medications="",
+                abnormal_bleeding_history=""
+            )
         
         messages.success(request, f"Patient user {username} added successfully!")
         return redirect("userprofile:admin_dashboard")
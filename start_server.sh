@@ -4,4 +4,15 @@ set -e
 cd /opt/render/project/src
 export PYTHONPATH=/opt/render/project/src:$PYTHONPATH
 
-exec gunicorn isem.wsgi:application --bind 0.0.0.0:$PORT --workers 1
+# Bookings are safe across workers (ScheduleLock rows + the overlap guard), but
+# the schedule cache and the anonymous rate limits live in each process unless
+# SCHEDULE_CACHE_BACKEND points at a shared cache: raise WEB_CONCURRENCY with it.
+WORKERS="${WEB_CONCURRENCY:-1}"
+
+# SERVER_INTERFACE=asgi serves the calendar's live updates (appointment/live.py);
+# with more than one worker they need PostgreSQL (LISTEN/NOTIFY).
+if [ "${SERVER_INTERFACE:-wsgi}" = "asgi" ]; then
+    exec uvicorn isem.asgi:application --host 0.0.0.0 --port "$PORT" --workers "$WORKERS" --proxy-headers --forwarded-allow-ips "*"
+fi
+
+exec gunicorn isem.wsgi:application --bind 0.0.0.0:$PORT --workers "$WORKERS"